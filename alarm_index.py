@@ -0,0 +1,117 @@
+import threading
+import time
+
+# The put_metric_alarm arguments compared to find out if an existing alarm has to be updated
+COMPARED = ['AlarmDescription', 'ActionsEnabled', 'AlarmActions', 'MetricName', 'Namespace', 'Statistic', 'Period',
+            'EvaluationPeriods', 'Threshold', 'ComparisonOperator', 'TreatMissingData', 'DatapointsToAlarm',
+            'Dimensions']
+# describe_alarms accepts up to 100 alarm names per call
+MAX_NAMES = 100
+
+# What applying an alarm does
+CREATE = "create"
+UPDATE = "update"
+UNCHANGED = "unchanged"
+
+
+# The existing metric alarms of the account, by name and by metric (namespace, metric name and dimensions).
+# The whole account is described (every page of describe_alarms) when the index is older than ttl seconds,
+# and the alarms of a request are described again by name right before they are applied
+class AlarmIndex:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # alarm name: alarm (as returned by describe_alarms)
+        self.by_name = {}
+        # (namespace, metric name, dimensions): alarm names
+        self.by_metric = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+
+    # Load the index if it is missing or older than ttl, concurrent callers share one load
+    def current(self, cloudwatch):
+        with self.load_lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl:
+                alarms = []
+                for page in cloudwatch.get_paginator('describe_alarms').paginate(AlarmTypes=['MetricAlarm']):
+                    alarms.extend(page['MetricAlarms'])
+                with self.lock:
+                    self.by_name = {}
+                    self.by_metric = {}
+                    for alarm in alarms:
+                        self._add(alarm)
+                    self.loaded_at = time.monotonic()
+        return self
+
+    # Describe the alarms of names again, the alarms that don't exist anymore are dropped from the index
+    def refresh(self, cloudwatch, names):
+        names = list(names)
+        found = {}
+        paginator = cloudwatch.get_paginator('describe_alarms')
+        for first in range(0, len(names), MAX_NAMES):
+            for page in paginator.paginate(AlarmNames=names[first:first + MAX_NAMES], AlarmTypes=['MetricAlarm']):
+                for alarm in page['MetricAlarms']:
+                    found[alarm['AlarmName']] = alarm
+        with self.lock:
+            for name in names:
+                self._remove(name)
+                if name in found:
+                    self._add(found[name])
+
+    # Keep an alarm that was just put (put_metric_alarm kwargs) in the index
+    def record(self, alarm):
+        with self.lock:
+            self._remove(alarm['AlarmName'])
+            self._add(alarm)
+
+    def get(self, name):
+        with self.lock:
+            return self.by_name.get(name)
+
+    # The names of the alarms on a metric
+    def on_metric(self, namespace, metric_name, dimensions):
+        with self.lock:
+            return list(self.by_metric.get(_metric_key(namespace, metric_name, dimensions), []))
+
+    # What applying an alarm (put_metric_alarm kwargs) would do: (CREATE, []), (UPDATE, changed arguments)
+    # or (UNCHANGED, [])
+    def diff(self, alarm):
+        existing = self.get(alarm['AlarmName'])
+        if existing is None:
+            return CREATE, []
+        changed = [name for name in COMPARED
+                   if _normalized(name, alarm.get(name)) != _normalized(name, existing.get(name))]
+        return (UPDATE, changed) if changed else (UNCHANGED, [])
+
+    # Must be called with self.lock held
+    def _add(self, alarm):
+        self.by_name[alarm['AlarmName']] = alarm
+        key = _metric_key(alarm.get('Namespace'), alarm.get('MetricName'), alarm.get('Dimensions', []))
+        self.by_metric.setdefault(key, []).append(alarm['AlarmName'])
+
+    # Must be called with self.lock held
+    def _remove(self, name):
+        alarm = self.by_name.pop(name, None)
+        if alarm is None:
+            return
+        key = _metric_key(alarm.get('Namespace'), alarm.get('MetricName'), alarm.get('Dimensions', []))
+        names = self.by_metric.get(key, [])
+        if name in names:
+            names.remove(name)
+        if not names:
+            self.by_metric.pop(key, None)
+
+
+def _metric_key(namespace, metric_name, dimensions):
+    return namespace, metric_name, tuple(sorted((dimension['Name'], dimension['Value']) for dimension in dimensions))
+
+
+# An argument in the same form in the put_metric_alarm kwargs and in describe_alarms
+def _normalized(name, value):
+    if name == 'Dimensions':
+        return sorted((dimension['Name'], dimension['Value']) for dimension in value or [])
+    if name == 'AlarmActions':
+        return sorted(value or [])
+    if name == 'Threshold' and value is not None:
+        return float(value)
+    return value
@@ -0,0 +1,67 @@
+import random
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# The error codes CloudWatch returns when the requests rate is too high
+THROTTLING_CODES = {'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'}
+
+
+# Creates/updates CloudWatch alarms in parallel, with at most max_workers put_metric_alarm calls in flight
+# for the whole process. A throttled call is retried up to max_retries times, waiting a random time
+# between 0 and base_delay * 2^attempt (capped by max_delay) between the attempts
+class AlarmWriter:
+    def __init__(self, max_workers, max_retries, base_delay, max_delay):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="alarm")
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    # Put all the alarms, (CloudWatch client of the alarm region, kwargs of put_metric_alarm) pairs, and return
+    # a list of (alarm name, error message or None), in the same order as the alarms.
+    # progress(done, failed) is called from the calling thread each time an alarm is done
+    def put_alarms(self, calls, progress=None):
+        alarms = [alarm for _, alarm in calls]
+        futures = [self.executor.submit(self._put_alarm, cloudwatch, alarm) for cloudwatch, alarm in calls]
+        if progress is not None:
+            done = failed = 0
+            for future in as_completed(futures):
+                done += 1
+                if future.exception() is not None:
+                    failed += 1
+                progress(done, failed)
+        results = []
+        for alarm, future in zip(alarms, futures):
+            try:
+                future.result()
+                results.append((alarm['AlarmName'], None))
+            except Exception as e:
+                results.append((alarm['AlarmName'], str(e)))
+        return results
+
+    def _put_alarm(self, cloudwatch, alarm):
+        # botocore is loaded by the clients, not at startup
+        from botocore.exceptions import ClientError
+        for attempt in range(self.max_retries + 1):
+            try:
+                return cloudwatch.put_metric_alarm(**alarm)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_CODES or attempt == self.max_retries:
+                    raise
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+
+# The text of the message that tells which alarms were created and which failed.
+# Above max_lines alarms only the failed ones are listed, up to max_lines of them
+def results_summary(results, max_lines=50):
+    created = [name for name, error in results if error is None]
+    lines = [f"*{len(created)}/{len(results)} alarms created/updated*"]
+    listed = results if len(results) <= max_lines else [result for result in results if result[1] is not None]
+    for name, error in listed[:max_lines]:
+        if error is None:
+            lines.append(f":white_check_mark: `{name}`")
+        else:
+            lines.append(f":x: `{name}`: {error}")
+    if len(listed) > max_lines:
+        lines.append(f"and {len(listed) - max_lines} more failed alarms")
+    return "\n".join(lines)
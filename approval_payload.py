@@ -0,0 +1,68 @@
+import json
+
+from variables import alert_vairables
+
+# The version of the encoding, bump it when the layout below changes
+VERSION = 2
+# The first item of a payload that only points to a request kept in the flow store
+REFERENCE = 0
+# Slack limits the value of a button to 2000 characters (and the private_metadata of a view to 3000)
+MAX_VALUE_LENGTH = 2000
+
+# The alert parameters are encoded by position, in the order of the alert variables
+PARAMETERS = list(alert_vairables)
+
+
+# Encode an approval request (see send_to_aprroval in main.py) into a compact JSON array:
+# [version, flow id, requester id, requester name, resource type, [[resource name, resource id/arn], ...],
+#  [[metric, parameter values in PARAMETERS order], ...]]
+# Returns None when the encoded request doesn't fit in a button value
+def encode_request(request):
+    value = json.dumps([
+        VERSION,
+        request["flow_id"],
+        request["requester_id"],
+        request["requester_name"],
+        request["resource_type"],
+        request["resources"],
+        [[metric] + [parameters.get(parameter) for parameter in PARAMETERS]
+         for metric, parameters in request["alerts"].items()]
+    ], separators=(",", ":"), ensure_ascii=False)
+    if len(value) > MAX_VALUE_LENGTH:
+        return None
+    return value
+
+
+# Encode a pointer to a request that was too big for a button value and is kept in the flow store
+def encode_reference(flow_id):
+    return json.dumps([REFERENCE, flow_id], separators=(",", ":"))
+
+
+# Decode a value made by encode_request or encode_reference,
+# load_reference(flow id) returns the request of a reference
+def decode_request(value, load_reference):
+    data = json.loads(value)
+    if data[0] == REFERENCE:
+        request = load_reference(data[1])
+        if not request:
+            raise ValueError(f"The approval request of flow {data[1]} expired")
+        return request
+    if data[0] != VERSION:
+        raise ValueError(f"Unsupported approval payload version {data[0]}")
+    _, flow_id, requester_id, requester_name, resource_type, resources, alerts = data
+    return {
+        "flow_id": flow_id,
+        "requester_id": requester_id,
+        "requester_name": requester_name,
+        "resource_type": resource_type,
+        "resources": resources,
+        "alerts": {alert[0]: dict(zip(PARAMETERS, alert[1:])) for alert in alerts}
+    }
+
+
+# A short description of the resources of a request for the messages, the name of a single resource
+def resources_label(request):
+    resources = request["resources"]
+    if len(resources) == 1:
+        return resources[0][0]
+    return f"{len(resources)} {request['resource_type']} resources"
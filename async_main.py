@@ -0,0 +1,93 @@
+# imported first, the startup time is measured from the first import
+import startup  # noqa: F401
+import asyncio
+import os
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from slack_sdk.socket_mode.aiohttp import SocketModeClient
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_sdk.web.async_client import AsyncWebClient
+
+import main
+
+
+# Gives the handlers in main.py the same blocking interface as WebClient, but every call is sent
+# by the AsyncWebClient on the event loop, so all the Slack HTTP traffic shares one aiohttp session
+class LoopWebClient:
+    def __init__(self, async_web_client: AsyncWebClient, loop: asyncio.AbstractEventLoop):
+        self.async_web_client = async_web_client
+        self.loop = loop
+
+    def __getattr__(self, method):
+        api_call = getattr(self.async_web_client, method)
+
+        def call(*args, **kwargs):
+            # waiting on the loop from the loop itself would never return
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if running_loop is self.loop:
+                raise RuntimeError(f"{method} must be awaited on the AsyncWebClient inside the event loop")
+            return asyncio.run_coroutine_threadsafe(api_call(*args, **kwargs), self.loop).result()
+
+        return call
+
+
+# The handlers do blocking boto3 calls, so they run on this executor and never block the event loop.
+# The threads only wait on AWS and on the loop, so the pool can be much bigger than the sync worker pool
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASYNC_EXECUTOR_SIZE", 64)),
+    thread_name_prefix="handler"
+)
+
+
+async def run_handler(handler, *args):
+    try:
+        await asyncio.get_running_loop().run_in_executor(executor, main.timed_handler, handler, time.perf_counter(),
+                                                         *args)
+    except Exception:
+        traceback.print_exc()
+
+
+# Run a blocking function (the handlers answering in the ack) on the executor
+async def run_blocking(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+
+# The only listener, the router of main.py acks every request once and then runs its handler
+async def request_listener(client: SocketModeClient, req: SocketModeRequest):
+    if main.recorder:
+        main.record_listener(client, req)
+    await main.router.handle_async(client, req, run_blocking, run_handler)
+
+
+async def start():
+    main.serve_metrics()
+    async_web_client = AsyncWebClient(token=os.environ["SLACK_BOT_TOKEN"], base_url=main.SLACK_API_URL)
+    # the outbound queue of the handlers in main.py sends through the async client from now on
+    main.web_client.web_client = LoopWebClient(async_web_client, asyncio.get_running_loop())
+    main.web_client.start()
+    # the work handed off by the wizard pages (posting the approval request...) runs on the worker pool
+    main.worker_pool.start()
+    main.error_sink.start()
+
+    client = SocketModeClient(
+        app_token=os.environ["SLACK_APP_TOKEN"],
+        web_client=async_web_client
+    )
+    client.socket_mode_request_listeners.append(request_listener)
+    main.startup_timer.mark("start")
+    # Establish a WebSocket connection to the Socket Mode servers first, the AWS clients and the journal replay
+    # are warmed up on the executor afterwards, without blocking the loop
+    await client.connect()
+    main.startup_timer.connected()
+    asyncio.get_running_loop().run_in_executor(executor, main.warm_up)
+    # Keep the program running
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(start())
@@ -0,0 +1,145 @@
+import threading
+
+
+# A region the resources are listed from and the alarms created in, with the default credentials or with the
+# credentials of an assumed role of another account. key is the region, or account/region with a role.
+# topic_arn is the SNS topic the alarms of the target notify, None for the default topic (it isn't part of the identity)
+class Target:
+    def __init__(self, region, role_arn=None, topic_arn=None):
+        self.region = region
+        self.role_arn = role_arn
+        self.topic_arn = topic_arn
+        # arn:aws:iam::<account>:role/<name>
+        self.account = role_arn.split(":")[4] if role_arn else None
+        self.key = f"{self.account}/{region}" if role_arn else region
+
+    def __eq__(self, other):
+        return isinstance(other, Target) and (self.region, self.role_arn) == (other.region, other.role_arn)
+
+    def __hash__(self):
+        return hash((self.region, self.role_arn))
+
+    def __repr__(self):
+        return f"Target({self.key})"
+
+
+# The targets of a comma separated list of region, region@role-arn and either followed by #topic-arn, e.g.
+# "us-east-1,eu-west-1#arn:aws:sns:eu-west-1:111111111111:alarms,eu-west-1@arn:aws:iam::123456789012:role/monitoring"
+def parse_targets(text):
+    targets = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        item_target, _, topic_arn = item.partition("#")
+        region, _, role_arn = item_target.partition("@")
+        target = Target(region.strip(), role_arn.strip() or None, topic_arn.strip() or None)
+        if target.role_arn and len(target.role_arn.split(":")) < 6:
+            raise ValueError(f"Invalid role ARN in the AWS target {item}")
+        if target.topic_arn:
+            # arn:aws:sns:<region>:<account>:<name>, an alarm can only notify a topic of its own region
+            topic = target.topic_arn.split(":")
+            if len(topic) < 6 or topic[2] != "sns":
+                raise ValueError(f"Invalid SNS topic ARN in the AWS target {item}")
+            if topic[3] != target.region:
+                raise ValueError(f"The SNS topic of the AWS target {item} isn't in the region {target.region}")
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+# A botocore credential provider for the session of a role, the credentials of assume_role are loaded on the first
+# call and refreshed before they expire (a CredentialResolver only needs METHOD and load)
+class RoleCredentialProvider:
+    METHOD = "assume-role"
+    CANONICAL_NAME = "custom-assume-role"
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+
+    def load(self):
+        from botocore.credentials import DeferredRefreshableCredentials
+        return DeferredRefreshableCredentials(self.fetcher.fetch_credentials, self.METHOD)
+
+
+# One boto3 client per service, region and role for the whole process.
+# boto3 clients are thread-safe, but creating them isn't (and loading the service model is slow),
+# so they are created once under a lock and reused by every handler, keeping their connection pools warm.
+# boto3 itself is imported by the first client, the bot connects to Slack without waiting for it.
+# The clients of a role use the credentials of assume_role, refreshed before they expire.
+# on_client(client) is called with each new client, before it is shared (to register event handlers...).
+# A client with its own max_attempts is kept apart from the client of the same service with the default retries
+class ClientRegistry:
+    def __init__(self, region, max_pool_connections, max_attempts, on_client=None):
+        self.region = region
+        self.on_client = on_client
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+        # the session of the default credentials (and its botocore session) and the config of the clients,
+        # made by the first client
+        self.session = None
+        self.botocore_session = None
+        self.config = None
+        # (service, region, role arn, max attempts): client
+        self.clients = {}
+        # role arn: session with the credentials of the role
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def client(self, service, region=None, role_arn=None, max_attempts=None):
+        key = (service, region or self.region, role_arn, max_attempts)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    session = self._session(role_arn)
+                    config = self.config
+                    if max_attempts is not None:
+                        from botocore.config import Config
+                        config = config.merge(Config(retries={"mode": "adaptive", "max_attempts": max_attempts}))
+                    client = session.client(service, region_name=key[1], config=config)
+                    if self.on_client:
+                        self.on_client(client)
+                    self.clients[key] = client
+        return client
+
+    # The client of a service in a target
+    def target_client(self, service, target, max_attempts=None):
+        return self.client(service, target.region, target.role_arn, max_attempts)
+
+    # Must be called with self.lock held. The role is assumed on the first call of its clients
+    def _session(self, role_arn):
+        import boto3
+        import botocore.session
+        if self.session is None:
+            from botocore.config import Config
+            self.config = Config(
+                max_pool_connections=self.max_pool_connections,
+                retries={"mode": "adaptive", "max_attempts": self.max_attempts}
+            )
+            self.botocore_session = botocore.session.get_session()
+            self.session = boto3.Session(botocore_session=self.botocore_session, region_name=self.region)
+        if role_arn is None:
+            return self.session
+        session = self.sessions.get(role_arn)
+        if session is None:
+            from botocore.credentials import AssumeRoleCredentialFetcher, CredentialResolver
+            # the role is assumed with the default credentials
+            fetcher = AssumeRoleCredentialFetcher(
+                client_creator=self.botocore_session.create_client,
+                source_credentials=self.botocore_session.get_credentials(),
+                role_arn=role_arn,
+                extra_args={"RoleSessionName": "slackbot"}
+            )
+            role_session = botocore.session.get_session()
+            role_session.register_component("credential_provider",
+                                            CredentialResolver([RoleCredentialProvider(fetcher)]))
+            session = self.sessions[role_arn] = boto3.Session(botocore_session=role_session, region_name=self.region)
+        return session
+
+    # Create the clients before the first request needs them, in the default region or in each target
+    def warm_up(self, services, targets=None):
+        for target in targets or [Target(self.region)]:
+            for service in services:
+                self.target_client(service, target)
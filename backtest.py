@@ -0,0 +1,157 @@
+import datetime
+
+import numpy as np
+
+# The alarm states, KEEP is a window that leaves the state unchanged (no data with the 'ignore' treatment)
+OK = 0
+ALARM = 1
+INSUFFICIENT_DATA = 2
+KEEP = -1
+
+COMPARISONS = ['GreaterThanThreshold', 'GreaterThanOrEqualToThreshold', 'LessThanThreshold',
+               'LessThanOrEqualToThreshold']
+TREAT_MISSING = ['breaching', 'notBreaching', 'ignore', 'missing']
+
+# GetMetricData accepts up to 500 queries per request
+MAX_QUERIES = 500
+# CloudWatch keeps the datapoints of the periods under a minute for 3 hours only
+HIGH_RESOLUTION_SECONDS = 3 * 3600
+
+
+# The seconds an alarm of period is replayed on, the last days or the last 3 hours for a period under a minute
+def backtest_seconds(period, days):
+    seconds = days * 86400
+    return min(seconds, HIGH_RESOLUTION_SECONDS) if period < 60 else seconds
+
+
+# The cells of the state matrices of a backtest of the alarms, one per alarm and period
+def backtest_cells(alarms, days):
+    return sum(backtest_seconds(alarm['Period'], days) // alarm['Period'] for alarm in alarms)
+
+
+# The state of each alarm (row) at the end of each period (column), as CloudWatch evaluates it.
+# values holds the metric datapoints of each alarm, NaN where a period has no datapoint. The other arguments have
+# one item per alarm: the threshold, the index of the comparison operator in COMPARISONS, the evaluation periods (N),
+# the datapoints to alarm (M) and the index of the missing data treatment in TREAT_MISSING.
+# A window of N periods is in ALARM when M of its datapoints breach. The missing datapoints count as breaching or
+# not breaching, or are left out with 'ignore'/'missing': a window without any datapoint keeps the state or is
+# INSUFFICIENT_DATA. The periods before the first full window have the state of the first full window
+def alarm_states(values, thresholds, comparisons, evaluation_periods, datapoints_to_alarm, treat_missing):
+    alarms, periods = values.shape
+    present = ~np.isnan(values)
+    with np.errstate(invalid="ignore"):
+        limit = thresholds[:, None]
+        operator = comparisons[:, None]
+        breaching = np.select(
+            [operator == 0, operator == 1, operator == 2, operator == 3],
+            [values > limit, values >= limit, values < limit, values <= limit]
+        ) & present
+    treatment = treat_missing[:, None]
+    # the datapoints substituted for the missing ones
+    breaching |= ~present & (treatment == 0)
+    counted = present | (treatment <= 1)
+
+    # the number of breaching and counted datapoints in the window of N periods ending at each period,
+    # from the cumulative sums of each row
+    breaching_count = _window_sums(breaching, evaluation_periods)
+    counted_count = _window_sums(counted, evaluation_periods)
+    states = np.where(breaching_count >= datapoints_to_alarm[:, None], ALARM, OK)
+    no_data = np.where(treatment == 2, KEEP, INSUFFICIENT_DATA)
+    states = np.where(counted_count == 0, no_data, states)
+
+    # the periods before the first full window take the state of the first full window
+    first = np.minimum(evaluation_periods, periods) - 1
+    column = np.arange(periods)
+    states = np.where(column < first[:, None], np.take_along_axis(states, first[:, None], axis=1), states)
+
+    # a KEEP window has the state of the last window before it
+    last_known = np.where(states == KEEP, 0, column)
+    np.maximum.accumulate(last_known, axis=1, out=last_known)
+    states = np.take_along_axis(states, last_known, axis=1)
+    return np.where(states == KEEP, INSUFFICIENT_DATA, states)
+
+
+# The sum of the window of lengths[row] columns ending at each column, a shorter window at the start of the row
+def _window_sums(flags, lengths):
+    alarms, periods = flags.shape
+    sums = np.zeros((alarms, periods + 1), dtype=np.int32)
+    np.cumsum(flags, axis=1, out=sums[:, 1:])
+    starts = np.maximum(np.arange(1, periods + 1) - lengths[:, None], 0)
+    return sums[:, 1:] - np.take_along_axis(sums, starts, axis=1)
+
+
+# The number of times each alarm (row of states) went into ALARM, and the share of the periods it was in ALARM
+def alarm_summary(states):
+    in_alarm = states == ALARM
+    transitions = np.count_nonzero(in_alarm[:, 1:] & ~in_alarm[:, :-1], axis=1)
+    return transitions, in_alarm.mean(axis=1)
+
+
+# The metric data of each alarm (put_metric_alarm kwargs, only Namespace, MetricName, Dimensions, Period and
+# Statistic are used) between start and end, at the period and statistic of the alarm. Returns the
+# (timestamps, values) arrays of each alarm. The alarms are queried 500 at a time, every page of the results is read
+def metric_data(cloudwatch, alarms, start, end):
+    series = [([], []) for _ in alarms]
+    paginator = cloudwatch.get_paginator('get_metric_data')
+    for first in range(0, len(alarms), MAX_QUERIES):
+        queries = [{
+            "Id": f"m{index}",
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": alarm['Namespace'],
+                    "MetricName": alarm['MetricName'],
+                    "Dimensions": alarm['Dimensions']
+                },
+                "Period": alarm['Period'],
+                "Stat": alarm['Statistic']
+            },
+            "ReturnData": True
+        } for index, alarm in enumerate(alarms[first:first + MAX_QUERIES], start=first)]
+        for page in paginator.paginate(MetricDataQueries=queries, StartTime=start, EndTime=end,
+                                       ScanBy='TimestampAscending'):
+            for result in page['MetricDataResults']:
+                timestamps, values = series[int(result['Id'][1:])]
+                timestamps.extend(timestamp.timestamp() for timestamp in result['Timestamps'])
+                values.extend(result['Values'])
+    return [(np.array(timestamps, dtype=np.float64), np.array(values, dtype=np.float64))
+            for timestamps, values in series]
+
+
+# Replay the alarms (put_metric_alarm kwargs) against their metric data of the last days (see backtest_seconds).
+# Returns for each alarm {"transitions": times it went into ALARM, "alarm_ratio": share of the time in ALARM,
+# "datapoints": datapoints found}. The alarms of the same period are evaluated together, the caller keeps
+# backtest_cells of the alarms within what it can hold in memory
+def backtest_alarms(cloudwatch, alarms, days, now=None):
+    end = now or datetime.datetime.now(datetime.timezone.utc)
+    results = [None] * len(alarms)
+    by_period = {}
+    for index, alarm in enumerate(alarms):
+        by_period.setdefault(alarm['Period'], []).append(index)
+    for period, indexes in by_period.items():
+        start = end - datetime.timedelta(seconds=backtest_seconds(period, days))
+        selected = [alarms[index] for index in indexes]
+        data = metric_data(cloudwatch, selected, start, end)
+        periods = int((end - start).total_seconds() // period)
+        # each datapoint goes in the column of its period, the periods without a datapoint stay NaN
+        values = np.full((len(indexes), periods), np.nan)
+        for row in range(len(indexes)):
+            timestamps, points = data[row]
+            columns = ((timestamps - start.timestamp()) // period).astype(np.int64)
+            inside = (columns >= 0) & (columns < periods)
+            values[row, columns[inside]] = points[inside]
+        states = alarm_states(
+            values,
+            np.array([alarm['Threshold'] for alarm in selected], dtype=np.float64),
+            np.array([COMPARISONS.index(alarm['ComparisonOperator']) for alarm in selected]),
+            np.array([alarm['EvaluationPeriods'] for alarm in selected]),
+            np.array([alarm['DatapointsToAlarm'] for alarm in selected]),
+            np.array([TREAT_MISSING.index(alarm['TreatMissingData']) for alarm in selected])
+        )
+        transitions, alarm_ratio = alarm_summary(states)
+        for row, index in enumerate(indexes):
+            results[index] = {
+                "transitions": int(transitions[row]),
+                "alarm_ratio": float(alarm_ratio[row]),
+                "datapoints": len(data[row][1])
+            }
+    return results
@@ -0,0 +1,84 @@
+# Benchmark of the alarm backtest: the states of dozens of alarms over 30 days of 60 seconds datapoints,
+# checked against a period by period evaluation. Run with: python benchmarks/bench_backtest.py
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backtest import alarm_states, alarm_summary, ALARM, OK, INSUFFICIENT_DATA
+
+ALARMS = 48
+PERIODS = 30 * 24 * 60
+
+
+# The metric of each alarm: a daily cycle with noise, spikes and gaps of missing datapoints
+def synthetic_data(alarms=ALARMS, periods=PERIODS, seed=1):
+    random = np.random.default_rng(seed)
+    minutes = np.arange(periods)
+    values = 50 + 20 * np.sin(2 * np.pi * minutes / 1440) + random.normal(0, 8, (alarms, periods))
+    values[random.random((alarms, periods)) < 0.001] += 60
+    values[random.random((alarms, periods)) < 0.02] = np.nan
+    # a few hours without data
+    for row in range(alarms):
+        gap = random.integers(0, periods - 300)
+        values[row, gap:gap + random.integers(0, 300)] = np.nan
+    return values
+
+
+def parameters(alarms=ALARMS, seed=2):
+    random = np.random.default_rng(seed)
+    evaluation_periods = random.integers(1, 10, alarms)
+    return (
+        random.uniform(60, 95, alarms),
+        random.integers(0, 4, alarms),
+        evaluation_periods,
+        np.array([random.integers(1, n + 1) for n in evaluation_periods]),
+        random.integers(0, 4, alarms)
+    )
+
+
+# The states of one alarm evaluated period by period
+def reference_states(values, threshold, comparison, evaluation_periods, datapoints_to_alarm, treat_missing):
+    compare = [lambda v: v > threshold, lambda v: v >= threshold, lambda v: v < threshold,
+               lambda v: v <= threshold][comparison]
+    states = []
+    state = None
+    for end in range(len(values)):
+        window = values[max(0, end - evaluation_periods + 1):end + 1]
+        breaching = counted = 0
+        for value in window:
+            if np.isnan(value):
+                if treat_missing <= 1:
+                    counted += 1
+                    breaching += treat_missing == 0
+            else:
+                counted += 1
+                breaching += bool(compare(value))
+        if counted == 0:
+            state = state if treat_missing == 2 else INSUFFICIENT_DATA
+        else:
+            state = ALARM if breaching >= datapoints_to_alarm else OK
+        states.append(state)
+    first = min(evaluation_periods, len(values)) - 1
+    states[:first] = [states[first]] * first
+    # a state still unknown after the first full window (ignore without any data) is insufficient data
+    return [INSUFFICIENT_DATA if state is None else state for state in states]
+
+
+if __name__ == "__main__":
+    values = synthetic_data()
+    arguments = parameters()
+    states = alarm_states(values, *arguments)
+    # compare a few alarms with the period by period evaluation
+    for row in range(0, ALARMS, 12):
+        expected = reference_states(values[row], *(argument[row] for argument in arguments))
+        assert states[row].tolist() == expected, row
+    seconds = min(timeit.repeat(lambda: alarm_summary(alarm_states(values, *arguments)), number=1, repeat=5))
+    transitions, alarm_ratio = alarm_summary(states)
+    print(f"{ALARMS} alarms x {PERIODS} periods: {seconds * 1000:.1f} ms "
+          f"({ALARMS * PERIODS / seconds / 1e6:.1f}M datapoints/s)")
+    print(f"alarm transitions per alarm: median {int(np.median(transitions))}, max {transitions.max()}, "
+          f"time in alarm: median {np.median(alarm_ratio):.1%}")
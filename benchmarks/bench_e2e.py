@@ -0,0 +1,459 @@
+# End-to-end benchmark of the /create_monitoring -> approve flow. The bot runs in a child process (the sync or the
+# asyncio runtime) against a Slack stand-in served by this script (the Web API and the Socket Mode WebSocket) and an
+# AWS stand-in put in its client registry, so nothing leaves the host. Simulated users go through the whole flow
+# concurrently: the slash command, the resource type, the resource search, the metrics, the alert details and the
+# approval by an admin, until the bot reports the alarms created.
+# With --workers N the bot runs under supervisor.py, with N processes and Socket Mode connections: the envelopes are
+# sent to the connections in turn, so the pages of a flow are handled by different processes.
+# Reports the flows per second, the ack latency percentiles, the time until the bot connected and the peak RSS of
+# the bot (of its biggest process).
+# Run with: python benchmarks/bench_e2e.py --flows 200 --concurrency 20 --inventory 5000 [--runtime async]
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import re
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APPROVAL_CHANNEL = 'C074TASRX7S'
+LOG_CHANNEL = 'C078BQGN1BP'
+RESOURCE_TYPE = 'AWS/EC2'
+METRICS = ['CPUUtilization', 'NetworkIn']
+# the values typed in the number inputs of the third page, the first option of each dropdown is selected
+ALERT_NUMBERS = {
+    'threshold': "80",
+    'period (in seconds)': "60",
+    'evaluation period': "5",
+    'datapoints to alarm from the evaluation period': "3"
+}
+# seconds before a step of a flow is counted as failed
+TIMEOUT = 60
+# resources per page of the describe calls of the AWS stand-in
+PAGE_SIZE = 1000
+# the rate of the Slack rate limits of the bot when they are lifted
+UNLIMITED = 10 ** 6
+
+
+# Stands in for the elbv2, ec2, rds and cloudwatch clients of the bot: inventory resources of each type, the alarms
+# put so far and a day of hourly datapoints for every metric. Each call (each page) takes latency seconds
+class StandInAWS:
+    def __init__(self, inventory, latency):
+        self.inventory = inventory
+        self.latency = latency
+        self.alarms = {}
+        self.lock = threading.Lock()
+
+    def get_paginator(self, operation):
+        return StandInPaginator(getattr(self, "_" + operation), self.latency)
+
+    def put_metric_alarm(self, **alarm):
+        time.sleep(self.latency)
+        with self.lock:
+            self.alarms[alarm['AlarmName']] = alarm
+        return {}
+
+    def _pages(self, item):
+        for first in range(0, self.inventory, PAGE_SIZE):
+            yield [item(n) for n in range(first, min(first + PAGE_SIZE, self.inventory))]
+
+    def _describe_instances(self, **kwargs):
+        for instances in self._pages(lambda n: {"InstanceId": f"i-{n:017x}", "State": {"Name": "running"}}):
+            yield {"Reservations": [{"Instances": instances}]}
+
+    def _describe_target_groups(self, **kwargs):
+        for target_groups in self._pages(lambda n: {
+            "TargetGroupName": f"tg-{n}",
+            "TargetGroupArn": f"arn:aws:elasticloadbalancing:us-east-1:000000000000:targetgroup/tg-{n}/{n:016x}",
+            "Protocol": "HTTP"
+        }):
+            yield {"TargetGroups": target_groups}
+
+    def _describe_db_instances(self, **kwargs):
+        for databases in self._pages(lambda n: {"DBInstanceIdentifier": f"db-{n}"}):
+            yield {"DBInstances": databases}
+
+    def _describe_alarms(self, AlarmNames=None, **kwargs):
+        with self.lock:
+            alarms = [alarm for name, alarm in self.alarms.items() if AlarmNames is None or name in AlarmNames]
+        yield {"MetricAlarms": alarms}
+
+    def _get_metric_data(self, MetricDataQueries, EndTime, **kwargs):
+        timestamps = [EndTime - datetime.timedelta(hours=hours) for hours in range(24, 0, -1)]
+        yield {"MetricDataResults": [{
+            "Id": query["Id"],
+            "Timestamps": timestamps,
+            "Values": [50.0 + (hour * 7) % 30 for hour in range(24)]
+        } for query in MetricDataQueries]}
+
+
+class StandInPaginator:
+    def __init__(self, pages, latency):
+        self.pages = pages
+        self.latency = latency
+
+    def paginate(self, **kwargs):
+        for page in self.pages(**kwargs):
+            time.sleep(self.latency)
+            yield page
+
+
+# The child process: the bot with the AWS stand-in in its client registry
+def run_bot(args):
+    import main
+    import slack_queue
+    # each target (AWS_TARGETS, --targets) has its own stand-in, with the same resources
+    for target in main.aws_targets:
+        aws = StandInAWS(args.inventory, args.aws_latency / 1000)
+        for service in main.aws_services:
+            # the alarms are put with a client of their own, without botocore retries
+            for max_attempts in (None, 0):
+                main.aws_clients.clients[(service, target.region, target.role_arn, max_attempts)] = aws
+    # the stand-in doesn't rate limit, only the bot is measured unless --rate-limits is given
+    if not args.rate_limits:
+        for tier in slack_queue.TIERS:
+            slack_queue.TIERS[tier] = (UNLIMITED, UNLIMITED)
+    if args.runtime == "async":
+        import async_main
+        asyncio.run(async_main.start())
+    else:
+        main.start()
+
+
+# The Web API and the Socket Mode server of Slack. Sends the envelopes of the simulated users and measures
+# the time until the bot acks each of them, spread over the open connections. Each Web API call takes latency seconds,
+# connected is set once connections connections are open
+class SlackStandIn:
+    def __init__(self, latency, connections=1):
+        self.latency = latency
+        self.port = None
+        self.sockets = []
+        self.expected_connections = connections
+        self.connected = asyncio.Event()
+        self.sequence = itertools.count(1)
+        # envelope id: (future of the ack payload, send time, request type)
+        self.acks = {}
+        # (request type, seconds) of each ack
+        self.ack_latencies = []
+        # trigger id: future of the opened view
+        self.views = {}
+        # requester id: future of the approval message
+        self.approvals = {}
+        # requester id: future set when the requester is told the request was sent for approval
+        self.sent_for_approval = {}
+        # requester name: future set when the log channel says the alarms were created
+        self.done = {}
+        self.api_calls = {}
+
+    def app(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post("/api/{method}", self.api)
+        app.router.add_get("/link", self.link)
+        return app
+
+    async def link(self, request):
+        from aiohttp import web
+        socket_response = web.WebSocketResponse()
+        await socket_response.prepare(request)
+        self.sockets.append(socket_response)
+        await socket_response.send_json({"type": "hello", "num_connections": len(self.sockets),
+                                         "connection_info": {"app_id": "ABENCH"}})
+        if len(self.sockets) >= self.expected_connections:
+            self.connected.set()
+        try:
+            await self.receive_acks(socket_response)
+        finally:
+            self.sockets.remove(socket_response)
+        return socket_response
+
+    async def receive_acks(self, socket_response):
+        from aiohttp import WSMsgType
+        async for message in socket_response:
+            if message.type != WSMsgType.TEXT:
+                continue
+            ack = json.loads(message.data)
+            pending = self.acks.pop(ack.get("envelope_id"), None)
+            if pending is None:
+                continue
+            future, sent, kind = pending
+            self.ack_latencies.append((kind, time.perf_counter() - sent))
+            if not future.done():
+                future.set_result(ack.get("payload"))
+
+    # Send an envelope and return the payload of its ack
+    async def send(self, type, payload):
+        sequence = next(self.sequence)
+        envelope_id = f"envelope-{sequence}"
+        future = asyncio.get_running_loop().create_future()
+        self.acks[envelope_id] = (future, time.perf_counter(), payload.get("type") or type)
+        socket_response = self.sockets[sequence % len(self.sockets)]
+        await socket_response.send_json({"envelope_id": envelope_id, "type": type, "payload": payload,
+                                         "accepts_response_payload": type == "interactive"})
+        return await asyncio.wait_for(future, TIMEOUT)
+
+    async def api(self, request):
+        from aiohttp import web
+        method = request.match_info["method"]
+        arguments = dict(request.query)
+        if request.content_type == "application/json":
+            arguments.update(json.loads(await request.read() or b"{}"))
+        else:
+            arguments.update(await request.post())
+        for name in ("view", "blocks"):
+            if isinstance(arguments.get(name), str):
+                arguments[name] = json.loads(arguments[name])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.api_calls[method] = self.api_calls.get(method, 0) + 1
+        handler = getattr(self, "_" + method.replace(".", "_"), None)
+        return web.json_response(handler(arguments) if handler else {"ok": True})
+
+    def _apps_connections_open(self, arguments):
+        return {"ok": True, "url": f"ws://127.0.0.1:{self.port}/link"}
+
+    def _views_open(self, arguments):
+        view = dict(arguments["view"], id=f"V{next(self.sequence)}", hash=str(next(self.sequence)))
+        self._resolve(self.views, arguments["trigger_id"], view)
+        return {"ok": True, "view": view}
+
+    def _views_update(self, arguments):
+        return {"ok": True, "view": dict(arguments["view"], id=arguments.get("view_id"), hash=str(next(self.sequence)))}
+
+    def _chat_postMessage(self, arguments):
+        message = dict(arguments, ts=f"{int(time.time())}.{next(self.sequence):06d}")
+        # like Slack, every block of the posted message has a block id
+        for block in message.get("blocks") or []:
+            block.setdefault("block_id", f"block-{next(self.sequence)}")
+        if arguments["channel"] == APPROVAL_CHANNEL:
+            requester = re.search(r"Requested by <@(\w+)>", json.dumps(arguments.get("blocks")))
+            if requester:
+                self._resolve(self.approvals, requester.group(1), message)
+        elif "sent for approval" in arguments.get("text", ""):
+            self._resolve(self.sent_for_approval, arguments["channel"], True)
+        elif arguments["channel"] == LOG_CHANNEL and "created successfully" in arguments.get("text", ""):
+            self._resolve(self.done, re.search(r"`([^`]+)`", arguments["text"]).group(1), True)
+        return {"ok": True, "channel": arguments["channel"], "ts": message["ts"], "message": message}
+
+    def _chat_update(self, arguments):
+        return {"ok": True, "channel": arguments["channel"], "ts": arguments["ts"]}
+
+    def _resolve(self, futures, key, value):
+        future = futures.setdefault(key, asyncio.get_running_loop().create_future())
+        if not future.done():
+            future.set_result(value)
+
+    # Wait for the view, approval message or success message of key
+    async def wait(self, futures, key):
+        future = futures.setdefault(key, asyncio.get_running_loop().create_future())
+        try:
+            return await asyncio.wait_for(future, TIMEOUT)
+        finally:
+            futures.pop(key, None)
+
+
+def submission(view, user_id):
+    return {"type": "view_submission", "user": {"id": user_id}, "view": view}
+
+
+# The state of the third page: the numbers of ALERT_NUMBERS and the first option of each dropdown
+def alert_values(blocks):
+    values = {}
+    for block in blocks:
+        if block.get("type") != "input":
+            continue
+        element = block["element"]
+        metric, variable, _ = block["block_id"].split("-")
+        if element["type"] == "static_select":
+            values[block["block_id"]] = {element["action_id"]: {"type": "static_select",
+                                                                 "selected_option": element["options"][0]}}
+        else:
+            values[block["block_id"]] = {element["action_id"]: {"type": element["type"],
+                                                                 "value": ALERT_NUMBERS[variable]}}
+    return values
+
+
+# One simulated user going through the whole flow, returns the seconds it took
+async def run_flow(slack, number, inventory, admin_id):
+    user_id = f"UB{number:08d}"
+    user_name = f"bench-{number:05d}"
+    trigger_id = f"trigger-{number}"
+    started = time.perf_counter()
+    await slack.send("slash_commands", {"command": "/create_monitoring", "user_id": user_id, "user_name": user_name,
+                                        "trigger_id": trigger_id, "channel_id": "CBENCH", "text": ""})
+    view = await slack.wait(slack.views, trigger_id)
+    view_id, view_hash = view["id"], view["hash"]
+
+    # the resource type is selected (the bot loads the inventory) then the first page is submitted
+    selected = {"type": "static_select", "selected_option": {"text": {"type": "plain_text", "text": RESOURCE_TYPE},
+                                                             "value": RESOURCE_TYPE}}
+    view["state"] = {"values": {"resources-dropdown": {"resources_options_action": selected}}}
+    await slack.send("interactive", {"type": "block_actions", "user": {"id": user_id}, "view": view, "actions": [
+        dict(selected, action_id="resources_options_action", block_id="resources-dropdown")]})
+    ack = await slack.send("interactive", submission(view, user_id))
+    view = dict(ack["view"], id=view_id, hash=view_hash)
+
+    # the user types the name of a resource, until the inventory is loaded
+    query = f"i-{number % inventory:017x}"
+    for _ in range(TIMEOUT * 10):
+        options = (await slack.send("interactive", {
+            "type": "block_suggestion", "user": {"id": user_id}, "action_id": "resource_name_action",
+            "block_id": "resource-name-dropdown", "value": query, "view": view
+        }))["options"]
+        if options:
+            break
+        await asyncio.sleep(0.1)
+    # with several targets, the resource is listed once per target
+    option = options[number % len(options)]
+    view["state"] = {"values": {
+        "resource-name-dropdown": {"resource_name_action": {"type": "external_select", "selected_option": option}},
+        "metrics": {"metrics_action": {"type": "checkboxes", "selected_options": [{"value": metric}
+                                                                                  for metric in METRICS]}}
+    }}
+    ack = await slack.send("interactive", submission(view, user_id))
+    view = dict(ack["view"], id=view_id, hash=view_hash)
+
+    view["state"] = {"values": alert_values(view["blocks"])}
+    ack = await slack.send("interactive", submission(view, user_id))
+    if ack and ack.get("response_action") == "errors":
+        raise ValueError(f"The alert details were rejected: {ack['errors']}")
+
+    # an admin approves the request, once it is recorded (the requester is told it was sent for approval)
+    message = await slack.wait(slack.approvals, user_id)
+    await slack.wait(slack.sent_for_approval, user_id)
+    approve = next(element for block in message["blocks"] if block.get("block_id") == "approve-reject"
+                   for element in block["elements"] if element["action_id"] == "approve_request")
+    await slack.send("interactive", {
+        "type": "block_actions", "user": {"id": admin_id}, "channel": {"id": APPROVAL_CHANNEL},
+        "message": {"ts": message["ts"], "blocks": message["blocks"]},
+        "actions": [{"type": "button", "action_id": "approve_request", "block_id": "approve-reject",
+                     "value": approve["value"]}]
+    })
+    await slack.wait(slack.done, user_name)
+    return time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else float("nan")
+
+
+async def benchmark(args):
+    from aiohttp import web
+    from variables import admins
+    slack = SlackStandIn(args.slack_latency / 1000, args.workers or 1)
+    runner = web.AppRunner(slack.app())
+    await runner.setup()
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    slack.port = listener.getsockname()[1]
+    await web.SockSite(runner, listener).start()
+
+    with tempfile.TemporaryDirectory() as directory, open(args.bot_log, "ab") as log:
+        environment = dict(
+            os.environ,
+            SLACK_API_URL=f"http://127.0.0.1:{slack.port}/api/",
+            SLACK_BOT_TOKEN="xoxb-bench",
+            SLACK_APP_TOKEN="xapp-bench",
+            SNS_TOPIC_ARN="arn:aws:sns:us-east-1:000000000000:bench",
+            JOURNAL_PATH=os.path.join(directory, "journal.db"),
+            DEDUP_PATH=os.path.join(directory, "dedup.db"),
+            # the workers of the supervisor share their flows and metric statistics in these files
+            FLOW_STATE_PATH=os.path.join(directory, "flow_state.db"),
+            THRESHOLD_STATE_PATH=os.path.join(directory, "thresholds.db"),
+            FLOW_STATE_BACKEND="memory",
+            METRICS_PORT="0",
+            WORKER_PROCESSES=str(args.workers),
+            AWS_TARGETS=args.targets
+        )
+        # the supervisor runs this script in bot mode in each of its workers
+        supervisor = [os.path.join(ROOT, "supervisor.py")] if args.workers else []
+        spawned = time.perf_counter()
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, *supervisor, os.path.abspath(__file__), "--bot", "--runtime", args.runtime,
+            "--inventory", str(args.inventory), "--aws-latency", str(args.aws_latency),
+            *(["--rate-limits"] if args.rate_limits else []),
+            cwd=directory, env=environment, stdout=log, stderr=log
+        )
+        try:
+            await asyncio.wait_for(slack.connected.wait(), TIMEOUT)
+            connect_seconds = time.perf_counter() - spawned
+            numbers = iter(range(args.flows))
+            durations = []
+            failures = []
+
+            async def user():
+                for number in numbers:
+                    try:
+                        durations.append(await run_flow(slack, number, args.inventory, admins[0]))
+                    except Exception as e:
+                        failures.append(f"flow {number}: {type(e).__name__} {e}")
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+        finally:
+            if bot.returncode is None:
+                bot.terminate()
+            await bot.wait()
+            await runner.cleanup()
+
+    # KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin"
+                                                                           else 1024)
+    workers = f", {args.workers} workers" if args.workers else ""
+    print(f"{args.runtime} runtime{workers}, {args.flows} flows, concurrency {args.concurrency}, "
+          f"{args.inventory} resources, AWS latency {args.aws_latency} ms, Slack latency {args.slack_latency} ms")
+    print(f"throughput: {len(durations) / elapsed:.1f} flows/s ({len(durations)} completed in {elapsed:.1f} s, "
+          f"{len(failures)} failed)")
+    print(f"flow duration: p50 {percentile(durations, 0.5) * 1000:.0f} ms, "
+          f"p95 {percentile(durations, 0.95) * 1000:.0f} ms")
+    latencies = [seconds for _, seconds in slack.ack_latencies]
+    print(f"ack latency ({len(latencies)} acks): p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    for kind in sorted({kind for kind, _ in slack.ack_latencies}):
+        kind_latencies = [seconds for item, seconds in slack.ack_latencies if item == kind]
+        print(f"  {kind}: p50 {percentile(kind_latencies, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(kind_latencies, 0.99) * 1000:.1f} ms")
+    print(f"bot connected {connect_seconds * 1000:.0f} ms after it was started (see the Startup line of --bot-log "
+          f"for the breakdown)")
+    print(f"bot peak RSS: {peak_rss:.0f} MiB")
+    print("Web API calls: " + ", ".join(f"{method} {count}" for method, count in sorted(slack.api_calls.items())))
+    for failure in failures[:10]:
+        print(failure)
+    return not failures
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the bot with local Slack and AWS stand-ins")
+    parser.add_argument("--runtime", choices=["sync", "async"], default="sync")
+    parser.add_argument("--flows", type=int, default=100, help="flows to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="users going through a flow at the same time")
+    parser.add_argument("--inventory", type=int, default=1000, help="resources of each type")
+    parser.add_argument("--aws-latency", type=float, default=20, help="milliseconds of each AWS call")
+    parser.add_argument("--slack-latency", type=float, default=20, help="milliseconds of each Web API call")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the Slack rate limits of the bot")
+    parser.add_argument("--targets", default="us-east-1",
+                        help="AWS_TARGETS of the bot, each target is a stand-in with the same resources")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run the bot under supervisor.py with this many processes (0 runs a single bot)")
+    parser.add_argument("--bot-log", default=os.devnull, help="file the output of the bot is appended to")
+    parser.add_argument("--bot", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.bot:
+        run_bot(arguments)
+    else:
+        sys.exit(0 if asyncio.run(benchmark(arguments)) else 1)
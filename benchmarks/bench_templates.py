@@ -0,0 +1,160 @@
+# Microbenchmark of the modal pages: the blocks built from scratch for every request (as main.py used to do)
+# against the blocks precompiled in templates.py. Run with: python benchmarks/bench_templates.py
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import templates
+from variables import resources, alert_vairables
+
+RESOURCE_TYPE = 'AWS/EC2'
+METRICS = [metric for metric_dict in resources[RESOURCE_TYPE] for metric in metric_dict]
+
+
+# The first page as it was built for every request
+def first_page_from_scratch():
+    resources_options = [{"text": {"type": "plain_text", "text": key}, "value": key} for key in resources.keys()]
+    return [
+        {
+            "type": "input",
+            "block_id": "resources-dropdown",
+            "dispatch_action": True,
+            "element": {
+                "type": "static_select",
+                "placeholder": {"type": "plain_text", "text": "Select a resource type to monitor"},
+                "options": resources_options,
+                "action_id": "resources_options_action"
+            },
+            "label": {"type": "plain_text", "text": "Select the resource type to monitor"}
+        },
+        {
+            "type": "input",
+            "block_id": "bulk-mode",
+            "optional": True,
+            "element": {
+                "type": "checkboxes",
+                "action_id": "bulk_mode_action",
+                "options": [{"text": {"type": "plain_text", "text": "Monitor several resources of this type"},
+                             "value": "bulk"}]
+            },
+            "label": {"type": "plain_text", "text": "Bulk mode"}
+        }
+    ]
+
+
+# The second page as it was built for every request
+def second_page_from_scratch(resource_type=RESOURCE_TYPE):
+    blocks = [
+        {
+            "type": "input",
+            "block_id": "resource-name-dropdown",
+            "dispatch_action": True,
+            "element": {
+                "type": "external_select",
+                "placeholder": {"type": "plain_text", "text": f"Search a {resource_type} name"},
+                "min_query_length": 0,
+                "action_id": "resource_name_action"
+            },
+            "label": {"type": "plain_text", "text": f"Select the {resource_type} name"}
+        }
+    ]
+    blocks.append({
+        "type": "input",
+        "block_id": "metrics",
+        "label": {"type": "plain_text", "text": f"Select the metrics to monitor for {resource_type}"},
+        "element": {"type": "checkboxes", "action_id": "metrics_action", "options": []}
+    })
+    for metric_dict in resources[resource_type]:
+        for metric, description in metric_dict.items():
+            blocks[-1]["element"]["options"].append({
+                "text": {"type": "plain_text", "text": description},
+                "value": metric
+            })
+    return blocks
+
+
+# The third page as it was built for every request
+def third_page_from_scratch(resource_name="i-0123456789", resource_arn_or_id="i-0123456789", checked_metrics=METRICS):
+    blocks = [{
+        "type": "section",
+        "block_id": "resource-name",
+        "text": {
+            "type": "mrkdwn",
+            "text": f"*Resource details:* \nResource name: `{resource_name}`\nResource id/arn: `{resource_arn_or_id}`"
+        }
+    }]
+    for metric in checked_metrics:
+        blocks.append({"type": "divider"})
+        blocks.append({
+            "type": "section",
+            "block_id": f"{metric}-alert",
+            "text": {"type": "mrkdwn", "text": f"• Details for {metric} alert"}
+        })
+        for variable, value in alert_vairables.items():
+            if type(value) == list:
+                blocks.append({
+                    "type": "input",
+                    "block_id": f"{metric}-{variable}-dropdown",
+                    "dispatch_action": True,
+                    "element": {
+                        "type": "static_select",
+                        "placeholder": {"type": "plain_text", "text": f"Select the {variable}"},
+                        "options": [{"text": {"type": "plain_text", "text": option}, "value": option}
+                                    for option in value],
+                        "action_id": f"{metric}-{variable}-action"
+                    },
+                    "label": {"type": "plain_text", "text": f"Select the {variable}"}
+                })
+            else:
+                blocks.append({
+                    "type": "input",
+                    "block_id": f"{metric}-{variable}-input",
+                    "dispatch_action": True,
+                    "element": {
+                        "type": "number_input",
+                        "is_decimal_allowed": False,
+                        "min_value": str(templates.MINIMUMS.get(variable, 0)),
+                        "dispatch_action_config": {"trigger_actions_on": ["on_character_entered"]},
+                        "action_id": f"{metric}-{variable}-action"
+                    },
+                    "label": {"type": "plain_text", "text": f"Enter the {variable}"}
+                })
+    return blocks
+
+
+PAGES = [
+    ("first page", first_page_from_scratch, templates.first_page_blocks),
+    ("second page", second_page_from_scratch, lambda: templates.second_page_blocks(RESOURCE_TYPE)),
+    ("third page", third_page_from_scratch,
+     lambda: templates.alerts_details_blocks([["i-0123456789", "i-0123456789"]], METRICS)),
+]
+
+
+# Microseconds per build, best of 5 runs
+def build_time(build, number=2000):
+    return min(timeit.repeat(build, number=number, repeat=5)) / number * 1e6
+
+
+# Bytes allocated by one build, (kept by the result, peak during the build)
+def allocations(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current - before, peak - before
+
+
+if __name__ == "__main__":
+    print(f"{'page':<12} {'build':<10} {'us/build':>10} {'bytes':>8} {'peak':>8}")
+    for name, from_scratch, precompiled in PAGES:
+        # both ways must give the same page
+        assert json.dumps(from_scratch()) == json.dumps(precompiled()), name
+        for kind, build in (("scratch", from_scratch), ("template", precompiled)):
+            size, peak = allocations(build)
+            print(f"{name:<12} {kind:<10} {build_time(build):>10.2f} {size:>8} {peak:>8}")
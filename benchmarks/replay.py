@@ -0,0 +1,304 @@
+# Replays the Socket Mode envelopes recorded with RECORD_PATH (see recorder.py) into the listener of main.py
+# (request_listener, as the Socket Mode client calls it), with the Web API and AWS
+# replaced by local stand-ins. The envelopes are fed at the recorded pace (--speed 1), N times faster (--speed N)
+# or as fast as possible (--speed 0). --copies N replays N copies of every recorded flow at the same time, with their
+# own users and flow ids, to reproduce a burst (a whole team running /create_monitoring after an incident).
+# The envelopes of a user are fed in order, and a page of a flow or an approval isn't fed before the bot started
+# the flow or recorded the request, so the fast replays keep the causality of the recording.
+# Reports the ack latency, the latency and errors of each handler, and the AWS and Slack calls.
+# Run with: python benchmarks/replay.py recording.jsonl [--speed 10] [--copies 20]
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_e2e import StandInAWS, UNLIMITED, percentile
+from recorder import read_recording
+
+# The flow ids (uuid4().hex), the user ids and the user names of a recording
+FLOW_ID = re.compile(r"\b[0-9a-f]{32}\b")
+RECORDED_USER_ID = re.compile(r"\bU(?!ADMIN)[0-9A-F]{10}\b")
+RECORDED_USER_NAME = re.compile(r"\buser-[0-9a-f]{8}\b")
+ADMIN_ID = re.compile(r"\bUADMIN(\d{4})\b")
+
+
+# Stands in for the WebClient sent through by the outbound queue, each call takes latency seconds
+class StandInWebClient:
+    def __init__(self, latency):
+        self.latency = latency
+        self.sequence = itertools.count(1)
+
+    def __getattr__(self, method):
+        def call(**kwargs):
+            time.sleep(self.latency)
+            ts = f"{int(time.time())}.{next(self.sequence):06d}"
+            response = {"ok": True, "channel": kwargs.get("channel"), "ts": ts}
+            if method.startswith("views_"):
+                response["view"] = dict(kwargs.get("view") or {}, id=kwargs.get("view_id") or f"V{ts}", hash=ts)
+            return response
+
+        return call
+
+
+# Stands in for the SocketModeClient given to the listeners, keeps the time of the first ack
+class StandInSocketClient:
+    def __init__(self):
+        self.acked = None
+
+    def send_socket_mode_response(self, response):
+        if self.acked is None:
+            self.acked = time.perf_counter()
+
+
+# The recorded envelopes, with copies of every flow: the envelope ids, flow ids, users and user names of copy n get
+# a -n suffix (the copies aren't redeliveries of the recorded envelopes).
+# The admins get the ids of the admins of the tree back
+def load_envelopes(path, copies, admins):
+    envelopes = []
+    for envelope in read_recording(path):
+        line = ADMIN_ID.sub(lambda match: admins[int(match.group(1)) % len(admins)], json.dumps(envelope))
+        for copy in range(copies):
+            if copy:
+                suffix = f"-{copy}"
+                text = FLOW_ID.sub(lambda match: match.group() + suffix, line)
+                text = RECORDED_USER_ID.sub(lambda match: match.group() + f"C{copy}", text)
+                text = RECORDED_USER_NAME.sub(lambda match: match.group() + suffix, text)
+            else:
+                suffix = ""
+                text = line
+            envelope = json.loads(text)
+            envelope["envelope_id"] += suffix
+            envelopes.append(envelope)
+    envelopes.sort(key=lambda envelope: envelope["at"])
+    return envelopes
+
+
+def user_of(payload):
+    return payload.get("user_id") or (payload.get("user") or {}).get("id")
+
+
+def flow_of(payload):
+    view = payload.get("view") or {}
+    return view.get("private_metadata")
+
+
+# The flow id of an approve/reject click, from the request carried by the button
+def approval_flow_of(payload):
+    actions = payload.get("actions") or []
+    if payload.get("type") != "block_actions" or not actions or actions[0].get("action_id") not in (
+            "approve_request", "reject_request"):
+        return None
+    try:
+        return json.loads(actions[0]["value"])[1]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+# The flow ids of each user in the order their flows were started: the first page of a flow carries its id
+def flows_by_user(envelopes):
+    flows = {}
+    seen = set()
+    for envelope in envelopes:
+        flow_id = flow_of(envelope["payload"])
+        if flow_id and FLOW_ID.fullmatch(flow_id.split("-")[0]) and flow_id not in seen:
+            seen.add(flow_id)
+            flows.setdefault(user_of(envelope["payload"]), deque()).append(flow_id)
+    return flows
+
+
+def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def replay(args):
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ.update(
+            SLACK_BOT_TOKEN=os.environ.get("SLACK_BOT_TOKEN", "xoxb-replay"),
+            SNS_TOPIC_ARN=os.environ.get("SNS_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:replay"),
+            JOURNAL_PATH=os.path.join(directory, "journal.db"),
+            DEDUP_PATH=os.path.join(directory, "dedup.db"),
+            FLOW_STATE_BACKEND="memory",
+            METRICS_PORT="0"
+        )
+        os.environ.pop("RECORD_PATH", None)
+        import main
+        import slack_queue
+        from slack_sdk.socket_mode.request import SocketModeRequest
+        from variables import admins
+        return run_replay(args, main, slack_queue, SocketModeRequest, admins)
+
+
+def run_replay(args, main, slack_queue, SocketModeRequest, admins):
+    envelopes = load_envelopes(args.recording, args.copies, admins)
+    aws = StandInAWS(args.inventory, args.aws_latency / 1000)
+    for target in main.aws_targets:
+        for service in main.aws_services:
+            # the alarms are put with a client of their own, without botocore retries
+            for max_attempts in (None, 0):
+                main.aws_clients.clients[(service, target.region, target.role_arn, max_attempts)] = aws
+    main.web_client.web_client = StandInWebClient(args.slack_latency / 1000)
+    if not args.rate_limits:
+        for tier in slack_queue.TIERS:
+            slack_queue.TIERS[tier] = (UNLIMITED, UNLIMITED)
+    main.web_client.start()
+    main.worker_pool.start()
+    main.error_sink.start()
+
+    # the replayed /create_monitoring of a user starts the flow of the recording, so its pages find their flow
+    flows = flows_by_user(envelopes)
+    started_flows = {flow_id for user_flows in flows.values() for flow_id in user_flows}
+    flows_lock = threading.Lock()
+    start_flow = main.flow_store.start
+
+    def replay_start(**state):
+        with flows_lock:
+            user_flows = flows.get(state.get("user_id"))
+            flow_id = user_flows.popleft() if user_flows else None
+        if flow_id is None:
+            return start_flow(**state)
+        main.flow_store.backend.set(flow_id, state)
+        return flow_id
+
+    main.flow_store.start = replay_start
+
+    # (request type, seconds) of each ack
+    acks = []
+    failures = []
+    unacked = []
+    # the envelopes fed after waiting --timeout for a flow or request that never came (a dropped handler call...)
+    stalled = []
+    # user: the event set when the previous envelope of the user was fed
+    previous = {}
+
+    def feed(envelope, after):
+        payload = envelope["payload"]
+        try:
+            if after is not None:
+                after.wait(args.timeout)
+            flow_id = flow_of(payload)
+            if flow_id in started_flows and not wait_until(lambda: main.flow_store.get(flow_id), args.timeout):
+                stalled.append(envelope["envelope_id"])
+            approval_flow = approval_flow_of(payload)
+            if approval_flow in started_flows and not wait_until(lambda: main.journal.status(approval_flow),
+                                                                 args.timeout):
+                stalled.append(envelope["envelope_id"])
+            req = SocketModeRequest(type=envelope["type"], envelope_id=envelope["envelope_id"], payload=payload)
+            client = StandInSocketClient()
+            fed = time.perf_counter()
+            main.request_listener(client, req)
+            route = main.router.resolve(req)
+            if client.acked is None:
+                unacked.append(envelope["envelope_id"])
+            else:
+                acks.append((route.name if route else "unrouted", client.acked - fed))
+        except Exception as e:
+            failures.append(f"{envelope['envelope_id']}: {type(e).__name__} {e}")
+
+    executor = ThreadPoolExecutor(max_workers=args.listener_threads, thread_name_prefix="listener")
+    started = time.perf_counter()
+    for envelope in envelopes:
+        if args.speed:
+            delay = envelope["at"] / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        user = user_of(envelope["payload"])
+        done = threading.Event()
+        after = previous.get(user)
+        previous[user] = done
+        future = executor.submit(feed, envelope, after)
+        future.add_done_callback(lambda _, done=done: done.set())
+    executor.shutdown(wait=True)
+    fed = time.perf_counter() - started
+    # the work handed off to the workers and the Web API calls still queued
+    main.worker_pool.tasks.join()
+    wait_until(lambda: not main.web_client.stats()["ready"] and not main.web_client.stats()["delayed"], args.timeout)
+    elapsed = time.perf_counter() - started
+
+    report(args, main, envelopes, acks, unacked, failures, stalled, fed, elapsed)
+    return not failures
+
+
+def report(args, main, envelopes, acks, unacked, failures, stalled, fed, elapsed):
+    speed = f"{args.speed:g}x" if args.speed else "max speed"
+    print(f"{len(envelopes)} envelopes ({args.copies} copies of {args.recording}) at {speed}: fed in {fed:.1f} s "
+          f"({len(envelopes) / fed:.1f}/s), all the work done in {elapsed:.1f} s")
+    latencies = [seconds for _, seconds in acks]
+    print(f"ack latency ({len(acks)} acks, {len(unacked)} not acked): p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    for kind in sorted({kind for kind, _ in acks}):
+        kind_latencies = [seconds for item, seconds in acks if item == kind]
+        print(f"  {kind}: {len(kind_latencies)} acks, p50 {percentile(kind_latencies, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(kind_latencies, 0.99) * 1000:.1f} ms")
+
+    # the latencies of the handlers from the histograms of main.py (estimated within their buckets)
+    calls = {labels: value for name, labels, value in main.handler_seconds.samples() if name.endswith("_count")}
+    errors = {labels: value for _, labels, value in main.handler_errors.samples()}
+    print("handler latency (ms)             calls     p50     p95     p99   errors")
+    for labels, count in sorted(calls.items()):
+        handler = labels[0][1]
+        failed = errors.get(labels, 0)
+        quantiles = [main.handler_seconds.quantile(q, handler) * 1000 for q in (0.5, 0.95, 0.99)]
+        print(f"  {handler:<30} {count:>5} {quantiles[0]:>7.1f} {quantiles[1]:>7.1f} {quantiles[2]:>7.1f} "
+              f"{failed:>5} ({failed / count:.1%})")
+    wait = main.worker_wait_seconds
+    waits = [wait.quantile(0.95, *label_values) for label_values in wait.label_values()]
+    if waits:
+        print(f"worker queue wait p95 (worst handler): {max(waits) * 1000:.1f} ms")
+    print(f"errors reported to the log channel: {main.error_sink.reported}")
+    dropped = {labels[0][1]: value for _, labels, value in main.dropped_handlers.samples()}
+    if dropped:
+        print("handler calls dropped, the worker queue was full: " +
+              ", ".join(f"{handler} {count}" for handler, count in sorted(dropped.items())))
+    if stalled:
+        print(f"{len(stalled)} envelopes waited {args.timeout:g} s for a flow or request that never came")
+
+    for title, histogram, counter in (("AWS", main.aws_seconds, main.aws_errors),
+                                      ("Slack", main.slack_seconds, main.slack_errors)):
+        calls = {labels: value for name, labels, value in histogram.samples() if name.endswith("_count")}
+        failed = {}
+        for _, labels, value in counter.samples():
+            key = labels[:-1]
+            failed[key] = failed.get(key, 0) + value
+        if calls:
+            print(f"{title} calls: " + ", ".join(
+                f"{'.'.join(value for _, value in labels)} {count}" +
+                (f" ({failed[labels]} failed)" if failed.get(labels) else "")
+                for labels, count in sorted(calls.items())))
+    for failure in failures[:10]:
+        print(failure)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Replay recorded Socket Mode envelopes against local stand-ins")
+    parser.add_argument("recording", help="JSONL file written with RECORD_PATH (.gz for a compressed one)")
+    parser.add_argument("--speed", type=float, default=1, help="times faster than recorded, 0 for max speed")
+    parser.add_argument("--copies", type=int, default=1, help="copies of every recorded flow replayed together")
+    parser.add_argument("--listener-threads", type=int, default=10,
+                        help="threads running the listeners, like the Socket Mode client")
+    parser.add_argument("--inventory", type=int, default=1000, help="resources of each type")
+    parser.add_argument("--aws-latency", type=float, default=20, help="milliseconds of each AWS call")
+    parser.add_argument("--slack-latency", type=float, default=20, help="milliseconds of each Web API call")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the Slack rate limits of the bot")
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="seconds an envelope waits for the flow or request it belongs to")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if replay(parse_arguments()) else 1)
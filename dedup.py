@@ -0,0 +1,37 @@
+import time
+
+from sqlite_store import SQLiteConnections
+
+
+# The envelope ids already handled, in a SQLite (WAL) file shared by all the bot processes on the host.
+# Slack delivers an envelope again (with the same envelope id, possibly to another connection) when its ack is late,
+# the first process to claim it runs its handler. Ids older than ttl seconds are forgotten
+class EnvelopeDedup:
+    # expired ids are deleted once every purge_every claims
+    purge_every = 100
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.connections = SQLiteConnections(path)
+        self.claims = 0
+        self.duplicates = 0
+        self.connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS envelopes (envelope_id TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+        )
+
+    # True the first time an envelope id is claimed (or once it expired), False for a redelivery
+    def claim(self, envelope_id):
+        now = time.time()
+        connection = self.connections.get()
+        self.claims += 1
+        if self.claims % self.purge_every == 0:
+            connection.execute("DELETE FROM envelopes WHERE claimed_at <= ?", (now - self.ttl,))
+        cursor = connection.execute(
+            "INSERT INTO envelopes (envelope_id, claimed_at) VALUES (?, ?) "
+            "ON CONFLICT (envelope_id) DO UPDATE SET claimed_at = excluded.claimed_at WHERE claimed_at <= ?",
+            (envelope_id, now, now - self.ttl)
+        )
+        if cursor.rowcount == 0:
+            self.duplicates += 1
+            return False
+        return True
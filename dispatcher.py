@@ -0,0 +1,130 @@
+import time
+import traceback
+
+from slack_sdk.socket_mode.response import SocketModeResponse
+
+
+# A handler registered for one kind of request. The ack routes answer in the ack itself (the next page of the wizard,
+# the options of a block suggestion): handler(req) returns the payload of the ack. The other routes are acked
+# empty first and their handler runs in the background, with handler(req) for the slash commands and
+# handler(client, req) for the interactions
+class Route:
+    def __init__(self, name, handler, ack, with_client):
+        self.name = name
+        self.handler = handler
+        self.ack = ack
+        self.with_client = with_client
+
+    def arguments(self, client, req):
+        return (client, req) if self.with_client else (req,)
+
+
+# Routes each Socket Mode request to its handler with one dict lookup on (kind, slash command / callback_id /
+# action_id) and acks it exactly once, the requests without a route are acked empty.
+# respond(handler, req) calls the handler of an ack route and returns the payload of the ack (None for an empty ack),
+# ack_seconds is a histogram with a "route" label, observed from receiving each request to sending its ack.
+# claim(envelope_id) returns False for an envelope delivered again, its background handler already ran (the wizard
+# pages are answered again, the redelivery means Slack didn't get the first ack)
+class Dispatcher:
+    def __init__(self, respond, ack_seconds=None, claim=None):
+        self.respond = respond
+        self.ack_seconds = ack_seconds
+        self.claim = claim
+        # (kind, key): Route
+        self.routes = {}
+
+    def command(self, command, handler):
+        self._add("command", command, handler, ack=False, with_client=False)
+
+    # The next page of the wizard is returned in the ack of the submission
+    def view_submission(self, callback_id, handler, ack=True):
+        self._add("view_submission", callback_id, handler, ack=ack, with_client=True)
+
+    def action(self, action_id, handler):
+        self._add("action", action_id, handler, ack=False, with_client=True)
+
+    # Any block action of a view, for the actions without a route of their own
+    def view_action(self, callback_id, handler):
+        self._add("view_action", callback_id, handler, ack=False, with_client=True)
+
+    # The options of an external_select are returned in the ack of the suggestion
+    def suggestion(self, action_id, handler):
+        self._add("suggestion", action_id, handler, ack=True, with_client=False)
+
+    def _add(self, kind, key, handler, ack, with_client):
+        if (kind, key) in self.routes:
+            raise ValueError(f"{kind} {key} already has a route")
+        self.routes[(kind, key)] = Route(f"{kind}:{key}", handler, ack, with_client)
+
+    # The route of a request, None if nothing handles it
+    def resolve(self, req):
+        payload = req.payload
+        if req.type == "slash_commands":
+            return self.routes.get(("command", payload.get("command")))
+        if req.type != "interactive":
+            return None
+        kind = payload.get("type")
+        if kind == "block_actions":
+            actions = payload.get("actions") or [{}]
+            route = self.routes.get(("action", actions[0].get("action_id")))
+            if route is None and "view" in payload:
+                route = self.routes.get(("view_action", payload["view"].get("callback_id")))
+            return route
+        if kind == "block_suggestion":
+            return self.routes.get(("suggestion", payload.get("action_id")))
+        if kind == "view_submission":
+            return self.routes.get(("view_submission", payload["view"].get("callback_id")))
+        return None
+
+    # A malformed request is acked empty and dropped
+    def _resolve(self, req):
+        try:
+            return self.resolve(req)
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    # Whether the handler of a route acked empty runs, once per envelope when claim is set
+    def _runs(self, route, req):
+        if route is None or route.ack:
+            return False
+        return self.first_delivery(req)
+
+    # False when the envelope of req was already claimed. The handlers of the ack routes that start side effects
+    # (posting a message...) call it first: a redelivered envelope is answered again, its side effects run once
+    def first_delivery(self, req):
+        if self.claim is None:
+            return True
+        try:
+            return self.claim(req.envelope_id)
+        except Exception:
+            # the store is down, a duplicate run is better than none
+            traceback.print_exc()
+            return True
+
+    def _observe(self, route, received):
+        if self.ack_seconds is not None:
+            self.ack_seconds.observe(time.perf_counter() - received, route.name if route else "unrouted")
+
+    # The listener of the blocking Socket Mode client, run_in_background(handler, *args) runs the handlers of the
+    # routes acked empty after the ack
+    def handle(self, client, req, run_in_background):
+        received = time.perf_counter()
+        route = self._resolve(req)
+        payload = self.respond(route.handler, req) if route and route.ack else None
+        client.send_socket_mode_response(SocketModeResponse(envelope_id=req.envelope_id, payload=payload))
+        self._observe(route, received)
+        if self._runs(route, req):
+            run_in_background(route.handler, *route.arguments(client, req))
+
+    # The listener of the asyncio Socket Mode client: the ack routes are answered through
+    # run_blocking(function, *args) (a coroutine running it off the loop), run_in_background(handler, *args) is
+    # a coroutine too
+    async def handle_async(self, client, req, run_blocking, run_in_background):
+        received = time.perf_counter()
+        route = self._resolve(req)
+        payload = await run_blocking(self.respond, route.handler, req) if route and route.ack else None
+        await client.send_socket_mode_response(SocketModeResponse(envelope_id=req.envelope_id, payload=payload))
+        self._observe(route, received)
+        if route and not route.ack and await run_blocking(self._runs, route, req):
+            await run_in_background(route.handler, *route.arguments(client, req))
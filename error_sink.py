@@ -0,0 +1,86 @@
+import queue
+import re
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
+
+# Numbers, hex ids and quoted values change between repeats of the same error, they are masked in the fingerprint
+VOLATILE = re.compile(r"0x[0-9a-fA-F]+|\b[0-9a-f]{8,}\b|\d+|'[^']*'|\"[^\"]*\"")
+
+
+# Collects the errors reported by the handlers and posts them to the log channel from a background thread,
+# so a handler never waits on Slack to report an error. The errors with the same fingerprint
+# (where, exception type and message without its volatile parts) reported in the same window of
+# seconds are merged into one line with a count, and each window is posted in messages of up to max_lines lines
+class ErrorSink:
+    def __init__(self, post, window, max_lines, max_pending):
+        # post(text) sends a message to the log channel
+        self.post = post
+        self.window = window
+        self.max_lines = max_lines
+        self.errors = queue.Queue(maxsize=max_pending)
+        # the counters are updated by the handler threads and the sink thread
+        self.lock = threading.Lock()
+        self.reported = 0
+        # dropped_total only increases (for the metrics), dropped is reset each time the drops are posted
+        self.dropped_total = 0
+        self.dropped = 0
+
+    def start(self):
+        threading.Thread(target=self._run, name="error-sink", daemon=True).start()
+        return self
+
+    # Queue an error, where describes what was being done when it happened. Never blocks
+    def report(self, user_name, where, error):
+        with self.lock:
+            self.reported += 1
+        try:
+            self.errors.put_nowait((user_name, where, error))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+                self.dropped_total += 1
+
+    def _run(self):
+        while True:
+            # wait for the first error of the window, then collect the others until the window ends
+            batch = OrderedDict()
+            self._add(batch, self.errors.get())
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._add(batch, self.errors.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception:
+                traceback.print_exc()
+
+    def _add(self, batch, error):
+        user_name, where, exception = error
+        fingerprint = (where, type(exception).__name__, VOLATILE.sub("#", str(exception)))
+        entry = batch.get(fingerprint)
+        if entry is None:
+            batch[fingerprint] = entry = {"where": where, "error": exception, "users": [], "count": 0}
+        entry["count"] += 1
+        if user_name not in entry["users"]:
+            entry["users"].append(user_name)
+
+    def _flush(self, batch):
+        lines = []
+        for entry in batch.values():
+            count = f" (x{entry['count']})" if entry["count"] > 1 else ""
+            users = ", ".join(str(user) for user in entry["users"])
+            lines.append(f"{users} {entry['where']}{count} : ```{entry['error']}```")
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(f"{dropped} errors were dropped, too many errors were waiting to be posted")
+        for i in range(0, len(lines), self.max_lines):
+            self.post("*Exception Occurred!*\n" + "\n".join(lines[i:i + self.max_lines]))
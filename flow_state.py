@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from sqlite_store import SQLiteConnections
+
+
+# Keeps the flows in memory. Flows not updated for ttl seconds are expired,
+# and above max_flows the least recently used flows are evicted
+class MemoryBackend:
+    def __init__(self, max_flows, ttl):
+        self.max_flows = max_flows
+        self.ttl = ttl
+        # flow id: (last update time, state), least recently used first
+        self.flows = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, flow_id):
+        with self.lock:
+            return self._get(flow_id)
+
+    def set(self, flow_id, state):
+        with self.lock:
+            self._set(flow_id, state)
+
+    # Apply changes to the state of a flow, the lock is held from the read to the write
+    def merge(self, flow_id, changes):
+        with self.lock:
+            state = self._get(flow_id) or {}
+            state.update(changes)
+            self._set(flow_id, state)
+
+    # Must be called with self.lock held
+    def _get(self, flow_id):
+        entry = self.flows.get(flow_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.flows[flow_id]
+            return None
+        self.flows.move_to_end(flow_id)
+        return dict(entry[1])
+
+    # Must be called with self.lock held
+    def _set(self, flow_id, state):
+        self.flows[flow_id] = (time.monotonic(), dict(state))
+        self.flows.move_to_end(flow_id)
+        while len(self.flows) > self.max_flows:
+            self.flows.popitem(last=False)
+
+    def delete(self, flow_id):
+        with self.lock:
+            self.flows.pop(flow_id, None)
+
+    def __len__(self):
+        return len(self.flows)
+
+
+# Keeps the flows in a SQLite file, so all the bot processes on the host share them
+class SQLiteBackend:
+    # expired flows are deleted once every purge_every writes
+    purge_every = 100
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.connections = SQLiteConnections(path)
+        self.writes = 0
+        self.connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS flows (flow_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def get(self, flow_id):
+        return self._get(self.connections.get(), flow_id)
+
+    def set(self, flow_id, state):
+        self._set(self.connections.get(), flow_id, state)
+
+    # Apply changes to the state of a flow in one transaction, the other processes wait for it to write theirs
+    def merge(self, flow_id, changes):
+        with self.connections.transaction() as connection:
+            state = self._get(connection, flow_id) or {}
+            state.update(changes)
+            self._set(connection, flow_id, state)
+
+    def _get(self, connection, flow_id):
+        row = connection.execute(
+            "SELECT state FROM flows WHERE flow_id = ? AND updated_at > ?", (flow_id, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, connection, flow_id, state):
+        connection.execute(
+            "INSERT OR REPLACE INTO flows (flow_id, state, updated_at) VALUES (?, ?, ?)",
+            (flow_id, json.dumps(state), time.time())
+        )
+        self.writes += 1
+        if self.writes % self.purge_every == 0:
+            connection.execute("DELETE FROM flows WHERE updated_at <= ?", (time.time() - self.ttl,))
+
+    def delete(self, flow_id):
+        self.connections.get().execute("DELETE FROM flows WHERE flow_id = ?", (flow_id,))
+
+    def __len__(self):
+        return self.connections.get().execute(
+            "SELECT COUNT(*) FROM flows WHERE updated_at > ?", (time.time() - self.ttl,)
+        ).fetchone()[0]
+
+
+# The state of each /create_monitoring flow (requester, resource type...), keyed by a flow id.
+# The flow id is carried in the private_metadata of the views and in the approval buttons,
+# so concurrent flows never see each other's state
+class FlowStateStore:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # Create a new flow and return its id
+    def start(self, **state):
+        flow_id = uuid.uuid4().hex
+        self.backend.set(flow_id, state)
+        return flow_id
+
+    # The state of the flow, empty if the flow is unknown or expired
+    def get(self, flow_id):
+        if not flow_id:
+            return {}
+        return self.backend.get(flow_id) or {}
+
+    # Concurrent updates of the same flow (a page handler and a keystroke validation...) keep each other's changes
+    def update(self, flow_id, **changes):
+        self.backend.merge(flow_id, changes)
+
+    def end(self, flow_id):
+        if flow_id:
+            self.backend.delete(flow_id)
+
+    def __len__(self):
+        return len(self.backend)
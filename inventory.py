@@ -0,0 +1,149 @@
+import bisect
+import threading
+import time
+import traceback
+
+from collections import OrderedDict
+
+# Caches the resources list of each resource type.
+# A fresh entry (younger than ttl) is served from memory. A stale entry (younger than ttl + max_stale)
+# is still served, while a background thread reloads it. Only a missing or too old entry makes the caller
+# wait for the loader, and concurrent callers of the same resource type share one load.
+# Above max_entries (None for no limit) the least recently used entries are evicted
+class InventoryCache:
+    def __init__(self, loader, ttl, max_stale, max_entries=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        # resource type: (load time, resources list), least recently used first
+        self.entries = OrderedDict()
+        # resource type: lock held while the resource type is being loaded, dropped once the load is done
+        self.load_locks = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    def get(self, resource_type):
+        with self.lock:
+            resources = self._cached(resource_type)
+            if resources is not None:
+                self.hits += 1
+                return resources
+            self.misses += 1
+            load_lock = self.load_locks.setdefault(resource_type, threading.Lock())
+        try:
+            with load_lock:
+                # another caller may have loaded it while we waited for the lock
+                with self.lock:
+                    resources = self._cached(resource_type)
+                if resources is not None:
+                    return resources
+                return self._load(resource_type)
+        finally:
+            with self.lock:
+                if not load_lock.locked() and self.load_locks.get(resource_type) is load_lock:
+                    del self.load_locks[resource_type]
+
+    # The cached list of a resource type if it can be served, None instead of loading it
+    def peek(self, resource_type):
+        with self.lock:
+            return self._cached(resource_type)
+
+    # Drop the cached list of a resource type (or of all of them), the next get loads it again
+    def invalidate(self, resource_type=None):
+        with self.lock:
+            if resource_type is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(resource_type, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refresh_errors": self.refresh_errors,
+                "cached_types": len(self.entries)
+            }
+
+    # Return the cached list if it can be served, start a background refresh if it is stale.
+    # Must be called with self.lock held
+    def _cached(self, resource_type):
+        entry = self.entries.get(resource_type)
+        if entry is None:
+            return None
+        loaded_at, resources = entry
+        age = time.monotonic() - loaded_at
+        if age >= self.ttl + self.max_stale:
+            return None
+        self.entries.move_to_end(resource_type)
+        if age >= self.ttl:
+            self.stale_hits += 1
+            if resource_type not in self.refreshing:
+                self.refreshing.add(resource_type)
+                threading.Thread(target=self._refresh, args=(resource_type,), daemon=True).start()
+        return resources
+
+    def _load(self, resource_type):
+        resources = self.loader(resource_type)
+        with self.lock:
+            self.entries[resource_type] = (time.monotonic(), resources)
+            self.entries.move_to_end(resource_type)
+            while self.max_entries is not None and len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return resources
+
+    def _refresh(self, resource_type):
+        try:
+            self._load(resource_type)
+        except Exception:
+            # keep serving the stale list, the next stale hit will try again
+            traceback.print_exc()
+            with self.lock:
+                self.refresh_errors += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(resource_type)
+
+
+# The options of one resource type indexed for the external_select search.
+# Prefix matches are found with a binary search on the sorted names, substring matches with a scan
+class ResourceIndex:
+    # full_names is the name of the options (by value) whose text was shortened, they are searched by their full name
+    def __init__(self, options, full_names=None):
+        self.full_names = full_names or {}
+        self.options = sorted(options, key=lambda option: self._name(option).lower())
+        self.names = [self._name(option).lower() for option in self.options]
+
+    def __len__(self):
+        return len(self.options)
+
+    def _name(self, option):
+        return self.full_names.get(option["value"], option["text"]["text"])
+
+    # The full name of a shortened option, None if the option text is the whole name (or isn't in the index)
+    def full_name(self, value):
+        return self.full_names.get(value)
+
+    # Return up to limit options, the ones starting with the query first and then the ones containing it
+    def search(self, query, limit):
+        query = query.strip().lower()
+        if not query:
+            return self.options[:limit]
+        start = bisect.bisect_left(self.names, query)
+        end = start
+        while end < len(self.names) and end - start < limit and self.names[end].startswith(query):
+            end += 1
+        matches = self.options[start:end]
+        if len(matches) < limit:
+            for name, option in zip(self.names, self.options):
+                if query in name and not name.startswith(query):
+                    matches.append(option)
+                    if len(matches) == limit:
+                        break
+        return matches
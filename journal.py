@@ -0,0 +1,131 @@
+import json
+import time
+
+from sqlite_store import SQLiteConnections
+from approval_payload import resources_label
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS requests (
+        request_id TEXT PRIMARY KEY,
+        requester_id TEXT,
+        requester_name TEXT,
+        resource_type TEXT,
+        resource_name TEXT,
+        resource_id TEXT,
+        status TEXT NOT NULL,
+        request TEXT NOT NULL,
+        channel_id TEXT,
+        message_ts TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        actor TEXT,
+        detail TEXT,
+        created_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS requests_requester ON requests (requester_id)",
+    "CREATE INDEX IF NOT EXISTS requests_resource ON requests (resource_id)",
+    "CREATE INDEX IF NOT EXISTS requests_status ON requests (status)",
+    "CREATE INDEX IF NOT EXISTS events_request ON events (request_id)"
+]
+
+# The status of a request: pending -> approved -> created/failed, or pending -> rejected
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+CREATED = "created"
+FAILED = "failed"
+
+
+# A durable record of every approval request and what happened to it, in a SQLite (WAL) file.
+# The request id is the flow id, so recording the same request twice is a no-op,
+# and a status change only happens once even if the same click is delivered twice
+class ApprovalJournal:
+    def __init__(self, path):
+        self.connections = SQLiteConnections(path)
+        connection = self.connections.get()
+        for statement in SCHEMA:
+            connection.execute(statement)
+
+    # Record a new pending request, returns False if it was already recorded.
+    # A bulk request has no resource id, its resources are in the request column
+    def record_request(self, request, channel_id, message_ts):
+        now = time.time()
+        resources = request["resources"]
+        resource_id = resources[0][1] if len(resources) == 1 else None
+        with self.connections.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO requests (request_id, requester_id, requester_name, resource_type, resource_name, "
+                "resource_id, status, request, channel_id, message_ts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (request["flow_id"], request["requester_id"], request["requester_name"], request["resource_type"],
+                 resources_label(request), resource_id, PENDING, json.dumps(request), channel_id,
+                 message_ts, now, now)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._event(connection, request["flow_id"], "requested", request["requester_id"], None)
+        return True
+
+    # Move a request from one of from_statuses to status, returns False if the request isn't in
+    # one of them (already handled by someone else, or a duplicate delivery of the same click)
+    def transition(self, request_id, status, actor=None, detail=None, from_statuses=(PENDING,)):
+        with self.connections.transaction() as connection:
+            return self._transition(connection, request_id, status, actor, detail, from_statuses)
+
+    # Record the result of each alarm of an approved request, results are (alarm name, error or None)
+    def record_alarm_results(self, request_id, results):
+        now = time.time()
+        status = CREATED if all(error is None for _, error in results) else FAILED
+        with self.connections.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO events (request_id, event, actor, detail, created_at) VALUES (?, ?, NULL, ?, ?)",
+                [(request_id, "alarm_created" if error is None else "alarm_failed",
+                  json.dumps({"alarm": name, "error": error}), now) for name, error in results]
+            )
+            self._transition(connection, request_id, status, None, None, (APPROVED,))
+
+    def _transition(self, connection, request_id, status, actor, detail, from_statuses):
+        placeholders = ", ".join("?" for _ in from_statuses)
+        cursor = connection.execute(
+            f"UPDATE requests SET status = ?, updated_at = ? WHERE request_id = ? AND status IN ({placeholders})",
+            (status, time.time(), request_id, *from_statuses)
+        )
+        if cursor.rowcount == 0:
+            return False
+        self._event(connection, request_id, status, actor, detail)
+        return True
+
+    # The status of a request, None if it wasn't recorded
+    def status(self, request_id):
+        row = self.connections.get().execute(
+            "SELECT status FROM requests WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    # The request recorded under an id, None if it wasn't recorded
+    def request(self, request_id):
+        row = self.connections.get().execute(
+            "SELECT request FROM requests WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # The requests still waiting for an approval (or approved but without alarm results), oldest first
+    def unfinished(self):
+        rows = self.connections.get().execute(
+            "SELECT request, status, channel_id, message_ts FROM requests WHERE status IN (?, ?) ORDER BY created_at",
+            (PENDING, APPROVED)
+        ).fetchall()
+        return [{"request": json.loads(request), "status": status, "channel_id": channel_id,
+                 "message_ts": message_ts}
+                for request, status, channel_id, message_ts in rows]
+
+    def _event(self, connection, request_id, event, actor, detail):
+        connection.execute(
+            "INSERT INTO events (request_id, event, actor, detail, created_at) VALUES (?, ?, ?, ?, ?)",
+            (request_id, event, actor, detail, time.time())
+        )
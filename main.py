@@ -1,41 +1,356 @@
+# imported first, the startup time is measured from the first import
+from startup import StartupTimer
+import importlib
 import os
+import time
 import traceback
-import boto3
 
 from dotenv import load_dotenv
 from slack_sdk.web import WebClient
+from slack_sdk.errors import SlackApiError
 from slack_sdk.socket_mode import SocketModeClient
-from slack_sdk.socket_mode.response import SocketModeResponse
 from slack_sdk.socket_mode.request import SocketModeRequest
-from threading import Event
+from threading import Event, Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
 from variables import *
+from inventory import InventoryCache, ResourceIndex
+from worker_pool import WorkerPool
+from aws_clients import ClientRegistry, Target, parse_targets
+from alarms import AlarmWriter, results_summary
+from alarm_index import AlarmIndex, CREATE, UPDATE, UNCHANGED
+from flow_state import FlowStateStore, MemoryBackend, SQLiteBackend
+from approval_payload import encode_request, encode_reference, decode_request, resources_label
+from journal import ApprovalJournal, APPROVED, REJECTED, FAILED
+from error_sink import ErrorSink
+from slack_queue import OutboundQueue
+from metrics import MetricsRegistry
+from recorder import EnvelopeRecorder
+from dispatcher import Dispatcher
+from dedup import EnvelopeDedup
+from threshold_store import ThresholdStatisticsStore
+import templates
+
+# The duration of each startup phase, reported once the bot is connected and warmed up
+startup_timer = StartupTimer()
+startup_timer.mark("imports")
 
 # Load the .env file to get the environment variables
 load_dotenv()
 
-try:
-    web_client = WebClient(token=os.environ["SLACK_BOT_TOKEN"])
-    # Initialize SocketModeClient with an app-level token + WebClient
-    client = SocketModeClient(
-        # This app-level token will be used only for establishing a connection
-        app_token=os.environ["SLACK_APP_TOKEN"],
-        # You will be using this WebClient for performing Web API calls in listeners
-        web_client=web_client)
+# The metrics of the bot in the Prometheus format, served on METRICS_HOST:METRICS_PORT/metrics by start()
+metrics = MetricsRegistry()
+ack_seconds = metrics.histogram("slackapp_ack_seconds",
+                                "Seconds from receiving a Socket Mode request to sending its ack", ["route"])
+handler_seconds = metrics.histogram("slackapp_handler_seconds", "Seconds spent in each handler", ["handler"])
+handler_errors = metrics.counter("slackapp_handler_errors_total", "Handler calls that raised", ["handler"])
+worker_wait_seconds = metrics.histogram("slackapp_worker_queue_wait_seconds",
+                                        "Seconds a handler call waited for a free worker", ["handler"])
+dropped_handlers = metrics.counter("slackapp_dropped_handlers_total",
+                                   "Handler calls dropped because the worker queue was full", ["handler"])
+aws_seconds = metrics.histogram("slackapp_aws_call_seconds",
+                                "Seconds of each AWS operation, retries included", ["service", "operation"])
+aws_errors = metrics.counter("slackapp_aws_errors_total", "AWS operations that failed",
+                             ["service", "operation", "error"])
+slack_seconds = metrics.histogram("slackapp_slack_call_seconds", "Seconds Slack took to answer each Web API call",
+                                  ["method"])
+slack_wait_seconds = metrics.histogram("slackapp_slack_queue_wait_seconds",
+                                       "Seconds a Web API call waited in the outbound queue (rate limits included)",
+                                       ["method"])
+invalid_inputs = metrics.counter("slackapp_invalid_inputs_total",
+                                 "Inputs of the third page submitted with an error, by alert parameter", ["parameter"])
+slack_errors = metrics.counter("slackapp_slack_errors_total", "Web API calls answered with an error",
+                               ["method", "error"])
+
+
+# Time the Web API calls sent by the outbound queue
+def record_slack_call(method, waited, seconds, error):
+    slack_wait_seconds.observe(waited, method)
+    slack_seconds.observe(seconds, method)
+    if error:
+        slack_errors.inc(method, error)
+
+
+# The operation is kept in the context of the call by before-call, after-call-error doesn't get the operation model
+def _aws_call_started(model, context, **kwargs):
+    context["metrics_call"] = (model.service_model.service_name, model.name, time.perf_counter())
+
+
+def _aws_call_finished(context, http_response=None, exception=None, **kwargs):
+    call = context.pop("metrics_call", None)
+    if call is None:
+        return
+    service, operation, started = call
+    aws_seconds.observe(time.perf_counter() - started, service, operation)
+    if exception is not None:
+        aws_errors.inc(service, operation, type(exception).__name__)
+    elif http_response is not None and http_response.status_code >= 300:
+        aws_errors.inc(service, operation, str(http_response.status_code))
+
+
+# Time every AWS operation (each page of a paginator is one operation) with the botocore events of the client
+def instrument_aws_client(client):
+    client.meta.events.register("before-call", _aws_call_started)
+    client.meta.events.register("after-call", _aws_call_finished)
+    client.meta.events.register("after-call-error", _aws_call_finished)
+
+
+# The Web API base URL, another URL only for the local Slack stand-in of benchmarks/bench_e2e.py
+SLACK_API_URL = os.environ.get("SLACK_API_URL", WebClient.BASE_URL)
 
+try:
+    slack_web_client = WebClient(token=os.environ["SLACK_BOT_TOKEN"], base_url=SLACK_API_URL)
+    # The handlers send their Web API calls through a rate limited queue, modal operations first
+    # and the log channel messages last, started by start()
+    web_client = OutboundQueue(
+        slack_web_client,
+        senders=int(os.environ.get("SLACK_SENDERS", 4)),
+        background_channels=['C078BQGN1BP'],
+        on_call=record_slack_call
+    )
 except Exception:
     traceback.print_exc()
 
+# The region of the default credentials. The resources of the other targets carry their target in their option value
+DEFAULT_REGION = 'us-east-1'
+# The regions and accounts (assumed roles) the resources are listed from and the alarms created in,
+# a comma separated list of region or region@role-arn, each can end with #topic-arn (the SNS topic of its alarms)
+aws_targets = parse_targets(os.environ.get("AWS_TARGETS", DEFAULT_REGION))
+targets_by_key = {target.key: target for target in aws_targets}
+DEFAULT_TARGET = targets_by_key.get(DEFAULT_REGION, Target(DEFAULT_REGION))
+# The targets are described concurrently, with at most AWS_FANOUT_CONCURRENCY describe calls at once for the process
+inventory_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("AWS_FANOUT_CONCURRENCY", 8)),
+    thread_name_prefix="inventory"
+)
+# With several targets, the text of a resource option ends with its target: "<name> · <target key>"
+TARGET_SEPARATOR = " · "
+# Slack limits the text of an option to 75 characters, a longer resource name is shortened in its option
+OPTION_TEXT_LENGTH = 75
+
 try:
-    aws_session = boto3.Session(region_name='us-east-1')
+    # The AWS clients are created once and shared by all the handlers
+    aws_clients = ClientRegistry(
+        region=DEFAULT_REGION,
+        max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 50)),
+        max_attempts=int(os.environ.get("AWS_MAX_ATTEMPTS", 10)),
+        on_client=instrument_aws_client
+    )
 except Exception:
     traceback.print_exc()
 
-user_name = None
+# Creates the alarms of the approved requests in parallel, retrying throttled calls
+alarm_writer = AlarmWriter(
+    max_workers=int(os.environ.get("ALARM_CONCURRENCY", 10)),
+    max_retries=int(os.environ.get("ALARM_MAX_RETRIES", 5)),
+    base_delay=float(os.environ.get("ALARM_RETRY_BASE_DELAY", 0.5)),
+    max_delay=float(os.environ.get("ALARM_RETRY_MAX_DELAY", 20))
+)
+# The maximum number of resources of a bulk request
+BULK_MAX_RESOURCES = int(os.environ.get("BULK_MAX_RESOURCES", 200))
+# The minimum seconds between two updates of the progress message of a bulk request
+PROGRESS_INTERVAL = float(os.environ.get("PROGRESS_INTERVAL", 3))
+# The days of metric data the alarms of a request are replayed against before the approval,
+# requests of more alarms aren't replayed
+BACKTEST_DAYS = int(os.environ.get("BACKTEST_DAYS", 14))
+BACKTEST_MAX_ALARMS = int(os.environ.get("BACKTEST_MAX_ALARMS", 50))
+# The maximum number of alarm periods replayed at once (alarms x periods in BACKTEST_DAYS), about 8 bytes of memory
+# each for the metric values and as much again for the states
+BACKTEST_MAX_CELLS = int(os.environ.get("BACKTEST_MAX_CELLS", 2000000))
+
+# The existing alarms of each target (by target key), the approval message shows what the request creates/updates
+# and the unchanged alarms aren't put again
+ALARM_INDEX_TTL = int(os.environ.get("ALARM_INDEX_TTL", 900))
+alarm_indexes = {}
+alarm_indexes_lock = Lock()
+
+
+def alarm_index_of(target):
+    with alarm_indexes_lock:
+        index = alarm_indexes.get(target.key)
+        if index is None:
+            index = alarm_indexes[target.key] = AlarmIndex(ttl=ALARM_INDEX_TTL)
+    return index
+
+# The maximum number of alarms listed in the changes of the approval message, the others are counted
+LISTED_CHANGES = 20
+# Slack rejects a section text longer than 3000 characters, the changes are listed up to this length
+# and each listed alarm on one line of up to CHANGE_LINE_LENGTH characters
+SECTION_TEXT_LENGTH = 3000
+CHANGE_LINE_LENGTH = 300
+
+# The services used by the handlers, their clients are created at startup
+aws_services = ['elbv2', 'ec2', 'rds', 'cloudwatch']
+
+# The pool that runs the handlers after the listeners acked the request, started by start()
+worker_pool = WorkerPool(
+    size=int(os.environ.get("WORKER_POOL_SIZE", 8)),
+    queue_depth=int(os.environ.get("WORKER_QUEUE_DEPTH", 100))
+)
+
+# The state of each flow (requester, resource type...), shared across processes with the sqlite backend
+if os.environ.get("FLOW_STATE_BACKEND", "memory") == "sqlite":
+    flow_backend = SQLiteBackend(
+        path=os.environ.get("FLOW_STATE_PATH", "flow_state.db"),
+        ttl=int(os.environ.get("FLOW_STATE_TTL", 604800))
+    )
+else:
+    flow_backend = MemoryBackend(
+        max_flows=int(os.environ.get("FLOW_STATE_MAX_FLOWS", 10000)),
+        ttl=int(os.environ.get("FLOW_STATE_TTL", 604800))
+    )
+flow_store = FlowStateStore(flow_backend)
+
+
+# Post a message to the log channel
+def post_to_log_channel(text):
+    web_client.chat_postMessage(channel='C078BQGN1BP', text=text)
+
+
+# The errors are posted to the log channel in the background, merged and batched
+error_sink = ErrorSink(
+    post_to_log_channel,
+    window=float(os.environ.get("ERROR_WINDOW", 10)),
+    max_lines=int(os.environ.get("ERROR_MAX_LINES", 20)),
+    max_pending=int(os.environ.get("ERROR_MAX_PENDING", 1000))
+)
+
+
+# Every approval request and what happened to it, kept across restarts
+journal = ApprovalJournal(os.environ.get("JOURNAL_PATH", "journal.db"))
+# The unfinished requests of the journal are replayed at startup, supervisor.py replays them in its first worker only
+REPLAY_JOURNAL = os.environ.get("REPLAY_JOURNAL", "1") == "1"
+# The envelopes already handled by the bot processes of the host, a redelivered envelope runs its handler once
+dedup = EnvelopeDedup(os.environ.get("DEDUP_PATH", "dedup.db"), ttl=int(os.environ.get("DEDUP_TTL", 3600)))
+
+# The state of the queues and caches, read when the metrics are scraped
+metrics.gauge("slackapp_flows_in_flight", "Flows in the flow store (started and not finished or expired)",
+              lambda: len(flow_store))
+metrics.gauge("slackapp_worker_queue_depth", "Handler calls waiting for a free worker", lambda: worker_pool.depth())
+metrics.gauge("slackapp_slack_queue_depth", "Web API calls waiting in the outbound queue",
+              lambda: {"ready": web_client.stats()["ready"], "delayed": web_client.stats()["delayed"]}, ["state"])
+metrics.gauge("slackapp_slack_rate_limited_total", "Web API calls answered with 429 and retried",
+              lambda: web_client.rate_limited, kind="counter")
+metrics.gauge("slackapp_inventory_lookups_total", "Resources list lookups of the inventory cache, by result",
+              lambda: {result: inventory_cache.stats()[result] for result in ("hits", "stale_hits", "misses")},
+              ["result"], kind="counter")
+metrics.gauge("slackapp_errors_reported_total", "Errors reported by the handlers to the log channel",
+              lambda: error_sink.reported, kind="counter")
+metrics.gauge("slackapp_duplicate_envelopes_total", "Envelopes delivered again whose handler already ran",
+              lambda: dedup.duplicates, kind="counter")
+metrics.gauge("slackapp_startup_seconds", "Seconds of each startup phase", lambda: startup_timer.seconds(), ["phase"])
+metrics.gauge("slackapp_errors_dropped_total", "Errors not posted to the log channel because too many were pending",
+              lambda: error_sink.dropped_total, kind="counter")
+
+
+# Every envelope received is written to RECORD_PATH with the secrets and the users redacted when it is set,
+# to be replayed by benchmarks/replay.py
+recorder = EnvelopeRecorder(os.environ["RECORD_PATH"], admins) if os.environ.get("RECORD_PATH") else None
+
+
+def record_listener(client: SocketModeClient, req: SocketModeRequest):
+    try:
+        recorder.record(req)
+    except Exception:
+        traceback.print_exc()
+
+
+# Load the unfinished requests of the journal back into the flow store after a restart,
+# so requests too big for their buttons (kept by reference) can still be approved
+def replay_journal():
+    started = time.perf_counter()
+    replayed = 0
+    interrupted = []
+    for item in journal.unfinished():
+        request = item["request"]
+        if item["status"] == APPROVED:
+            # the process stopped while the alarms were being created
+            interrupted.append(request)
+            continue
+        # skip the requests that are already in the (shared) flow store
+        if flow_store.get(request["flow_id"]).get("request"):
+            continue
+        flow_store.update(request["flow_id"], request=request, user_name=request["requester_name"])
+        replayed += 1
+    print(f"Replayed {replayed} pending requests from the journal in {(time.perf_counter() - started) * 1000:.1f}ms")
+    if interrupted:
+        web_client.chat_postMessage(
+            channel='C078BQGN1BP',
+            text=f"*Interrupted alarms creation!*\nThe alarms of these approved requests may be incomplete: "
+                 f"{', '.join(resources_label(request) for request in interrupted)}"
+        )
+        # reported once, the next starts don't report them again
+        for request in interrupted:
+            journal.transition(request["flow_id"], FAILED, detail="interrupted", from_statuses=(APPROVED,))
+
+
+# The id of the flow a view submission belongs to, it's kept in the private_metadata of the wizard views
+def flow_id_of(req: SocketModeRequest):
+    if "view" in req.payload:
+        return req.payload["view"].get("private_metadata")
+    return None
+
+
+# The value carried by the approve/reject buttons: the whole approval request when it fits,
+# otherwise a reference to the request kept in the flow store
+def approval_value(request):
+    value = encode_request(request)
+    if value is None:
+        flow_store.update(request["flow_id"], request=request)
+        value = encode_reference(request["flow_id"])
+    return value
+
+
+# Decode the approval request from the value of a button (or the private_metadata of the rejection view).
+# A reference is looked up in the flow store, then in the journal (the journal may not be replayed yet)
+def approval_request_of(value):
+    return decode_request(value, lambda flow_id: flow_store.get(flow_id).get("request") or journal.request(flow_id))
+
+
+# Move a pending approval request to status (approved or rejected) for the click of actor, False if it was already
+# handled. A request missing from the journal (its buttons were posted before the journal, or recording it failed)
+# is recorded on its first click
+def decide_request(req: SocketModeRequest, request, status, actor):
+    if journal.status(request["flow_id"]) is None:
+        print(f"Request {request['flow_id']} isn't in the journal, recording it")
+        journal.record_request(request, req.payload['channel']['id'], req.payload['message']['ts'])
+    return journal.transition(request["flow_id"], status, actor=actor)
+
+
+# A page of the creation wizard, the flow id is kept in the private_metadata of every page
+def wizard_view(callback_id, flow_id, blocks, submit_text="Next"):
+    return {
+        "type": "modal",
+        "callback_id": callback_id,
+        "private_metadata": flow_id,
+        "title": {
+            "type": "plain_text",
+            "text": "New Monitoring Creation"
+        },
+        "submit": {
+            "type": "plain_text",
+            "text": submit_text
+        },
+        "blocks": blocks
+    }
+
+
+# Update an open view unless it changed since view_hash (the user already moved on),
+# returns False when the view wasn't updated because of the hash
+def update_view(view_id, view_hash, view):
+    try:
+        web_client.views_update(view_id=view_id, hash=view_hash, view=view)
+    except SlackApiError as e:
+        if e.response.get("error") == "hash_conflict":
+            return False
+        raise
+    return True
+
 
 # the path /create_monitoring will trigger the new_create_monitoring function
 def new_create_monitoring(req: SocketModeRequest):
-    global user_name
     user_name = req.payload['user_name']
+    # every /create_monitoring starts its own flow
+    flow_id = flow_store.start(user_name=user_name, user_id=req.payload['user_id'])
 
     web_client.chat_postMessage(
         channel='C078BQGN1BP',
@@ -43,152 +358,390 @@ def new_create_monitoring(req: SocketModeRequest):
     )
 
 
-    # Get all the available resources from the variables.py file
-    resources_options = [{"text": {"type": "plain_text", "text": key}, "value": key} for key in resources.keys()]
-    # creating the block for the dropdown
-    blocks = [
-        {
-            "type": "input",
-            "block_id": "resources-dropdown",
-            "dispatch_action": True,
-            "element": {
-                "type": "static_select",
-                "placeholder": {
-                    "type": "plain_text",
-                    "text": "Select a resource type to monitor"
-                },
-                "options": resources_options,
-                "action_id": "resources_options_action"
-            },
-            "label": {
-                "type": "plain_text",
-                "text": "Select the resource type to monitor"
-            }
-        }
-    ]
-    # Open the modal/form
+    # the blocks of the first page are built once in templates.py
+    blocks = templates.first_page_blocks()
+    # Open the modal/form, the next pages replace this view
     try:
         web_client.views_open(
             trigger_id=req.payload["trigger_id"],
-            view={
-                "type": "modal",
-                "callback_id": "resource_first_page",
-                "title": {
-                    "type": "plain_text",
-                    "text": "New Monitoring Creation"
-                },
-                "submit": {
-                    "type": "plain_text",
-                    "text": "Next"
-                },
-                "blocks": blocks
-            }
+            view=wizard_view("resource_first_page", flow_id, blocks)
         )
     except Exception as e:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened during opening the new monitoring view : ```{e}```"
-        )
+        error_sink.report(user_name, "Happened during opening the new monitoring view", e)
+
+
+# Hand a handler call to the worker pool, the request was already acked by the listener.
+# Returns False when the call was dropped
+def dispatch(handler, *args):
+    if not worker_pool.submit(timed_handler, handler, time.perf_counter(), *args):
+        dropped_handlers.inc(handler.__name__)
+        print(f"Worker queue is full, dropping {handler.__name__}")
+        error_sink.report(None, f"Dropped `{handler.__name__}`, the worker queue is full",
+                          f"{worker_pool.depth()} requests are waiting for a free worker")
+        return False
+    return True
 
 
-# Handle the path/workflow to process
-def pathe_to_process(client: SocketModeClient, req: SocketModeRequest):
-    # Send the acknowledgment response
-    response = SocketModeResponse(envelope_id=req.envelope_id)
-    client.send_socket_mode_response(response)
-    # choose the path/workflow to process
-    if req.payload.get("command") == "/create_monitoring":
-        new_create_monitoring(req)
+# Run a handler queued at the perf_counter() time queued, its wait for a worker and its run time are measured
+def timed_handler(handler, queued, *args):
+    worker_wait_seconds.observe(time.perf_counter() - queued, handler.__name__)
+    try:
+        with handler_seconds.timer(handler.__name__):
+            handler(*args)
+    except Exception:
+        handler_errors.inc(handler.__name__)
+        raise
+
 
+# The option value of a resource: its id/arn, prefixed with "<target key>|" unless it is in the default target
+def resource_value(target, resource_id_arn):
+    if target == DEFAULT_TARGET:
+        return resource_id_arn
+    return f"{target.key}|{resource_id_arn}"
 
-# Get the list of resources names/IDs by the resource type
-def resource_list_names(resource_type):
+
+# The target and the id/arn of a resource option value
+def resource_target(value):
+    if "|" not in value:
+        return DEFAULT_TARGET, value
+    key, resource_id_arn = value.split("|", 1)
+    if key not in targets_by_key:
+        raise ValueError(f"The AWS target {key} isn't in AWS_TARGETS anymore")
+    return targets_by_key[key], resource_id_arn
+
+
+# The resources ([name, option value]) grouped by target, {target: [[name, id/arn], ...]}
+def resources_by_target(resources):
+    groups = {}
+    for resource_name, value in resources:
+        target, resource_id_arn = resource_target(value)
+        groups.setdefault(target, []).append([resource_name, resource_id_arn])
+    return groups
+
+
+# Describe all the resources of a resource type in a target (every page of the describe call),
+# returns (identity, name, id/arn) of each resource. The identity is the same for a resource listed by two targets
+def describe_target_resources(resource_type, target):
+    resources = []
     if resource_type == 'AWS/ApplicationELB':
-        TG_names = []
-        try:
-            response = aws_session.client('elbv2').describe_target_groups()
+        for response in aws_clients.target_client('elbv2', target).get_paginator('describe_target_groups').paginate():
             for tg in response['TargetGroups']:
                 if tg['Protocol'] in ['HTTP', 'HTTPS']:
-                    TG_names.append({
-                        "text": {
-                            "type": "plain_text",
-                            "text": tg["TargetGroupName"]
-                        },
-                        "value": tg["TargetGroupArn"]
-                    })
-        except Exception as e:
-            print(e)
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Received An Error for describe tgs: ```{e}```"
-            )
-            return
-        return TG_names
+                    # the arn holds the account and the region
+                    resources.append((tg["TargetGroupArn"], tg["TargetGroupName"], tg["TargetGroupArn"]))
     elif resource_type == "AWS/EC2":
-        EC2_IDs = []
-        try:
-            instances = aws_session.client('ec2').describe_instances()
-            for instance in instances['Reservations']:
-                if instance['Instances'][0]['State']['Name'] == 'running':
-                    EC2_IDs.append({
-                        "text": {
-                            "type": "plain_text",
-                            "text": instance['Instances'][0]['InstanceId']
-                        },
-                        "value": instance['Instances'][0]['InstanceId']
-                    })
-        except Exception as e:
-            print(e)
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened during creation of EC2_IDs list : ```{e}```"
-            )
-            return
-        return EC2_IDs
+        for response in aws_clients.target_client('ec2', target).get_paginator('describe_instances').paginate():
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    if instance['State']['Name'] == 'running':
+                        resources.append(((target.account, target.region, instance['InstanceId']),
+                                          instance['InstanceId'], instance['InstanceId']))
     elif resource_type == "AWS/RDS":
-        RDS_names = []
+        for rds in aws_clients.target_client('rds', target).get_paginator('describe_db_instances').paginate():
+            for name in rds["DBInstances"]:
+                resources.append(((target.account, target.region, name["DBInstanceIdentifier"]),
+                                  name["DBInstanceIdentifier"], name["DBInstanceIdentifier"]))
+    else:
+        raise ValueError(f"Unknown resource type {resource_type}")
+    return resources
+
+
+# Describe all the resources of a resource type in every target concurrently and index the dropdown options
+# built from them for the resource name search. A target that fails is reported and left out,
+# the describe fails only when every target failed
+def describe_resources(resource_type):
+    futures = [(target, inventory_executor.submit(describe_target_resources, resource_type, target))
+               for target in aws_targets]
+    options = []
+    # option value: the full name of the resources shortened in their option
+    full_names = {}
+    seen = set()
+    errors = []
+    for target, future in futures:
         try:
-            rds = aws_session.client('rds').describe_db_instances()
+            resources = future.result()
         except Exception as e:
-            print(e)
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened during creation of RDS_names list : ```{e}```"
-            )
-            return
-        for name in rds["DBInstances"]:
-            RDS_names.append({
+            traceback.print_exc()
+            errors.append(e)
+            error_sink.report(None, f"Happened while describing the {resource_type} resources of {target.key}", e)
+            continue
+        for identity, name, resource_id_arn in resources:
+            if identity in seen:
+                continue
+            seen.add(identity)
+            value = resource_value(target, resource_id_arn)
+            text = option_text(name, target)
+            if not text.startswith(name):
+                full_names[value] = name
+            options.append({
                 "text": {
                     "type": "plain_text",
-                    "text": name["DBInstanceIdentifier"]
+                    "text": text
                 },
-                "value": name["DBInstanceIdentifier"]
+                "value": value
             })
-        return RDS_names
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    return ResourceIndex(options, full_names)
+
+
+# The text of a resource option, the name followed by the target with several targets. A name too long for the
+# option is shortened, the target is always whole
+def option_text(name, target):
+    suffix = "" if len(aws_targets) == 1 else f"{TARGET_SEPARATOR}{target.key}"
+    if len(name) + len(suffix) > OPTION_TEXT_LENGTH:
+        name = name[:OPTION_TEXT_LENGTH - len(suffix) - 1] + "…"
+    return name + suffix
+
+
+# The resources ([name, option value]) with the full names of the ones shortened in their option text,
+# the alarms are named after the full names
+def full_resource_names(resource_type, resources):
+    index = inventory_cache.get(resource_type)
+    named = []
+    for resource_name, value in resources:
+        full_name = index.full_name(value)
+        if full_name is None and resource_name.endswith("…"):
+            raise ValueError(f"The {resource_type} resource {resource_name} isn't listed anymore")
+        named.append([full_name or resource_name, value])
+    return named
+
+
+# The resources lists are cached per resource type, stale lists are refreshed in the background
+inventory_cache = InventoryCache(
+    describe_resources,
+    ttl=int(os.environ.get("INVENTORY_TTL", 300)),
+    max_stale=int(os.environ.get("INVENTORY_MAX_STALE", 3600))
+)
+
+
+# The maximum number of options returned for each keystroke in the resource name dropdown, slack allows up to 100
+SUGGESTION_LIMIT = int(os.environ.get("SUGGESTION_LIMIT", 50))
+
+# The thresholds of the third page are suggested from the metric data of the last THRESHOLD_DAYS days,
+# the mean plus THRESHOLD_SIGMAS standard deviations is one of the statistics
+THRESHOLD_DAYS = int(os.environ.get("THRESHOLD_DAYS", 14))
+THRESHOLD_SIGMAS = float(os.environ.get("THRESHOLD_SIGMAS", 3))
+# The maximum number of resources of a bulk request the thresholds are suggested from
+THRESHOLD_MAX_RESOURCES = int(os.environ.get("THRESHOLD_MAX_RESOURCES", 10))
+
+
+# The threshold statistics of each metric of a resource, key is (resource type, resource id/arn)
+def load_threshold_statistics(key):
+    # numpy is imported by the first statistics (or the warm-up of start()), not at startup
+    from thresholds import metric_statistics
+    resource_type, value = key
+    target, resource_id_arn = resource_target(value)
+    dimensions = alarm_dimensions(resource_type, resource_id_arn)
+    resource_metrics = {metric: dimensions for metric_dict in resources[resource_type] for metric in metric_dict}
+    return metric_statistics(aws_clients.target_client('cloudwatch', target), resource_type, resource_metrics,
+                             THRESHOLD_DAYS, THRESHOLD_SIGMAS)
+
+
+# The threshold statistics are cached per resource like the resources lists, so opening the third page again
+# doesn't pull the metrics again
+threshold_cache = InventoryCache(
+    load_threshold_statistics,
+    ttl=int(os.environ.get("THRESHOLD_TTL", 3600)),
+    max_stale=int(os.environ.get("THRESHOLD_TTL", 3600)),
+    max_entries=int(os.environ.get("THRESHOLD_CACHE_SIZE", 5000))
+)
+# With the sqlite flow state backend the statistics pulled by each process are shared in a SQLite file too,
+# the third page is often opened by another worker than the one that pulled them
+shared_thresholds = ThresholdStatisticsStore(
+    path=os.environ.get("THRESHOLD_STATE_PATH", "thresholds.db"),
+    ttl=int(os.environ.get("THRESHOLD_TTL", 3600))
+) if isinstance(flow_backend, SQLiteBackend) else None
+
+
+# The threshold statistics of a resource if this process or another one already pulled them, None otherwise
+def cached_threshold_statistics(key):
+    statistics = threshold_cache.peek(key)
+    if statistics is None and shared_thresholds is not None:
+        statistics = shared_thresholds.get(*key)
+    return statistics
+
+
+# The suggested threshold of each metric, {metric: (threshold, alarm condition, text)}, from the cached statistics of
+# the resources ([name, id/arn]). Never waits for CloudWatch, the metrics without cached statistics have no suggestion.
+# The metrics that are a problem when low get a lower bound, unless it would be 0 (a 'less than' threshold has to be
+# bigger than 0)
+def threshold_suggestions(resource_type, resources, metrics):
+    from thresholds import suggested_threshold, combined_statistics, LOWER_BOUND_METRICS
+    cached = [cached_threshold_statistics((resource_type, resource_id_arn))
+              for _, resource_id_arn in resources[:THRESHOLD_MAX_RESOURCES]]
+    suggestions = {}
+    for metric in metrics:
+        statistics = [item[metric] for item in cached if item and item.get(metric)]
+        if not statistics:
+            continue
+        statistics = combined_statistics(statistics)
+        if metric in LOWER_BOUND_METRICS:
+            threshold = suggested_threshold(statistics, lower=True)
+            if threshold <= 0:
+                continue
+            suggestions[metric] = (
+                threshold,
+                'LessThanThreshold',
+                f"Suggested from the last {THRESHOLD_DAYS} days: p1 `{statistics['p1']:.4g}`, "
+                f"p5 `{statistics['p5']:.4g}`, mean - {THRESHOLD_SIGMAS:g}σ `{statistics['mean_minus_sigma']:.4g}`, "
+                f"quietest hour `{statistics['quietest_hour']:.4g}`"
+            )
+        else:
+            suggestions[metric] = (
+                suggested_threshold(statistics),
+                'GreaterThanThreshold',
+                f"Suggested from the last {THRESHOLD_DAYS} days: p95 `{statistics['p95']:.4g}`, "
+                f"p99 `{statistics['p99']:.4g}`, mean + {THRESHOLD_SIGMAS:g}σ `{statistics['mean_sigma']:.4g}`, "
+                f"busiest hour `{statistics['busiest_hour']:.4g}`"
+            )
+    return suggestions
+
+
+# the resource name dropdown of the second page dispatches the selection: pull the metrics of the selected resources
+# while the user checks the metrics, so the third page can suggest the thresholds
+def resource_selected(client: SocketModeClient, req: SocketModeRequest):
+    flow = flow_store.get(req.payload["view"].get("private_metadata"))
+    action = req.payload["actions"][0]
+    # a multi select has selected_options, a single select has a selected_option (None once cleared)
+    selected = action.get("selected_options") or ([action["selected_option"]] if action.get("selected_option") else [])
+    for option in selected[:THRESHOLD_MAX_RESOURCES]:
+        key = (flow.get("resource_type"), option["value"])
+        try:
+            statistics = threshold_cache.get(key)
+            if shared_thresholds is not None:
+                shared_thresholds.set(*key, statistics)
+        except Exception as e:
+            traceback.print_exc()
+            error_sink.report(flow.get("user_name"), "Happened while pulling the metrics for the thresholds", e)
 
 
-# the second page of the modal - choose the resource name and the metrics to monitor
-def choose_resource_name_metrics(client: SocketModeClient, req: SocketModeRequest):
-    submit_text = ''
+# Get the indexed resources names/IDs by the resource type, user_name is the requester shown in the errors
+def resource_list_names(resource_type, user_name=None):
     try:
-        resource_type = \
-            req.payload["view"]["state"]["values"]["resources-dropdown"]["resources_options_action"]["selected_option"][
-                "value"]
+        return inventory_cache.get(resource_type)
     except Exception as e:
-        traceback.print_exc()
+        print(e)
+        error_sink.report(user_name, f"Happened while describing the {resource_type} resources", e)
+        return
+
+
+# The resource types loaded in the background for the pages that can't wait for AWS,
+# a resource type has one background load at a time however many keystrokes ask for it
+background_loads = set()
+background_loads_lock = Lock()
+
+
+def background_load(resource_type, user_name):
+    try:
+        resource_list_names(resource_type, user_name)
+    finally:
+        with background_loads_lock:
+            background_loads.discard(resource_type)
+
+
+# Load the resources of a type in the background unless they are already being loaded
+def load_in_background(resource_type, user_name=None):
+    with background_loads_lock:
+        if resource_type in background_loads:
+            return
+        background_loads.add(resource_type)
+    if not dispatch(background_load, resource_type, user_name):
+        with background_loads_lock:
+            background_loads.discard(resource_type)
+
+
+# The options for the resource name external_select, matching what the user typed so far.
+# The resource type is kept in the state of the flow. They are returned in the ack, which can't wait for AWS:
+# until the resources are loaded (in the background) there are no options
+def resource_suggestions(req: SocketModeRequest):
+    flow = flow_store.get(flow_id_of(req))
+    resource_type = flow.get("resource_type")
+    options = inventory_cache.peek(resource_type)
+    if options is None:
+        load_in_background(resource_type, flow.get("user_name"))
+        return []
+    if not options:
+        return []
+    return options.search(req.payload.get("value", ""), SUGGESTION_LIMIT)
+
+
+# The payload of the ack of a block suggestion
+def suggestion_response(req: SocketModeRequest):
+    return {"options": resource_suggestions(req)}
+
+
+# the path /refresh_inventory drops the cached resources lists, so the next modal shows the current resources
+def refresh_inventory(req: SocketModeRequest):
+    user_id = req.payload['user_id']
+    if user_id not in admins:
+        return
+    stats = inventory_cache.stats()
+    inventory_cache.invalidate()
+    try:
         web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened during choosing the resource type : ```{e}```"
+            channel=user_id,
+            text=f"The resources inventory was cleared. Cache hits: {stats['hits']} "
+                 f"(stale: {stats['stale_hits']}), misses: {stats['misses']}, "
+                 f"failed refreshes: {stats['refresh_errors']}"
         )
-    #save the resource type in the global variable
-    global resource_type_global
-    resource_type_global = resource_type
-    # get the list of the resources names/IDs
-    options = resource_list_names(resource_type)
+    except Exception:
+        traceback.print_exc()
+
+
+# the resource type dropdown of the first page dispatches the selection: load the resources of the type
+# and show their count under the dropdown, so the second page opens with the resources already loaded
+def resource_type_selected(client: SocketModeClient, req: SocketModeRequest):
+    view = req.payload["view"]
+    flow_id = view.get("private_metadata")
+    user_name = flow_store.get(flow_id).get("user_name")
+    resource_type = req.payload["actions"][0]["selected_option"]["value"]
+    options = resource_list_names(resource_type, user_name)
+    if options is None:
+        return
+    blocks = templates.first_page_blocks()
+    blocks.append({
+        "type": "context",
+        "block_id": "resource-count",
+        "elements": [
+            {
+                "type": "mrkdwn",
+                "text": f"{len(options)} {resource_type} resources to monitor"
+            }
+        ]
+    })
+    # the input blocks keep their state, the hash makes sure the view wasn't submitted or changed meanwhile
+    try:
+        if not update_view(view["id"], view["hash"], wizard_view("resource_first_page", flow_id, blocks)):
+            print(f"The first page of flow {flow_id} changed, not showing the resources count")
+    except Exception:
+        traceback.print_exc()
+
+
+# the second page of the modal - choose the resource name and the metrics to monitor.
+# Returns the ack of the first page submission, which replaces the first page with the second one
+def choose_resource_name_metrics(req: SocketModeRequest):
+    flow_id = flow_id_of(req)
+    user_name = flow_store.get(flow_id).get("user_name")
+    try:
+        values = req.payload["view"]["state"]["values"]
+        resource_type = values["resources-dropdown"]["resources_options_action"]["selected_option"]["value"]
+        # the bulk mode checkbox is optional, it's unchecked when it has no selected options
+        bulk = bool(values.get("bulk-mode", {}).get("bulk_mode_action", {}).get("selected_options"))
+    except Exception as e:
+        traceback.print_exc()
+        error_sink.report(user_name, "Happened during choosing the resource type", e)
+    # save the resource type in the state of the flow
+    flow_store.update(flow_id, resource_type=resource_type, bulk=bulk)
+    # the ack can't wait for AWS, the resources are usually loaded when the type was selected on the first page.
+    # If they aren't, they are loaded in the background for the resource name search
+    options = inventory_cache.peek(resource_type)
+    if options is None:
+        load_in_background(resource_type, user_name)
     # if no resources to monitor
-    if not options:
-        blocks = [
+    if options is not None and not options:
+        view = wizard_view("resource_name_metrics_second_page", flow_id, [
             {
                 "type": "section",
                 "block_id": "section-identifier",
@@ -197,79 +750,29 @@ def choose_resource_name_metrics(client: SocketModeClient, req: SocketModeReques
                     "text": f'There are no {resource_type} resources to monitor'
                 }
             }
-        ]
-        submit_text = "OK"
+        ])
+        # nothing to submit, the modal is only closed
+        del view["submit"]
+        view["close"] = {
+            "type": "plain_text",
+            "text": "OK"
+        }
     # if resources to monitor
     else:
-        submit_text = "Next"
-        blocks = [
-            # first block for choosing resource name
-            {
-                "type": "input",
-                "block_id": "resource-name-dropdown",
-                "dispatch_action": True,
-                "element": {
-                    "type": "static_select",
-                    "placeholder": {
-                        "type": "plain_text",
-                        "text": f"Select a {resource_type} name"
-                    },
-                    "options": options,
-                    "action_id": "resource_name_action"
-                },
-                "label": {
-                    "type": "plain_text",
-                    "text": f"Select the {resource_type} name"
-                }
-            }
-        ]
-        try:
-            # second block for choosing the metrics
-            blocks.append({
-                "type": "input",
-                "block_id": "metrics",
-                "label": {
-                    "type": "plain_text",
-                    "text": f"Select the metrics to monitor for {resource_type}"
-                },
-                "element": {
-                    "type": "checkboxes",
-                    "action_id": "metrics_action",
-                    "options": []
-                }
-            })
-
-            for metric_dict in resources[resource_type]:
-                for metric, description in metric_dict.items():
-                    blocks[-1]["element"]["options"].append({
-                        "text": {"type": "plain_text", "text": description},
-                        "value": metric
-                    })
-        except Exception:
-            traceback.print_exc()
-    try:
-        web_client.views_open(
-            trigger_id=req.payload["trigger_id"],
-            view={
-                "type": "modal",
-                "callback_id": "resource_name_metrics_second_page",
-                "title": {
-                    "type": "plain_text",
-                    "text": "New Monitoring Creation"
-                },
-                "submit": {
-                    "type": "plain_text",
-                    "text": submit_text
-                },
-                "blocks": blocks
-            }
-        )
-    except Exception:
-        traceback.print_exc()
+        # the resource name dropdown and the metrics checkboxes, built once per resource type in templates.py
+        if bulk:
+            blocks = templates.bulk_second_page_blocks(resource_type, BULK_MAX_RESOURCES)
+        else:
+            blocks = templates.second_page_blocks(resource_type)
+        view = wizard_view("resource_name_metrics_second_page", flow_id, blocks)
+    return {"response_action": "update", "view": view}
 
 
-# create the form regard the alerts details
-def alerts_details(client: SocketModeClient, req: SocketModeRequest, error_messages=None):
+# create the form regard the alerts details.
+# Returns the ack of the second page submission, which replaces the second page with the third one
+def alerts_details(req: SocketModeRequest):
+    flow_id = flow_id_of(req)
+    user_name = flow_store.get(flow_id).get("user_name")
     # Extract the submitted values from the request payload
     # extract the checked metrics to monitor
     try:
@@ -279,151 +782,43 @@ def alerts_details(client: SocketModeClient, req: SocketModeRequest, error_messa
         selected_options = values["metrics"]["metrics_action"]["selected_options"]
         # Extract the values of the selected options, which are the checked metrics to monitor
         checked_metrics = [option["value"] for option in selected_options]
-        # extract the resource id/arn
-        resource_arn_or_id = values["resource-name-dropdown"]["resource_name_action"]["selected_option"]["value"]
-        # extract the resource name
-        resource_name = values["resource-name-dropdown"]["resource_name_action"]["selected_option"]["text"]["text"]
-
+        # extract the resources, the bulk mode dropdown has several selected options
+        selection = values["resource-name-dropdown"]["resource_name_action"]
+        selected_resources = selection.get("selected_options") or [selection["selected_option"]]
+        # [resource name, option value (resource id/arn and its target)] of each resource
+        resources = [[option["text"]["text"].split(TARGET_SEPARATOR)[0], option["value"]]
+                     for option in selected_resources]
+        # keep the resources in the state of the flow for the approval request
+        flow_store.update(flow_id, resources=resources)
 
     except Exception as e:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened during extracting the checked metrics : ```{e}```"
-        )
-
-    # create the blocks for the alerts details for each alert selected in the selected_options
-    # using the dict of the alert variables form the variables.py file
-    blocks = []
-    # add the resource name and arn/id to the blocks
-    blocks.append({
-        "type": "section",
-        "block_id": "resource-name",
-        "text": {
-            "type": "mrkdwn",
-            "text": f"*Resource details:* \nResource name: `{resource_name}`\nResource id/arn: `{resource_arn_or_id}`"
-        }
-    })
-    # for each metric to monitor create an alert block that will contain the alert details inputs for the user
-    for metric in checked_metrics:
-        blocks.append({
-            "type": "divider"
-        })
-        blocks.append({
-            "type": "section",
-            "block_id": f"{metric}-alert",
-            "text": {
-                "type": "mrkdwn",
-                "text": f"• Details for {metric} alert"
-            }
-        })
-        # for each alert variable create an input block for the user to enter the alert details/parameters
-        for variable, value in alert_vairables.items():
-            # if the value is a list create a dropdown
-            if type(value) == list:
-                blocks.append({
-                    "type": "input",
-                    "block_id": f"{metric}-{variable}-dropdown",
-                    "dispatch_action": True,
-                    "element": {
-                        "type": "static_select",
-                        "placeholder": {
-                            "type": "plain_text",
-                            "text": f"Select the {variable}"
-                        },
-                        "options": [{"text": {"type": "plain_text", "text": option}, "value": option} for option in
-                                    value],
-                        "action_id": f"{metric}-{variable}-action"
-                    },
-                    "label": {
-                        "type": "plain_text",
-                        "text": f"Select the {variable}"
-                    }
-                })
-            # if the value is a number create a plain text input
-            else:
-                blocks.append({
-                    "type": "input",
-                    "block_id": f"{metric}-{variable}-input",
-                    "element": {
-                        "type": "plain_text_input",
-                        "action_id": f"{metric}-{variable}-action"
-                    },
-                    "label": {
-                        "type": "plain_text",
-                        "text": f"Enter the {variable}"
-                    }
-                })
-
-    # create the alert details blocks
-    try:
-        web_client.views_open(
-            trigger_id=req.payload["trigger_id"],
-            view={
-                "type": "modal",
-                "callback_id": "alerts_details_third_page",
-                "title": {
-                    "type": "plain_text",
-                    "text": "New Monitoring Creation"
-                },
-                "submit": {
-                    "type": "plain_text",
-                    "text": "Submit for approval"
-                },
-                "blocks": blocks
-            }
-        )
-    except Exception as e:
-        traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Received error during creating the alert details blocks : ```{e}```"
-        )
-
-def send_to_aprroval(client: SocketModeClient, req: SocketModeRequest):
+        error_sink.report(user_name, "Happened during extracting the checked metrics", e)
+
+    # create the blocks for the alerts details for each alert selected in the selected_options,
+    # the blocks of each metric are built once from the alert variables in templates.py
+    suggestions = threshold_suggestions(flow_store.get(flow_id).get("resource_type"), resources, checked_metrics)
+    blocks = templates.alerts_details_blocks(resources, checked_metrics, suggestions)
+    return {
+        "response_action": "update",
+        "view": wizard_view("alerts_details_third_page", flow_id, blocks, "Submit for approval")
+    }
+
+# The third page submission, returns the ack: the error of each invalid input when the inputs are invalid,
+# otherwise an empty ack closing the modal while the request is sent to the approval channel in the background
+def send_to_aprroval(req: SocketModeRequest):
+    flow_id = flow_id_of(req)
+    flow = flow_store.get(flow_id)
+    user_name = flow.get("user_name")
     # Extract the submitted values from the request payload
-    values = req.payload["view"]["state"]["values"]
     alert_properties = []
     try:
-        for key, value in values.items():
-            alarm, parameter, _ = key.split('-')
-            parameter_value = value[f"{alarm}-{parameter}-action"][
-                "value"] if parameter != "alarm condition" and parameter != "Missing data treatment" else \
-                value[f"{alarm}-{parameter}-action"]["selected_option"]["value"]
-
-            # Check if the alarm already exists in the list
-            for alert in alert_properties:
-                if alarm in alert:
-                    # If the alarm exists, add the new parameter to it
-                    alert[alarm][parameter] = parameter_value
-                    break
-            else:
-                # If the alarm does not exist, create a new dictionary for it
-                alert_properties.append({alarm: {parameter: parameter_value}})
-    except Exception as e:
-        traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened while extracting the submitted values : ```{e}```"
-        )
-    # extract the resource name and arn/id
-    try:
-        # Extract the resource details
-        resource_details_text = req.payload['view']['blocks'][0]['text']['text']
-
-        # Split the text by newline to get the resource name and id/arn
-        resource_name, resource_id_arn = resource_details_text.split('\n')[1:]
-
-        # Remove the prefix from the resource name and id/arn
-        resource_name = resource_name.replace('Resource name: ', '')
-        resource_id_arn = resource_id_arn.replace('Resource id/arn: ', '')
-
+        alert_properties = alert_inputs(req.payload["view"]["state"]["values"])
     except Exception as e:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened while extracting the resource name and arnId and  : ```{e}```"
-        )
+        error_sink.report(user_name, "Happened while extracting the submitted values", e)
+    # the resources names and arns/ids were chosen on the second page
+    resources = flow.get("resources", [])
 
     # extract the requestor details
     # test commit revert
@@ -432,189 +827,297 @@ def send_to_aprroval(client: SocketModeClient, req: SocketModeRequest):
         user_id = req.payload['user']['id']
     except Exception:
         traceback.print_exc()
-    valid_user_input = input_validation(alert_properties)
-    if valid_user_input != True:
-        create_form_with_error_messages(client, req, valid_user_input)
-    else:
-        # send the inputs to the approval channel
-        blocks = []
-        try:
-            # Add the request header and the requestor details
-            blocks.append(
-                {
-                    "type": "header",
-                    "block_id": "request-header",
-                    "text": {
-                        "type": "plain_text",
-                        "text": "New monitoring creation request"
-                    }
-                })
-            blocks.append(
-                {
-                    "type": "section",
-                    "block_id": "request-header-details",
-                    "text": {
-                        "type": "mrkdwn",
-                        "text": f"Requested by <@{user_id}>"
-                    }
-                })
-            # Add the resource name and arn/id to the blocks
-            blocks.append({
+    # the errors are shown by slack under their inputs, the page stays open
+    errors = input_validation(alert_properties)
+    if errors:
+        # counted on the submission only, the keystroke checks of alert_inputs_changed would count each error again
+        for block_id in errors:
+            invalid_inputs.inc(block_id.split('-')[1])
+        return {"response_action": "errors", "errors": errors}
+    try:
+        # the request is serialized once into the buttons, the approve/reject clicks decode it from there
+        request = {
+            "flow_id": flow_id,
+            "requester_id": user_id,
+            "requester_name": user_name,
+            "resource_type": flow.get("resource_type"),
+            "resources": resources,
+            # the missing data treatment options are "<value>: <description>"
+            "alerts": {metric: dict(parameters, **{
+                'Missing data treatment': parameters['Missing data treatment'].split(': ')[0]
+            }) for alert in alert_properties for metric, parameters in alert.items()}
+        }
+    except Exception as e:
+        traceback.print_exc()
+        error_sink.report(user_name, "Happened while preparing the approval request", e)
+        return None
+    # Slack delivers the submission again when the ack is late, the request is posted once
+    if router.first_delivery(req):
+        dispatch(post_approval_request, request, alert_properties)
+    return None
+
+
+# send the inputs to the approval channel and tell the requester
+def post_approval_request(request, alert_properties):
+    user_id = request["requester_id"]
+    user_name = request["requester_name"]
+    blocks = []
+    try:
+        # the names of the options may be shortened, the approval shows and records the full names
+        request["resources"] = full_resource_names(request["resource_type"], request["resources"])
+        resources = request["resources"]
+        button_value = approval_value(request)
+        # Add the request header and the requestor details
+        blocks.append(
+            {
+                "type": "header",
+                "block_id": "request-header",
+                "text": {
+                    "type": "plain_text",
+                    "text": "New monitoring creation request"
+                }
+            })
+        blocks.append(
+            {
                 "type": "section",
-                "block_id": "resource-name",
+                "block_id": "request-header-details",
                 "text": {
                     "type": "mrkdwn",
-                    "text": f"*Resource details:* \n"
-                            f"Resource name: "
-                            f"``{resource_name}``"
-                            f"\nResource id/arn:"
-                            f"``{resource_id_arn}``"
+                    "text": f"Requested by <@{user_id}>"
                 }
             })
-            # For each metric to monitor, create an alert block that will contain the alert details inputs for the user
-            for alert in alert_properties:
-                for metric, parameters in alert.items():
-                    #
-                    blocks.append({
-                        "type": "divider"
-                    })
-                    blocks.append({
-                        "type": "section",
-                        "block_id": f"{metric}-alert-header",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": f"• Details for {metric} alert*"
-                        }
-                    })
-                    # Initialize the fields list
-                    fields = []
-                    # For each alert variable, create a field with the parameter and its value
-                    for parameter, value in parameters.items():
-                        fields.append({
-                            "type": "mrkdwn",
-                            "text": f"*{parameter}:*\n{value}"
-                        })
-                    # Append a section block with the fields to the blocks list
-                    blocks.append({
-                        "type": "section",
-                        "block_id": f"{metric}-alert-details",
-                        "fields": fields
-                    })
-            # Add the approve and reject buttons
+        # Add the resources names and arns/ids to the blocks
+        blocks.append({
+            "type": "section",
+            "block_id": "resource-name",
+            "text": {
+                "type": "mrkdwn",
+                "text": templates.resources_text(resources)
+            }
+        })
+        # a bulk request creates every checked metric alarm on every resource
+        if len(resources) > 1:
             blocks.append({
-                "type": "actions",
-                "block_id": "approve-reject",
-                "elements": [
-                    {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": "Approve"
-                        },
-                        "style": "primary",
-                        "value": "approve"
-                    },
-                    {
-                        "type": "button",
-                        "text": {
-                            "type": "plain_text",
-                            "text": "Reject"
-                        },
-                        "style": "danger",
-                        "value": "reject"
-                    }
-                ]
+                "type": "section",
+                "block_id": "bulk-summary",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"*{len(resources)} resources × {len(request['alerts'])} metrics = "
+                            f"{len(resources) * len(request['alerts'])} alarms*"
+                }
             })
-            # Send the request to the approval channel
-            web_client.chat_postMessage(
-                channel='C074TASRX7S',
-                text="New monitoring creation request",
-                blocks=blocks
-            )
+        # For each metric to monitor, create an alert block that will contain the alert details inputs for the user
+        for alert in alert_properties:
+            for metric, parameters in alert.items():
+                #
+                blocks.append({
+                    "type": "divider"
+                })
+                blocks.append({
+                    "type": "section",
+                    "block_id": f"{metric}-alert-header",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": f"• Details for {metric} alert*"
+                    }
+                })
+                # Initialize the fields list
+                fields = []
+                # For each alert variable, create a field with the parameter and its value
+                for parameter, value in parameters.items():
+                    fields.append({
+                        "type": "mrkdwn",
+                        "text": f"*{parameter}:*\n{value}"
+                    })
+                # Append a section block with the fields to the blocks list
+                blocks.append({
+                    "type": "section",
+                    "block_id": f"{metric}-alert-details",
+                    "fields": fields
+                })
+        # how noisy the alarms would have been, the request is still sent if the backtest fails
+        try:
+            backtest = backtest_text(request)
         except Exception as e:
             traceback.print_exc()
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened while sending the request to the approval channel : ```{e}```"
-            )
-        # Send a private message to the user who requested the monitoring creation
+            error_sink.report(user_name, "Happened during the backtest of the alarms", e)
+            backtest = "*Backtest:* failed"
+        blocks.append({
+            "type": "section",
+            "block_id": "backtest",
+            "text": {
+                "type": "mrkdwn",
+                "text": backtest
+            }
+        })
+        # what the request changes in the existing alarms
         try:
-            web_client.chat_postMessage(
-                channel=user_id,
-                text=f"Your monitoring creation request for {resource_name} has been sent for approval"
-            )
+            changes = changes_text(request)
         except Exception as e:
             traceback.print_exc()
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened while sending a private message to the user who requested the monitoring creation : ```{e}```"
-            )
+            error_sink.report(user_name, "Happened while comparing the request with the existing alarms", e)
+            changes = "*Changes:* unknown, the existing alarms couldn't be described"
+        blocks.append({
+            "type": "section",
+            "block_id": "changes",
+            "text": {
+                "type": "mrkdwn",
+                "text": changes
+            }
+        })
+        # Add the approve and reject buttons
+        blocks.append({
+            "type": "actions",
+            "block_id": "approve-reject",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Approve"
+                    },
+                    "style": "primary",
+                    "action_id": "approve_request",
+                    # the buttons carry the request, the click doesn't need to parse the message
+                    "value": button_value
+                },
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Reject"
+                    },
+                    "style": "danger",
+                    "action_id": "reject_request",
+                    "value": button_value
+                }
+            ]
+        })
+        # Send the request to the approval channel
+        response = web_client.chat_postMessage(
+            channel='C074TASRX7S',
+            text="New monitoring creation request",
+            blocks=blocks
+        )
+        journal.record_request(request, response["channel"], response["ts"])
+    except Exception as e:
+        traceback.print_exc()
+        error_sink.report(user_name, "Happened while sending the request to the approval channel", e)
+    # Send a private message to the user who requested the monitoring creation
+    try:
+        web_client.chat_postMessage(
+            channel=user_id,
+            text=f"Your monitoring creation request for {resources_label(request)} has been sent for approval"
+        )
+    except Exception as e:
+        traceback.print_exc()
+        error_sink.report(user_name, "Happened while sending a private message to the user who requested the monitoring creation", e)
+
+
+# The alert inputs of the third page (the state values of the view) by metric: [{metric: {parameter: value}}].
+# The inputs the user didn't fill yet are left out
+def alert_inputs(values):
+    alert_properties = []
+    for key, value in values.items():
+        alarm, parameter, _ = key.split('-')
+        action = value[f"{alarm}-{parameter}-action"]
+        if parameter != "alarm condition" and parameter != "Missing data treatment":
+            parameter_value = action.get("value")
+        else:
+            parameter_value = (action.get("selected_option") or {}).get("value")
+        if parameter_value is None:
+            continue
+
+        # Check if the alarm already exists in the list
+        for alert in alert_properties:
+            if alarm in alert:
+                # If the alarm exists, add the new parameter to it
+                alert[alarm][parameter] = parameter_value
+                break
+        else:
+            # If the alarm does not exist, create a new dictionary for it
+            alert_properties.append({alarm: {parameter: parameter_value}})
+    return alert_properties
+
 
+# The periods below a minute an alarm can use, above a minute the period must be a multiple of 60
+SHORT_PERIODS = [1, 5, 10, 30]
 
+
+# Check the alert inputs and convert the numbers to integers (in place). Returns the error message of each
+# invalid input keyed by the block id of the input, empty when all the inputs are valid.
+# The missing parameters aren't checked, so a partly filled page can be checked too
 def input_validation(alerts_details):
-    error_messages = []
+    errors = {}
 
     for alert in alerts_details:
         for metric, parameters in alert.items():
+            # keep the first error of each input
+            def error(parameter, message):
+                errors.setdefault(templates.input_block_id(metric, parameter), message)
+
             # Check if the parameters are integers
+            numbers = {}
             for parameter, value in parameters.items():
                 if parameter not in ['Missing data treatment', 'alarm condition']:
-                    is_valid = True  # Initialize the flag as True
                     try:
-                        parameters[parameter] = int(value)
-                    except ValueError:
-                        error_messages.append(
-                            f"Invalid input for {parameter} in metric {metric}. It must be an integer.")
-                        is_valid = False  # Set the flag as False if a ValueError is raised
-
-                    # Skip the other validations if the input is not valid
-                    if not is_valid:
-                        continue
-
-                    # validation for 'threshold' when 'alarm condition' is 'less'
-                    if parameter == 'threshold' and parameters.get('alarm condition') == 'less' and parameters[
-                        'threshold'] <= 0:
-                        error_messages.append(
-                            f"Invalid 'threshold' for metric {metric}.When 'alarm condition' is 'less', it has to be an integer bigger than 0")
-
-                    # Validate 'threshold'
-                    if parameter == 'threshold' and parameters['threshold'] < 0:
-                        error_messages.append(f"Invalid 'threshold' for metric {metric}, can't be a negative number")
-
-                    # Validate 'period'
-                    if parameter == 'period' and parameters['period'] < 0:
-                        error_messages.append(f"Invalid 'period' for metric {metric}, it has to be a positive integer")
-
-                    if parameter == 'period' and parameters['period'] not in [1, 5, 10, 30] and parameters['period'] % 60 != 0:
-                        error_messages.append(f"Invalid 'period' for metric {metric}, valid values are 1, 5, 10, 30, or any multiple of 60")
-
-                    # Validate 'evaluation period'
-                    if parameter == 'evaluation period' and parameters['evaluation period'] < 0:
-                        error_messages.append(
-                            f"Invalid 'evaluation period' for metric {metric}, it has to be a positive integer")
-
-                    # Validate that 'datapoints to alarm' isn't bigger than the 'evaluation period'
-                    if parameter == 'datapoints to alarm from the evaluation period' and 'evaluation period' in parameters and \
-                            parameters['datapoints to alarm from the evaluation period'] > parameters[
-                        'evaluation period']:
-                        error_messages.append(
-                            f"'datapoints to alarm from the evaluation period' cannot be bigger than the 'evaluation period' for metric {metric}")
-
-                    # Validate 'datapoints to alarm from the evaluation period'
-                    if parameter == 'datapoints to alarm from the evaluation period' and parameters[
-                        'datapoints to alarm from the evaluation period'] < 0:
-                        error_messages.append(
-                            f"Invalid 'datapoints to alarm from the evaluation period' for metric {metric}")
-
-    if error_messages:
-        # print the error messages with a row between each message
-        print("\n".join(error_messages))
-        return error_messages
-    else:
-        return True
+                        parameters[parameter] = numbers[parameter] = int(value)
+                    except (TypeError, ValueError):
+                        error(parameter, f"The {parameter} must be an integer")
+
+            threshold = numbers.get('threshold')
+            period = numbers.get('period (in seconds)')
+            evaluation_period = numbers.get('evaluation period')
+            datapoints = numbers.get('datapoints to alarm from the evaluation period')
+
+            # Validate 'threshold'
+            if threshold is not None and threshold < 0:
+                error('threshold', "The threshold can't be a negative number")
+            # validation for 'threshold' when 'alarm condition' is 'less'
+            if threshold is not None and str(parameters.get('alarm condition', '')).startswith('Less') and \
+                    threshold <= 0:
+                error('threshold', "With a 'less than' alarm condition the threshold has to be bigger than 0")
+
+            # Validate 'period'
+            if period is not None and (period <= 0 or period not in SHORT_PERIODS and period % 60 != 0):
+                error('period (in seconds)', "Valid periods are 1, 5, 10, 30, or any multiple of 60")
+
+            # Validate 'evaluation period'
+            if evaluation_period is not None and evaluation_period <= 0:
+                error('evaluation period', "The evaluation period has to be a positive integer")
+
+            # Validate 'datapoints to alarm from the evaluation period'
+            if datapoints is not None and datapoints <= 0:
+                error('datapoints to alarm from the evaluation period', "The datapoints have to be a positive integer")
+            # Validate that 'datapoints to alarm' isn't bigger than the 'evaluation period'
+            if datapoints is not None and evaluation_period is not None and datapoints > evaluation_period:
+                error('datapoints to alarm from the evaluation period',
+                      "The datapoints to alarm can't be bigger than the evaluation period")
+
+    return errors
+
+
+# An input of the third page changed: check the page and show the errors under their inputs. The view is only
+# updated when the errors changed since the last check, and not at all if the user changed the page meanwhile
+def alert_inputs_changed(client: SocketModeClient, req: SocketModeRequest):
+    view = req.payload["view"]
+    flow_id = view.get("private_metadata")
+    user_name = flow_store.get(flow_id).get("user_name")
+    try:
+        errors = input_validation(alert_inputs(view["state"]["values"]))
+        if errors == flow_store.get(flow_id).get("field_errors", {}):
+            return
+        updated_view = wizard_view(view["callback_id"], flow_id, templates.field_error_blocks(view["blocks"], errors),
+                                   "Submit for approval")
+        if update_view(view["id"], view["hash"], updated_view):
+            flow_store.update(flow_id, field_errors=errors)
+    except Exception as e:
+        traceback.print_exc()
+        error_sink.report(user_name, "Happened while checking the alert details inputs", e)
 
 
-def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool):
+def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool, request):
+    user_name = request["requester_name"]
     # extract the approver details
     user_id = req.payload['user']['id']
 
@@ -652,7 +1155,7 @@ def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool
                 text="Request approved",  # Add this line
                 blocks=blocks
             )
-            send_private_message(client, req, approved)
+            send_private_message(client, req, approved, request)
             web_client.chat_postMessage(
                 channel='C078BQGN1BP',
                 text=f"{user_name}'s Monitoring Creation request has been approved"
@@ -667,29 +1170,13 @@ def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool
             )
             # Create a block to ask the user to provide the reason for the rejection
             blocks = []
-            # add the resource name and the requester id
-            # Extract the resource details
-            resource_details_text = req.payload['message']['blocks'][2]['text']['text']
-
-            # Split the text by newline to get the resource name and id/arn
-            resource_name, resource_id_arn = resource_details_text.split('\n')[1:]
-
-            # Remove the prefix from the resource name and id/arn
-            resource_name = resource_name.replace('Resource name: ', '')
-            resource_id_arn = resource_id_arn.replace('Resource id/arn: ', '')
-
-            # extract the user id in the message
-            user_id = req.payload['message']['blocks'][1]['text']['text']
-            user_id = user_id.replace('Requested by <@', '')
-            user_id = user_id.replace('>', '')
-
             # add the resource name and id/arn to the blocks
             blocks.append({
                 "type": "section",
                 "block_id": "resource-name",
                 "text": {
                     "type": "mrkdwn",
-                    "text": f"*Resource details:* \nResource name: `{resource_name}`\nResource id/arn: `{resource_id_arn}`"
+                    "text": templates.resources_text(request["resources"])
                 }
             })
             # add the requester id to the blocks
@@ -698,7 +1185,7 @@ def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool
                 "block_id": "requester-id",
                 "text": {
                     "type": "mrkdwn",
-                    "text": f"Requested by <@{user_id}>"
+                    "text": f"Requested by <@{request['requester_id']}>"
                 }
             })
             # ask the user to provide the reason for the rejection
@@ -722,6 +1209,8 @@ def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool
                 view={
                     "type": "modal",
                     "callback_id": "rejection_reason",
+                    # the same encoded request as the buttons, for send_reason
+                    "private_metadata": req.payload["actions"][0]["value"],
                     "title": {
                         "type": "plain_text",
                         "text": "Rejection Reason"
@@ -733,42 +1222,19 @@ def button_hide(client: SocketModeClient, req: SocketModeRequest, approved: bool
                     "blocks": blocks
                 }
             )
-            send_private_message(client, req, approved)
+            send_private_message(client, req, approved, request)
     except Exception as e:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened during button hide function: ```{e}```"
-        )
+        error_sink.report(user_name, "Happened during button hide function", e)
 
 
-def send_private_message(client: SocketModeClient, req: SocketModeRequest, approved: bool):
+def send_private_message(client: SocketModeClient, req: SocketModeRequest, approved: bool, request):
+    user_name = request["requester_name"]
     # Send a private message to the user who requested the monitoring creation
-    # Extract the details of the resource
-    try:
-        # Extract the resource details
-        resource_details_text = req.payload['message']['blocks'][2]['text']['text']
-
-        # Split the text by newline to get the resource name and id/arn
-        resource_name, resource_id_arn = resource_details_text.split('\n')[1:]
-
-        # Remove the prefix from the resource name and id/arn
-        resource_name = resource_name.replace('Resource name: ', '')
-        resource_id_arn = resource_id_arn.replace('Resource id/arn: ', '')
-
-        # extract the user id in the message
-        user_id = req.payload['message']['blocks'][1]['text']['text']
-        user_id = user_id.replace('Requested by <@', '')
-        user_id = user_id.replace('>', '')
-
-        # extract the approver id
-        admin_id = req.payload['user']['id']
-    except Exception as e:
-        traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened while extracting the approver id : ```{e}```"
-        )
+    resource_name = resources_label(request)
+    user_id = request["requester_id"]
+    # extract the approver id
+    admin_id = req.payload['user']['id']
     if approved:
         try:
             # Send a private message to the user who requested the monitoring creation
@@ -779,10 +1245,7 @@ def send_private_message(client: SocketModeClient, req: SocketModeRequest, appro
             )
         except Exception as e:
             traceback.print_exc()
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened during sending a pm to the user that request is approved : ```{e}```"
-            )
+            error_sink.report(user_name, "Happened during sending a pm to the user that request is approved", e)
 
     else:
         try:
@@ -793,90 +1256,62 @@ def send_private_message(client: SocketModeClient, req: SocketModeRequest, appro
             )
         except Exception as e:
             traceback.print_exc()
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Happened during process of sending a pm to the user that request is rejected : ```{e}```"
-            )
+            error_sink.report(user_name, "Happened during process of sending a pm to the user that request is rejected", e)
 
 
 def approve_request(client: SocketModeClient, req: SocketModeRequest):
+    user_name = None
     try:
         # extract the approver details
         user_id = req.payload['user']['id']
-        # Extract the resource details
-        resource_details_text = req.payload['message']['blocks'][2]['text']['text']
-
-        # Split the text by newline to get the resource name and id/arn
-        resource_name, resource_id_arn = resource_details_text.split('\n')[1:]
-
-        # Remove the prefix from the resource name and id/arn
-        resource_name = resource_name.replace('Resource name: ```', '').replace('```', '')
-        resource_id_arn = resource_id_arn.replace('Resource id/arn:```', '').replace('```','' )
-        #remove the '' from the resource_id_arn and name
-
-        # Initialize the alerts dictionary
-        alerts = {}
-
-        # Iterate over the blocks in the message
-        for block in req.payload['message']['blocks']:
-            # Check if the block is an alert details block
-            if block['type'] == 'section' and 'alert-details' in block['block_id']:
-                print(block)
-                print(block['fields'])
-                # Extract the metric from the block_id
-                metric = block['block_id'].split('-')[0]
-                # Initialize the parameters dictionary
-                parameters = {}
-                # Iterate over the fields in the block
-                for field in block['fields']:
-                    # Check if the text contains a newline and a colon
-                    if '\n' in field['text'] and ':' in field['text']:
-                        # Split the text by newline and colon to get the parameter and its value
-                        value = field['text'].split('\n')[1].split(': ')[0]
-                        parameter = field['text'].split('\n')[0].replace(':','').replace('*','')
-
-                        # Add the parameter and its value to the parameters dictionary
-                        parameters[parameter] = value
-                    else:
-                        print(f"Unexpected format in field text: {field['text']}")
-                # Add the parameters dictionary to the alerts dictionary with the metric as the key
-                alerts[metric] = parameters
-        print(f"Resource Name: {resource_name}")
-        print(f"Resource ID/ARN: {resource_id_arn}")
-        print(f"Alerts: {alerts}")
+        # Decode the request carried by the button
+        request = approval_request_of(req.payload['actions'][0]['value'])
+        user_name = request["requester_name"]
         if user_id in admins:
+            # only the first approval of a pending request creates the alarms
+            if not decide_request(req, request, APPROVED, user_id):
+                print(f"Request {request['flow_id']} was already handled, ignoring the approval")
+                return
             # Hide the approve and reject buttons
-            button_hide(client, req, True)
-            send_put_metric_alarm_request(resource_id_arn, resource_name, alerts)
+            button_hide(client, req, True, request)
+            results = send_put_metric_alarm_request(request["resource_type"], request["resources"], request["alerts"],
+                                                    req.payload['channel']['id'], req.payload['message']['ts'],
+                                                    user_name)
+            if results is not None:
+                journal.record_alarm_results(request["flow_id"], results)
+            else:
+                journal.transition(request["flow_id"], FAILED, detail="No alarm was created",
+                                   from_statuses=(APPROVED,))
+            flow_store.end(request["flow_id"])
         else:
             # Reject the request
-            button_hide(client, req, False)
+            if not decide_request(req, request, REJECTED, user_id):
+                return
+            button_hide(client, req, False, request)
     except Exception as e:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened during approve request function : ```{e}```"
-        )
+        error_sink.report(user_name, "Happened during approve request function", e)
         # Check if the user is an admin
 
 
-def send_put_metric_alarm_request(resource_id_arn, resource_name, alerts):
-    if resource_type_global == 'AWS/EC2':
-        dimensions = [
+# The dimensions of the alarms of a resource
+def alarm_dimensions(resource_type, resource_id_arn):
+    if resource_type == 'AWS/EC2':
+        return [
             {
                 'Name': 'InstanceId',
                 'Value': resource_id_arn
             }
         ]
-    elif resource_type_global == 'AWS/ApplicationELB':
-        dimensions = [
+    elif resource_type == 'AWS/ApplicationELB':
+        return [
             {
                 'Name': 'TargetGroup',
                 'Value': resource_id_arn
             }
         ]
-    elif resource_type_global == 'AWS/RDS':
-        dimensions = [
+    elif resource_type == 'AWS/RDS':
+        return [
             {
                 'Name': 'DBInstanceIdentifier',
                 'Value': resource_id_arn
@@ -885,17 +1320,54 @@ def send_put_metric_alarm_request(resource_id_arn, resource_name, alerts):
     else:
         raise ValueError("Invalid resource_type. Must be 'EC2', 'ApplicationELB', or 'RDS'.")
 
-    for metric, parameters in alerts.items():
+
+# Post a progress message in the thread of the approval message (channel_id, thread_ts) and return
+# the progress(done, failed) callback of the alarm writer, which updates it at most every PROGRESS_INTERVAL seconds
+def alarms_progress(channel_id, thread_ts, total):
+    response = web_client.chat_postMessage(
+        channel=channel_id,
+        thread_ts=thread_ts,
+        text=f"Creating {total} alarms: 0/{total} done"
+    )
+    last_update = [time.monotonic()]
+
+    def progress(done, failed):
+        now = time.monotonic()
+        if done < total and now - last_update[0] < PROGRESS_INTERVAL:
+            return
+        last_update[0] = now
         try:
-            aws_session.client('cloudwatch').put_metric_alarm(
+            web_client.chat_update(
+                channel=response["channel"],
+                ts=response["ts"],
+                text=f"Creating {total} alarms: {done}/{total} done" + (f", {failed} failed" if failed else "")
+            )
+        except Exception:
+            traceback.print_exc()
+
+    return progress
+
+
+# The SNS topic the alarms of a target notify, the topic of the target in AWS_TARGETS or SNS_TOPIC_ARN
+def alarm_topic(target):
+    return target.topic_arn or os.environ['SNS_TOPIC_ARN']
+
+
+# The put_metric_alarm kwargs of each checked metric alarm on each resource ([name, id/arn]) of a target
+def alarm_definitions(resource_type, target, resources, alerts):
+    alarms = []
+    for resource_name, resource_id_arn in resources:
+        dimensions = alarm_dimensions(resource_type, resource_id_arn)
+        for metric, parameters in alerts.items():
+            alarms.append(dict(
                 AlarmName=f"{resource_name}-{metric}",
                 AlarmDescription=f"Alarm for {metric} on {resource_name}",
                 ActionsEnabled=True,
                 AlarmActions=[
-                    os.environ['SNS_TOPIC_ARN']
+                    alarm_topic(target)
                 ],
                 MetricName=metric,
-                Namespace=resource_type_global,
+                Namespace=resource_type,
                 Statistic='Average',
                 Period=int(parameters['period (in seconds)']),
                 EvaluationPeriods=int(parameters['evaluation period']),
@@ -904,26 +1376,171 @@ def send_put_metric_alarm_request(resource_id_arn, resource_name, alerts):
                 TreatMissingData=parameters['Missing data treatment'],
                 DatapointsToAlarm=int(parameters['datapoints to alarm from the evaluation period']),
                 Dimensions=dimensions
-            )
+            ))
+    return alarms
+
+
+# The alarms of a request grouped by the target of their resources, [(target, put_metric_alarm kwargs), ...]
+def target_alarms(resource_type, resources, alerts):
+    return [(target, alarm_definitions(resource_type, target, group, alerts))
+            for target, group in resources_by_target(resources).items()]
+
+
+# The text of the backtest of a request: how many times each alarm would have gone into ALARM over the
+# last BACKTEST_DAYS days, for the approver
+def backtest_text(request):
+    from backtest import backtest_alarms, backtest_cells, HIGH_RESOLUTION_SECONDS
+    groups = target_alarms(request["resource_type"], request["resources"], request["alerts"])
+    alarms = [alarm for _, target_group in groups for alarm in target_group]
+    if len(alarms) > BACKTEST_MAX_ALARMS:
+        return f"*Backtest:* skipped, the request has more than {BACKTEST_MAX_ALARMS} alarms"
+    if backtest_cells(alarms, BACKTEST_DAYS) > BACKTEST_MAX_CELLS:
+        return f"*Backtest:* skipped, the alarms have more than {BACKTEST_MAX_CELLS} periods to replay"
+    # each target is backtested against its own metrics, the results are in the order of the alarms
+    results = [result for target, target_group in groups
+               for result in backtest_alarms(aws_clients.target_client('cloudwatch', target), target_group,
+                                             BACKTEST_DAYS)]
+    lines = [f"*Backtest on the last {BACKTEST_DAYS} days:*"]
+    if any(alarm['Period'] < 60 for alarm in alarms):
+        lines[0] = (f"*Backtest on the last {BACKTEST_DAYS} days (the last {HIGH_RESOLUTION_SECONDS // 3600} hours "
+                    f"for the periods under a minute):*")
+    for metric in request["alerts"]:
+        metric_results = [result for alarm, result in zip(alarms, results) if alarm['MetricName'] == metric]
+        with_data = [result for result in metric_results if result["datapoints"]]
+        if not with_data:
+            lines.append(f"• `{metric}`: no data")
+            continue
+        transitions = sum(result["transitions"] for result in with_data)
+        alarm_ratio = sum(result["alarm_ratio"] for result in with_data) / len(with_data)
+        if len(request["resources"]) == 1:
+            lines.append(f"• `{metric}`: {transitions} alarms, in alarm {alarm_ratio:.1%} of the time")
+        else:
+            alarming = sum(1 for result in with_data if result["transitions"])
+            lines.append(f"• `{metric}`: {transitions} alarms on {alarming}/{len(metric_results)} resources, "
+                         f"in alarm {alarm_ratio:.1%} of the time on average")
+    return "\n".join(lines)
+
+
+# The text of the changes of a request: the alarms it creates, the alarms it updates (and what changes)
+# and the alarms that are already up to date, from the existing alarms index
+def changes_text(request):
+    counts = {CREATE: 0, UPDATE: 0, UNCHANGED: 0}
+    lines = []
+    for target, alarms in target_alarms(request["resource_type"], request["resources"], request["alerts"]):
+        index = alarm_index_of(target).current(aws_clients.target_client('cloudwatch', target))
+        for alarm in alarms:
+            action, changed = index.diff(alarm)
+            counts[action] += 1
+            if action == UPDATE:
+                line = f"• update `{alarm['AlarmName']}`: {', '.join(changed)}"
+            elif action == CREATE:
+                # another alarm may already watch the same metric
+                others = index.on_metric(alarm['Namespace'], alarm['MetricName'], alarm['Dimensions'])
+                line = f"• create `{alarm['AlarmName']}`" + (
+                    f" (the metric already has {', '.join(f'`{name}`' for name in others)})" if others else "")
+            else:
+                continue
+            if len(line) > CHANGE_LINE_LENGTH:
+                line = line[:CHANGE_LINE_LENGTH - 1] + "…"
+            if len(lines) < LISTED_CHANGES:
+                lines.append(line)
+    lines.insert(0, f"*Changes:* {counts[CREATE]} to create, {counts[UPDATE]} to update, {counts[UNCHANGED]} unchanged")
+    # the alarms that don't fit are counted, keeping room for the "and N more" line
+    listed = counts[CREATE] + counts[UPDATE]
+    length = len(lines[0])
+    for shown, line in enumerate(lines[1:]):
+        if length + 1 + len(line) > SECTION_TEXT_LENGTH - 40:
+            del lines[shown + 1:]
+            break
+        length += 1 + len(line)
+    if listed > len(lines) - 1:
+        lines.append(f"and {listed - (len(lines) - 1)} more")
+    return "\n".join(lines)
+
+
+# Create the alarms of an approved request, each checked metric on each resource ([name, id/arn]),
+# and reply in the approval message thread (channel_id, thread_ts). The alarms that already exist with the same
+# configuration are skipped. Returns the (alarm name, error or None) of each alarm put, None if the alarms
+# couldn't be prepared
+def send_put_metric_alarm_request(resource_type, resources, alerts, channel_id, thread_ts, user_name=None):
+    resources_description = resources[0][0] if len(resources) == 1 else f"{len(resources)} resources"
+    try:
+        groups = target_alarms(resource_type, resources, alerts)
+    except Exception as e:
+        print(e)
+        error_sink.report(user_name, "Received An Error while preparing the CW alarms", e)
+        return None
+
+    # each alarm is put with the CloudWatch client of the target of its resource
+    calls = []
+    call_targets = []
+    unchanged = 0
+    for target, target_group in groups:
+        cloudwatch = aws_clients.target_client('cloudwatch', target)
+        # the puts are retried by alarm_writer only (with jittered backoff), not by botocore as well
+        put_cloudwatch = aws_clients.target_client('cloudwatch', target, max_attempts=0)
+        index = alarm_index_of(target)
+        # describe the alarms of the request again, the index may be older than the approval
+        try:
+            index.refresh(cloudwatch, [alarm['AlarmName'] for alarm in target_group])
+            skipped = {alarm['AlarmName'] for alarm in target_group if index.diff(alarm)[0] == UNCHANGED}
         except Exception as e:
-            print(e)
-            web_client.chat_postMessage(
-                channel='C078BQGN1BP',
-                text=f"*Exception Occurred!*\n{user_name} Received An Error while creating/updating a CW alarm ```{e}```"
-            )
-            return
-    print("Monitoring created successfully")
-    web_client.chat_postMessage(
-        channel='C078BQGN1BP',
-        text=f"`{user_name}`'s Monitoring Creation request for {resource_name} has been created successfully"
-    )
+            # put all the alarms, putting an alarm again doesn't change it
+            traceback.print_exc()
+            error_sink.report(user_name, f"Happened while describing the existing alarms of {target.key}", e)
+            skipped = set()
+        unchanged += len(skipped)
+        for alarm in target_group:
+            if alarm['AlarmName'] not in skipped:
+                calls.append((put_cloudwatch, alarm))
+                call_targets.append(target)
+
+    # a bulk request shows its progress while the alarms are created
+    progress = None
+    if len(resources) > 1 and calls:
+        try:
+            progress = alarms_progress(channel_id, thread_ts, len(calls))
+        except Exception:
+            traceback.print_exc()
+    # create all the alarms in parallel (at most ALARM_CONCURRENCY at a time), a failed alarm doesn't stop the others
+    results = alarm_writer.put_alarms(calls, progress)
+    for target, (_, alarm), (_, error) in zip(call_targets, calls, results):
+        if error is None:
+            alarm_index_of(target).record(alarm)
+    summary = results_summary(results)
+    if unchanged:
+        summary += f"\n{unchanged} alarms already up to date, skipped"
+    print(summary)
+    # Reply in the thread of the approval message with the result of each alarm
+    try:
+        web_client.chat_postMessage(
+            channel=channel_id,
+            thread_ts=thread_ts,
+            text=summary
+        )
+    except Exception:
+        traceback.print_exc()
+    if all(error is None for _, error in results):
+        web_client.chat_postMessage(
+            channel='C078BQGN1BP',
+            text=f"`{user_name}`'s Monitoring Creation request for {resources_description} has been created successfully"
+        )
+    else:
+        failures = "\n".join(f"{name}: {error}" for name, error in results if error is not None)
+        error_sink.report(user_name, f"Received errors while creating/updating CW alarms for {resources_description}",
+                          failures)
+    return results
 
 def reject_request(client: SocketModeClient, req: SocketModeRequest):
     # extract the approver details
     user_id = req.payload['user']['id']
     # Check if the user is an admin
     if user_id in admins:
-        button_hide(client, req, False)
+        request = approval_request_of(req.payload['actions'][0]['value'])
+        # only the first rejection of a pending request is handled
+        if not decide_request(req, request, REJECTED, user_id):
+            return
+        button_hide(client, req, False, request)
         """david its your part"""
 
 
@@ -932,12 +1549,15 @@ def send_reason(client: SocketModeClient, req: SocketModeRequest):
         # Check if the rejection reason is provided
         rejection_reason = req.payload["view"]["state"]["values"]["rejection-reason"]["rejection_reason_action"][
             "value"]
-        # get the resource name
-        resource_name = req.payload["view"]["blocks"][0]["text"]["text"].split("\n")[1].replace("Resource name: ", "")
-        # get the requester id
-        requester_id = req.payload["view"]["blocks"][1]["text"]["text"].replace("Requested by <@", "").replace(">", "")
+        # the rejected request is carried in the private_metadata of the view
+        request = approval_request_of(req.payload["view"]["private_metadata"])
+        resource_name = resources_label(request)
+        requester_id = request["requester_id"]
     except Exception:
         traceback.print_exc()
+        return
+    # the rejection ends the flow
+    flow_store.end(request["flow_id"])
     try:
         # Send a private message to the user who requested the monitoring creation
         web_client.chat_postMessage(
@@ -948,125 +1568,110 @@ def send_reason(client: SocketModeClient, req: SocketModeRequest):
         traceback.print_exc()
 
 
-def create_form_with_error_messages(client: SocketModeClient, req: SocketModeRequest, error_messages=None):
+# The payload of the ack of a wizard view submission, an empty ack (closing the modal) if the page failed
+def view_response(view_handler, req: SocketModeRequest):
     try:
-        # Extract the submitted values from the request payload
-        values = req.payload['view']['state']['values']
+        with handler_seconds.timer(view_handler.__name__):
+            return view_handler(req)
+    except Exception as e:
+        handler_errors.inc(view_handler.__name__)
+        traceback.print_exc()
+        error_sink.report(flow_store.get(flow_id_of(req)).get("user_name"),
+                          f"Happened during `{view_handler.__name__}`", e)
+        return None
+
+
+# Every request is routed by its slash command, callback_id or action_id
+router = Dispatcher(view_response, ack_seconds, claim=dedup.claim)
+router.command("/create_monitoring", new_create_monitoring)
+# drops the cached resources lists
+router.command("/refresh_inventory", refresh_inventory)
+# the next page of the wizard replaces the submitted page in the ack,
+# the error forms opened before the inline errors are submitted like the third page
+router.view_submission("resource_first_page", choose_resource_name_metrics)
+router.view_submission("resource_name_metrics_second_page", alerts_details)
+router.view_submission("alerts_details_third_page", send_to_aprroval)
+router.view_submission("alerts_details_third_page_error", send_to_aprroval)
+# the resource names matching what the user typed
+router.suggestion("resource_name_action", suggestion_response)
+# the resource type was selected on the first page, the resources on the second page
+router.action("resources_options_action", resource_type_selected)
+router.action("resource_name_action", resource_selected)
+# an alert input of the third page changed
+router.view_action("alerts_details_third_page", alert_inputs_changed)
+router.view_action("alerts_details_third_page_error", alert_inputs_changed)
+# the buttons of the approval request, then the reason for the rejection
+router.action("approve_request", approve_request)
+router.action("reject_request", reject_request)
+router.view_submission("rejection_reason", send_reason, ack=False)
+
+
+# The listener of the Socket Mode client, acks every request once and runs its handler
+def request_listener(client: SocketModeClient, req: SocketModeRequest):
+    router.handle(client, req, dispatch)
+
+
+# Serve the metrics on METRICS_HOST:METRICS_PORT, not served when METRICS_PORT is 0
+def serve_metrics():
+    port = int(os.environ.get("METRICS_PORT", 9464))
+    if not port:
+        return None
+    try:
+        return metrics.serve(os.environ.get("METRICS_HOST", "127.0.0.1"), port)
+    except OSError:
+        # the bot works without its metrics, another process may already use the port
+        traceback.print_exc()
+        return None
 
-        # Create the blocks for the form
-        blocks = req.payload['view']['blocks']
 
-        # Concatenate all error messages into a single string
-        error_text = "\n".join(f"*Error:* {error}" for error in error_messages)
+# The module is set up, start() connects
+startup_timer.mark("setup")
 
-        # check if the error messages block already exists
-        for block in blocks:
-            if block["type"] == "section" and block["block_id"] == "error-messages":
-                block["text"]["text"] = error_text
-                break
-        else:
-            # Create a single block with all the error messages
-            blocks.insert(1, {
-                "type": "section",
-                "block_id": "error-messages",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": error_text
-                }
-            })
-        # Iterate over the blocks
-        for block in blocks:
-            # Check if the block is an input block
-            if block["type"] == "input":
-                # Extract the action_id of the input element
-                action_id = block["element"]["action_id"]
-                if block["element"]["type"] == "plain_text_input":
-                    # Replace '-action' with '-input' in the action_id
-                    action_id = action_id.replace('-action', '-input')
-                else:
-                    action_id = action_id.replace('-action', '-dropdown')
-                # Check if the user has submitted a value for this input field
-                if action_id in values:
-                    # Check the type of the element
-                    if block["element"]["type"] == "plain_text_input":
-                        # Set the initial value of the input field to the user's input
-                        block["element"]["initial_value"] = values[action_id][action_id.replace('-input', '-action')][
-                            'value']
-
-                    elif block["element"]["type"] == "static_select":
-                        # Set the initial option of the select field to the user's selection
-                        block["element"]["initial_option"] = \
-                        values[action_id][action_id.replace('-dropdown', '-action')]['selected_option']
 
-    except Exception as e:
-        traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened while creating the form with the error messages : ```{e}```"
-        )
+# Load what the first requests would otherwise wait for, once the Socket Mode connection is up: the pending requests
+# of the journal, the AWS clients (boto3 and the service models) and numpy (the thresholds and the backtest)
+def warm_up():
+    steps = [("journal_replay", replay_journal)] if REPLAY_JOURNAL else []
+    steps.append(("aws_clients", aws_clients.warm_up, aws_services, aws_targets))
+    steps.append(("numpy", importlib.import_module, "thresholds"))
+    for phase, function, *args in steps:
+        try:
+            startup_timer.phase(phase, function, *args)
+        except Exception:
+            traceback.print_exc()
+    print(startup_timer.report())
 
-    # Create the form with the blocks
+
+# Start the bot with the blocking Socket Mode client, see async_main.py for the asyncio runtime
+def start():
     try:
-        # Open the form with the error messages
-        web_client.views_open(
-            trigger_id=req.payload["trigger_id"],
-            view={
-                "type": "modal",
-                "callback_id": "alerts_details_third_page_error",
-                "title": {
-                    "type": "plain_text",
-                    "text": "New Monitoring Creation",
-                    "emoji": True
-                },
-                "submit": {
-                    "type": "plain_text",
-                    "text": "Submit for approval",
-                    "emoji": True
-                },
-                "blocks": blocks
-            }
-        )
-    except Exception as e:
+        # Initialize SocketModeClient with an app-level token + WebClient
+        client = SocketModeClient(
+            # This app-level token will be used only for establishing a connection
+            app_token=os.environ["SLACK_APP_TOKEN"],
+            # You will be using this WebClient for performing Web API calls in listeners
+            web_client=slack_web_client)
+    except Exception:
         traceback.print_exc()
-        web_client.chat_postMessage(
-            channel='C078BQGN1BP',
-            text=f"*Exception Occurred!*\n{user_name} Happened while opening the form with the error messages : ```{e}```"
-        )
-
-
-# Handle view_submission event
-def view_submission_listener(client: SocketModeClient, req: SocketModeRequest):
-    if req.payload.get("type") == "view_submission" and req.payload["view"]["callback_id"] == "resource_first_page":
-        choose_resource_name_metrics(client, req)
-    if req.payload.get("type") == "view_submission" and req.payload["view"][
-        "callback_id"] == "resource_name_metrics_second_page":
-        alerts_details(client, req)
-    if req.payload.get("type") == "view_submission" and (req.payload["view"][
-                                                             "callback_id"] == "alerts_details_third_page" or
-                                                         req.payload["view"][
-                                                             "callback_id"] == "alerts_details_third_page_error"):
-        send_to_aprroval(client, req)
-    # accept the request
-    if req.payload.get("type") == "block_actions" and req.payload["actions"][0]["value"] == "approve":
-        approve_request(client, req)
-    # reject the request
-    if req.payload.get("type") == "block_actions" and req.payload["actions"][0]["value"] == "reject":
-        reject_request(client, req)
-    # provide the reason for the rejection or close the modal
-    if req.payload["view"]["callback_id"] == "rejection_reason" and req.payload.get("type") == "view_submission":
-        send_reason(client, req)
-
-    # response for slack
-    response = SocketModeResponse(envelope_id=req.envelope_id)
-    client.send_socket_mode_response(response)
-
-
-# Add the listener for opening the modal
-client.socket_mode_request_listeners.append(pathe_to_process)
-# Add the listener for handling the form submission
-client.socket_mode_request_listeners.append(view_submission_listener)
-
-# Establish a WebSocket connection to the Socket Mode servers
-client.connect()
-# Keep the program running
-Event().wait()
+        return
+
+    serve_metrics()
+    web_client.start()
+    worker_pool.start()
+    error_sink.start()
+    if recorder:
+        client.socket_mode_request_listeners.append(record_listener)
+    client.socket_mode_request_listeners.append(request_listener)
+    startup_timer.mark("start")
+
+    # Establish a WebSocket connection to the Socket Mode servers first, the requests received during the warm-up
+    # create the clients they need
+    client.connect()
+    startup_timer.connected()
+    Thread(target=warm_up, name="warm-up", daemon=True).start()
+    # Keep the program running
+    Event().wait()
+
+
+if __name__ == "__main__":
+    start()
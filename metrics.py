@@ -0,0 +1,207 @@
+import threading
+import time
+import traceback
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# The buckets of the latency histograms, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# A count for each combination of label values, only goes up
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # label values: count
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name, tuple(zip(self.labels, label_values)), value) for label_values, value in values.items()]
+
+
+# The distribution of a duration (or any value) for each combination of label values, in cumulative buckets
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values: [count of each bucket (not cumulative)..., count above the last bucket, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    # Observe the seconds spent in the with block, even when it raises
+    @contextmanager
+    def timer(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    # Estimate the q quantile (0 to 1) of the values observed with label_values from the buckets, interpolating
+    # within the bucket like Prometheus' histogram_quantile. None before any observation
+    def quantile(self, q, *label_values):
+        with self.lock:
+            counts = list(self.values.get(label_values, []))
+        total = sum(counts[:-1])
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0
+        for bound, count in zip(self.buckets, counts):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        # above the last bucket
+        return self.buckets[-1]
+
+    # The combinations of label values observed so far
+    def label_values(self):
+        with self.lock:
+            return list(self.values)
+
+    def samples(self):
+        with self.lock:
+            values = {label_values: list(counts) for label_values, counts in self.values.items()}
+        samples = []
+        for label_values, counts in values.items():
+            labels = tuple(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", labels + (("le", _number(bound)),), cumulative))
+            cumulative += counts[len(self.buckets)]
+            samples.append((self.name + "_bucket", labels + (("le", "+Inf"),), cumulative))
+            samples.append((self.name + "_sum", labels, counts[-1]))
+            samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+# A value read when the metrics are scraped: value() returns a number, or {label values: number} with labels.
+# The counts kept by the other objects (the calls sent by the outbound queue...) are exposed the same way
+# with kind "counter"
+class Gauge:
+    def __init__(self, name, help, value, labels=(), kind="gauge"):
+        self.name = name
+        self.help = help
+        self.value = value
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        value = self.value()
+        if not self.labels:
+            return [(self.name, (), value)]
+        return [(self.name, tuple(zip(self.labels, label_values if isinstance(label_values, tuple) else
+                                      (label_values,))), item) for label_values, item in value.items()]
+
+
+# The metrics of the process, rendered in the Prometheus text format and served on /metrics
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, value, labels=(), kind="gauge"):
+        return self._add(Gauge(name, help, value, labels, kind))
+
+    def _add(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            # a gauge that can't be read (its store is down...) is left out, the other metrics are still served
+            try:
+                samples = [(_sample_name(name, labels), _number(value)) for name, labels, value in metric.samples()]
+            except Exception:
+                traceback.print_exc()
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in samples)
+        return "\n".join(lines) + "\n"
+
+    # Serve the metrics on http://host:port/metrics from a background thread, returns the server
+    def serve(self, host, port):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # the scrapes aren't printed
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+def _sample_name(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{label}="{_escape(value)}"' for label, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(int(value))
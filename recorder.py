@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from approval_payload import VERSION
+
+# The user ids (U... or W...) anywhere in the payload, in the mentions of a text and in the approval buttons too
+USER_ID = re.compile(r"\b[UW][A-Z0-9]{8,}\b")
+# The keys whose value is a secret, replaced as a whole
+SECRET_KEYS = {"token", "app_token", "bot_token", "response_url"}
+# The keys holding the name of a user, in the payload or in its "user" object
+USER_NAME_KEYS = {"user_name"}
+USER_OBJECT_NAME_KEYS = {"name", "username", "real_name"}
+REDACTED = "[redacted]"
+
+
+# Writes the Socket Mode envelopes received by the bot to a JSONL file (gzip compressed when the path ends with .gz),
+# one compact line per envelope: {"at": seconds since the recording started, "type", "envelope_id", "payload"}.
+# The secrets are dropped and the user ids and names are replaced by pseudonyms, the same user always gets the same
+# pseudonym within a recording (keyed by a random salt that isn't written, so they can't be reversed).
+# The admins get UADMIN<index> so benchmarks/replay.py can give their approvals back to the admins of the tree
+class EnvelopeRecorder:
+    def __init__(self, path, admins):
+        self.file = gzip.open(path, "at", encoding="utf-8") if path.endswith(".gz") else open(path, "a",
+                                                                                              encoding="utf-8")
+        self.admins = list(admins)
+        self.salt = os.urandom(16)
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, req):
+        line = json.dumps({
+            "at": round(time.monotonic() - self.started, 3),
+            "type": req.type,
+            "envelope_id": req.envelope_id,
+            "payload": self.redact(req.payload)
+        }, separators=(",", ":"), ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def redact(self, value, parent=None):
+        if isinstance(value, dict):
+            redacted = {}
+            for key, item in value.items():
+                if key in SECRET_KEYS:
+                    redacted[key] = REDACTED
+                elif isinstance(item, str) and (key in USER_NAME_KEYS or
+                                                (parent == "user" and key in USER_OBJECT_NAME_KEYS)):
+                    redacted[key] = self.user_name(item)
+                else:
+                    redacted[key] = self.redact(item, key)
+            return redacted
+        if isinstance(value, list):
+            return [self.redact(item, parent) for item in value]
+        if isinstance(value, str):
+            return self._redact_string(value)
+        return value
+
+    def user_id(self, user_id):
+        if user_id in self.admins:
+            return f"UADMIN{self.admins.index(user_id):04d}"
+        return "U" + self._digest(user_id)[:10].upper()
+
+    def user_name(self, user_name):
+        return "user-" + self._digest(user_name)[:8]
+
+    def _digest(self, value):
+        return hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()
+
+    def _redact_string(self, value):
+        # the approval buttons (and the rejection view) carry the request with the requester name
+        if value.startswith("["):
+            try:
+                data = json.loads(value)
+            except ValueError:
+                data = None
+            if isinstance(data, list) and len(data) > 3 and data[0] == VERSION:
+                data[3] = self.user_name(data[3])
+                value = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        return USER_ID.sub(lambda match: self.user_id(match.group()), value)
+
+
+# The envelopes of a recording, in the order they were received
+def read_recording(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
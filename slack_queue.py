@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+from concurrent.futures import Future
+from slack_sdk.errors import SlackApiError
+
+# The priority lanes, lower is sent first
+MODAL = 0
+MESSAGE = 1
+BACKGROUND = 2
+
+# Slack rate limit tiers: (requests per minute, burst), chat.postMessage is limited per channel
+# to about one message per second. See https://api.slack.com/docs/rate-limits
+TIERS = {
+    1: (1, 1),
+    2: (20, 3),
+    3: (50, 5),
+    4: (100, 10),
+    "post": (60, 5)
+}
+METHOD_TIERS = {
+    "chat_postMessage": "post",
+    "chat_postEphemeral": 4,
+    "chat_update": 3,
+    "views_open": 4,
+    "views_update": 4,
+    "views_push": 4
+}
+# The tier of the methods that aren't listed above
+DEFAULT_TIER = 3
+
+
+# Allows rate requests per second on average and up to burst requests at once
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    # Take a token and return 0, or return the seconds to wait before a token is available
+    def take(self):
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    # Slack answered 429, stop sending until the Retry-After delay is over
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+# Sends the Web API calls of the bot from a few sender threads, in priority order (modal operations first,
+# then messages, then the log channel) and within the rate limit of each method. A call over the limit
+# (or answered with 429) waits in a delayed heap until it can be sent, without holding a sender thread.
+# The calls on the same view, message or channel are sent in the order they were queued, retries included:
+# a call is only handed to the senders once the previous call on its target is done.
+# on_call(method, waited, seconds, error) is called after each call sent to Slack, with the seconds since it was
+# queued, the seconds Slack took to answer and the error (None, the Slack error or the exception name)
+class OutboundQueue:
+    def __init__(self, web_client, senders, background_channels, max_rate_limited_retries=5, on_call=None):
+        self.web_client = web_client
+        self.on_call = on_call
+        self.senders = senders
+        self.background_channels = set(background_channels)
+        self.max_rate_limited_retries = max_rate_limited_retries
+        # (priority, sequence, call), a delayed call keeps its sequence to stay in order within its lane
+        self.ready = queue.PriorityQueue()
+        # (send time, sequence, priority, call)
+        self.delayed = []
+        self.delayed_changed = threading.Condition()
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.sequence = itertools.count()
+        # target: the calls on the target not done yet, the first one is in the ready queue or the delayed heap
+        self.targets = {}
+        self.targets_lock = threading.Lock()
+        # the counters are updated by the sender threads
+        self.counters_lock = threading.Lock()
+        self.sent = {}
+        self.rate_limited = 0
+
+    def start(self):
+        for i in range(self.senders):
+            threading.Thread(target=self._send_loop, name=f"slack-sender-{i}", daemon=True).start()
+        threading.Thread(target=self._delayed_loop, name="slack-delayed", daemon=True).start()
+        return self
+
+    # Queue a Web API call and return a Future of its response
+    def submit(self, method, priority, **kwargs):
+        future = Future()
+        call = {"method": method, "kwargs": kwargs, "future": future, "retries": 0, "queued": time.monotonic(),
+                "priority": priority, "sequence": next(self.sequence), "target": _target(method, kwargs)}
+        if call["target"] is not None:
+            with self.targets_lock:
+                calls = self.targets.setdefault(call["target"], [])
+                calls.append(call)
+                if len(calls) > 1:
+                    # sent once the calls queued before it on the same target are done
+                    return future
+        self.ready.put((priority, call["sequence"], call))
+        return future
+
+    # The handlers keep calling web_client.<method>(...) and get the response back, except for the messages to
+    # the background channels which are sent without waiting
+    def __getattr__(self, method):
+        def call(**kwargs):
+            priority = self._priority(method, kwargs)
+            future = self.submit(method, priority, **kwargs)
+            if priority == BACKGROUND:
+                future.add_done_callback(_print_background_error)
+                return None
+            return future.result()
+
+        return call
+
+    def stats(self):
+        with self.delayed_changed:
+            delayed = len(self.delayed)
+        with self.counters_lock:
+            return {
+                "ready": self.ready.qsize(),
+                "delayed": delayed,
+                "rate_limited": self.rate_limited,
+                "sent": dict(self.sent)
+            }
+
+    def _priority(self, method, kwargs):
+        if method.startswith("views_"):
+            return MODAL
+        if kwargs.get("channel") in self.background_channels:
+            return BACKGROUND
+        return MESSAGE
+
+    def _bucket(self, call):
+        method = call["method"]
+        tier = METHOD_TIERS.get(method, DEFAULT_TIER)
+        key = (method, call["kwargs"].get("channel")) if tier == "post" else method
+        with self.buckets_lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                per_minute, burst = TIERS[tier]
+                bucket = self.buckets[key] = TokenBucket(per_minute / 60, burst)
+            return bucket
+
+    def _delay(self, priority, sequence, call, seconds):
+        with self.delayed_changed:
+            heapq.heappush(self.delayed, (time.monotonic() + seconds, sequence, priority, call))
+            self.delayed_changed.notify()
+
+    def _send_loop(self):
+        while True:
+            priority, sequence, call = self.ready.get()
+            bucket = self._bucket(call)
+            with self.buckets_lock:
+                wait = bucket.take()
+            if wait > 0:
+                self._delay(priority, sequence, call, wait)
+                continue
+            started = time.monotonic()
+            try:
+                response = getattr(self.web_client, call["method"])(**call["kwargs"])
+            except SlackApiError as e:
+                self._observe(call, started, e.response.get("error") or str(e.response.status_code))
+                if e.response.status_code == 429 and call["retries"] < self.max_rate_limited_retries:
+                    retry_after = _retry_after(e.response.headers)
+                    with self.counters_lock:
+                        self.rate_limited += 1
+                    call["retries"] += 1
+                    with self.buckets_lock:
+                        bucket.pause(retry_after)
+                    # still the first call of its target, the next ones wait for its retry
+                    self._delay(priority, sequence, call, retry_after)
+                else:
+                    self._done(call)
+                    call["future"].set_exception(e)
+                continue
+            except Exception as e:
+                self._observe(call, started, type(e).__name__)
+                self._done(call)
+                call["future"].set_exception(e)
+                continue
+            self._observe(call, started, None)
+            with self.counters_lock:
+                self.sent[call["method"]] = self.sent.get(call["method"], 0) + 1
+            self._done(call)
+            call["future"].set_result(response)
+
+    # The call got its response (or failed for good), the next call on its target can be sent
+    def _done(self, call):
+        if call["target"] is None:
+            return
+        with self.targets_lock:
+            calls = self.targets[call["target"]]
+            calls.pop(0)
+            if not calls:
+                del self.targets[call["target"]]
+                return
+            following = calls[0]
+        self.ready.put((following["priority"], following["sequence"], following))
+
+    def _observe(self, call, started, error):
+        if self.on_call:
+            now = time.monotonic()
+            self.on_call(call["method"], started - call["queued"], now - started, error)
+
+    # Move the delayed calls back to their lane when their time comes
+    def _delayed_loop(self):
+        while True:
+            with self.delayed_changed:
+                while not self.delayed or self.delayed[0][0] > time.monotonic():
+                    timeout = self.delayed[0][0] - time.monotonic() if self.delayed else None
+                    self.delayed_changed.wait(timeout)
+                _, sequence, priority, call = heapq.heappop(self.delayed)
+            self.ready.put((priority, sequence, call))
+
+
+# The view, message or channel a call changes, the calls on the same target are sent in order.
+# None for the calls that can be sent in any order
+def _target(method, kwargs):
+    if method in ("views_update", "views_push"):
+        return ("view", kwargs.get("view_id") or kwargs.get("external_id") or kwargs.get("trigger_id"))
+    if method in ("chat_update", "chat_delete"):
+        return ("message", kwargs.get("channel"), kwargs.get("ts"))
+    if method in ("chat_postMessage", "chat_postEphemeral"):
+        return ("channel", kwargs.get("channel"))
+    return None
+
+
+def _print_background_error(future):
+    if future.exception() is not None:
+        traceback.print_exception(future.exception())
+
+
+# The Retry-After header of a 429 response, in seconds
+def _retry_after(headers):
+    for name, value in headers.items():
+        if name.lower() == "retry-after":
+            return int(value[0] if isinstance(value, list) else value)
+    return 1
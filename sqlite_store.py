@@ -0,0 +1,33 @@
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+
+# One SQLite connection per thread to the same file, in WAL mode so readers don't wait for the writer
+# (and several processes can use the file at once). The connections are in autocommit mode
+class SQLiteConnections:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def get(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    # Run the statements of the with block in one transaction
+    @contextmanager
+    def transaction(self):
+        connection = self.get()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,55 @@
+import threading
+import time
+
+# Imported first by main.py (and async_main.py), the imports of the bot are measured from here
+STARTED = time.perf_counter()
+
+
+# The seconds of each startup phase, in the order they ended. The phases on the way to the Socket Mode connection
+# follow each other (mark), the warm-up phases run in the background after it and are timed on their own (phase)
+class StartupTimer:
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.last = started
+        # phase: seconds
+        self.phases = {}
+        # seconds from the first import to the Socket Mode connection
+        self.ready = None
+        self.lock = threading.Lock()
+
+    # End the phase that started when the previous one ended
+    def mark(self, phase):
+        now = time.perf_counter()
+        with self.lock:
+            self.phases[phase] = now - self.last
+            self.last = now
+
+    # The Socket Mode connection is up, the bot answers from now on
+    def connected(self):
+        self.mark("connect")
+        with self.lock:
+            self.ready = self.last - self.started
+
+    # Time function() as a phase of its own, the warm-up phases overlap the others
+    def phase(self, phase, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            with self.lock:
+                self.phases[phase] = time.perf_counter() - started
+
+    def seconds(self):
+        with self.lock:
+            return dict(self.phases)
+
+    # e.g. "Startup: ready in 420ms (imports 180ms, setup 30ms, connect 210ms), warm-up: aws_clients 350ms"
+    def report(self, foreground=("imports", "setup", "start", "connect")):
+        phases = self.seconds()
+        ready = f"ready in {self.ready * 1000:.0f}ms" if self.ready is not None else "not connected"
+        text = f"Startup: {ready} (" + ", ".join(f"{phase} {phases[phase] * 1000:.0f}ms" for phase in foreground
+                                                 if phase in phases) + ")"
+        background = [phase for phase in phases if phase not in foreground]
+        if background:
+            text += ", warm-up: " + ", ".join(f"{phase} {phases[phase] * 1000:.0f}ms" for phase in background)
+        return text
@@ -0,0 +1,119 @@
+# Runs WORKER_PROCESSES bot processes, each with its own Socket Mode connection: Slack spreads the envelopes of the app
+# across its open connections, so every core takes a share of the requests. The flows are kept in the SQLite flow
+# store, the approvals in the journal, the handled envelope ids in the dedup store and the metric statistics of the
+# suggested thresholds in their own SQLite file, all shared by the workers, so any worker can handle the next page of
+# a flow and a worker that crashes is restarted without losing the flows in progress.
+# Run with: python supervisor.py [async_main.py | a bot script and its arguments], main.py by default
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Slack accepts up to 10 Socket Mode connections per app
+MAX_CONNECTIONS = 10
+# A worker that ran for STABLE_SECONDS is restarted after RESTART_DELAY seconds, a worker crashing sooner waits
+# twice as long as the previous time, up to MAX_RESTART_DELAY
+STABLE_SECONDS = 60
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# Seconds the workers get to exit after SIGTERM before they are killed
+STOP_TIMEOUT = 10
+
+
+# A bot process and its restarts
+class Worker:
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.process = None
+        self.started_at = None
+        self.starts = 0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = None
+
+    # Each worker serves its metrics on its own port and records its own envelopes. The journal is replayed once,
+    # by the first start of the first worker: a restarted worker would report the alarms being created by the
+    # others as interrupted
+    def environment(self):
+        environment = dict(os.environ, FLOW_STATE_BACKEND="sqlite", WORKER_INDEX=str(self.index),
+                           REPLAY_JOURNAL="1" if self.index == 0 and self.starts == 0 else "0")
+        port = int(os.environ.get("METRICS_PORT", 9464))
+        if port:
+            environment["METRICS_PORT"] = str(port + self.index)
+        if os.environ.get("RECORD_PATH"):
+            directory, name = os.path.split(os.environ["RECORD_PATH"])
+            environment["RECORD_PATH"] = os.path.join(directory, f"worker{self.index}-{name}")
+        return environment
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, env=self.environment())
+        self.started_at = time.monotonic()
+        self.starts += 1
+        self.restart_at = None
+        print(f"worker {self.index} started (pid {self.process.pid})")
+
+    # Restart the worker once it exited and its restart delay passed
+    def check(self):
+        now = time.monotonic()
+        if self.restart_at is not None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        code = self.process.poll()
+        if code is None:
+            return
+        if now - self.started_at >= STABLE_SECONDS:
+            self.restart_delay = RESTART_DELAY
+        self.restart_at = now + self.restart_delay
+        print(f"worker {self.index} exited with code {code}, restarting in {self.restart_delay}s")
+        self.restart_delay = min(self.restart_delay * 2, MAX_RESTART_DELAY)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+
+    def wait(self, deadline):
+        try:
+            self.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def supervise(command, count):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    workers = [Worker(index, command) for index in range(count)]
+    for worker in workers:
+        worker.start()
+    while not stopping:
+        time.sleep(0.5)
+        for worker in workers:
+            worker.check()
+    for worker in workers:
+        if worker.process is not None:
+            worker.stop()
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for worker in workers:
+        if worker.process is not None:
+            worker.wait(deadline)
+
+
+def main():
+    # the .env file of the bot configures the supervisor too
+    load_dotenv()
+    count = int(os.environ.get("WORKER_PROCESSES", min(os.cpu_count() or 1, MAX_CONNECTIONS)))
+    if count > MAX_CONNECTIONS:
+        print(f"Slack accepts {MAX_CONNECTIONS} Socket Mode connections per app, running {MAX_CONNECTIONS} workers")
+        count = MAX_CONNECTIONS
+    command = [sys.executable] + (sys.argv[1:] or [os.path.join(ROOT, "main.py")])
+    supervise(command, count)
+
+
+if __name__ == "__main__":
+    main()
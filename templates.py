@@ -0,0 +1,288 @@
+from variables import resources, alert_vairables
+
+# The blocks of the modal pages are built once from variables.py when the bot starts.
+# The pages of a request are new lists made of these shared blocks, so the blocks must never be modified,
+# copy a block before changing it for a single request
+
+
+# The first page - the resource type dropdown
+def _build_first_page():
+    # Get all the available resources from the variables.py file
+    resources_options = [{"text": {"type": "plain_text", "text": key}, "value": key} for key in resources.keys()]
+    # creating the block for the dropdown
+    return (
+        {
+            "type": "input",
+            "block_id": "resources-dropdown",
+            "dispatch_action": True,
+            "element": {
+                "type": "static_select",
+                "placeholder": {
+                    "type": "plain_text",
+                    "text": "Select a resource type to monitor"
+                },
+                "options": resources_options,
+                "action_id": "resources_options_action"
+            },
+            "label": {
+                "type": "plain_text",
+                "text": "Select the resource type to monitor"
+            }
+        },
+        # bulk mode - several resources of the type in the same request
+        {
+            "type": "input",
+            "block_id": "bulk-mode",
+            "optional": True,
+            "element": {
+                "type": "checkboxes",
+                "action_id": "bulk_mode_action",
+                "options": [{"text": {"type": "plain_text", "text": "Monitor several resources of this type"},
+                             "value": "bulk"}]
+            },
+            "label": {
+                "type": "plain_text",
+                "text": "Bulk mode"
+            }
+        },
+    )
+
+
+# The second page of a resource type - the resource name dropdown and the metrics checkboxes,
+# in bulk mode several resource names can be selected
+def _build_second_page(resource_type, bulk=False):
+    if bulk:
+        resource_select = {
+            "type": "multi_external_select",
+            "placeholder": {
+                "type": "plain_text",
+                "text": f"Search {resource_type} names"
+            },
+            "min_query_length": 0,
+            "action_id": "resource_name_action"
+        }
+    else:
+        resource_select = {
+            "type": "external_select",
+            "placeholder": {
+                "type": "plain_text",
+                "text": f"Search a {resource_type} name"
+            },
+            "min_query_length": 0,
+            "action_id": "resource_name_action"
+        }
+    return (
+        # first block for choosing resource name
+        {
+            "type": "input",
+            "block_id": "resource-name-dropdown",
+            "dispatch_action": True,
+            "element": resource_select,
+            "label": {
+                "type": "plain_text",
+                "text": f"Select the {resource_type} names" if bulk else f"Select the {resource_type} name"
+            }
+        },
+        # second block for choosing the metrics
+        {
+            "type": "input",
+            "block_id": "metrics",
+            "label": {
+                "type": "plain_text",
+                "text": f"Select the metrics to monitor for {resource_type}"
+            },
+            "element": {
+                "type": "checkboxes",
+                "action_id": "metrics_action",
+                "options": [{"text": {"type": "plain_text", "text": description}, "value": metric}
+                            for metric_dict in resources[resource_type]
+                            for metric, description in metric_dict.items()]
+            }
+        }
+    )
+
+
+# The smallest value of each number input of the third page
+MINIMUMS = {
+    'threshold': 0,
+    'period (in seconds)': 1,
+    'evaluation period': 1,
+    'datapoints to alarm from the evaluation period': 1
+}
+
+
+# The block id of the input of an alert variable, the errors of the third page are keyed by it
+def input_block_id(metric, variable):
+    if type(alert_vairables[variable]) == list:
+        return f"{metric}-{variable}-dropdown"
+    return f"{metric}-{variable}-input"
+
+
+# The blocks of one metric on the third page - an input for each alert variable.
+# Every input dispatches its changes, so the inputs are checked as the user fills them
+def _build_alert(metric):
+    blocks = [
+        {
+            "type": "divider"
+        },
+        {
+            "type": "section",
+            "block_id": f"{metric}-alert",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"• Details for {metric} alert"
+            }
+        }
+    ]
+    # for each alert variable create an input block for the user to enter the alert details/parameters
+    for variable, value in alert_vairables.items():
+        # if the value is a list create a dropdown
+        if type(value) == list:
+            blocks.append({
+                "type": "input",
+                "block_id": input_block_id(metric, variable),
+                "dispatch_action": True,
+                "element": {
+                    "type": "static_select",
+                    "placeholder": {
+                        "type": "plain_text",
+                        "text": f"Select the {variable}"
+                    },
+                    "options": [{"text": {"type": "plain_text", "text": option}, "value": option} for option in
+                                value],
+                    "action_id": f"{metric}-{variable}-action"
+                },
+                "label": {
+                    "type": "plain_text",
+                    "text": f"Select the {variable}"
+                }
+            })
+        # if the value is a number create a number input, slack checks the integer and the minimum itself
+        else:
+            blocks.append({
+                "type": "input",
+                "block_id": input_block_id(metric, variable),
+                "dispatch_action": True,
+                "element": {
+                    "type": "number_input",
+                    "is_decimal_allowed": False,
+                    "min_value": str(MINIMUMS.get(variable, 0)),
+                    "dispatch_action_config": {
+                        "trigger_actions_on": ["on_character_entered"]
+                    },
+                    "action_id": f"{metric}-{variable}-action"
+                },
+                "label": {
+                    "type": "plain_text",
+                    "text": f"Enter the {variable}"
+                }
+            })
+    return tuple(blocks)
+
+
+FIRST_PAGE = _build_first_page()
+# resource type: blocks of the second page
+SECOND_PAGES = {resource_type: _build_second_page(resource_type) for resource_type in resources}
+BULK_SECOND_PAGES = {resource_type: _build_second_page(resource_type, bulk=True) for resource_type in resources}
+# metric name: blocks of the metric on the third page, a metric of several resource types has the same blocks
+ALERTS = {metric: _build_alert(metric)
+          for metrics in resources.values() for metric_dict in metrics for metric in metric_dict}
+
+
+def first_page_blocks():
+    return list(FIRST_PAGE)
+
+
+def second_page_blocks(resource_type):
+    return list(SECOND_PAGES[resource_type])
+
+
+# The bulk mode second page, at most max_resources resource names can be selected
+def bulk_second_page_blocks(resource_type, max_resources):
+    blocks = list(BULK_SECOND_PAGES[resource_type])
+    # the dropdown block is shared, copy it before setting the limit
+    dropdown = dict(blocks[0])
+    dropdown["element"] = dict(dropdown["element"], max_selected_items=max_resources)
+    blocks[0] = dropdown
+    return blocks
+
+
+# The number of resource names listed in the details of a bulk request, the others are counted
+LISTED_RESOURCES = 20
+
+
+# The mrkdwn details of the chosen resources, resources is a list of [name, id/arn]
+def resources_text(resources):
+    if len(resources) == 1:
+        resource_name, resource_arn_or_id = resources[0]
+        return f"*Resource details:* \nResource name: `{resource_name}`\nResource id/arn: `{resource_arn_or_id}`"
+    lines = [f"*Resources ({len(resources)}):*"]
+    lines.extend(f"• `{resource_name}`" for resource_name, _ in resources[:LISTED_RESOURCES])
+    if len(resources) > LISTED_RESOURCES:
+        lines.append(f"and {len(resources) - LISTED_RESOURCES} more")
+    return "\n".join(lines)
+
+
+# The third page - the chosen resources and the alert inputs of each checked metric.
+# suggestions is the suggested threshold of the metrics that have one, the alarm condition it goes with and the text
+# telling where it comes from, {metric: (threshold, alarm condition, text)}. The threshold input and the alarm
+# condition dropdown of these metrics start with the suggestion
+def alerts_details_blocks(resources, metrics, suggestions=None):
+    blocks = [{
+        "type": "section",
+        "block_id": "resource-name",
+        "text": {
+            "type": "mrkdwn",
+            "text": resources_text(resources)
+        }
+    }]
+    for metric in metrics:
+        if not suggestions or metric not in suggestions:
+            blocks.extend(ALERTS[metric])
+            continue
+        threshold, condition, text = suggestions[metric]
+        for block in ALERTS[metric]:
+            if block.get("block_id") == input_block_id(metric, 'alarm condition'):
+                # the suggested threshold is an upper or a lower bound, the condition goes with it
+                option = {"text": {"type": "plain_text", "text": condition}, "value": condition}
+                blocks.append(dict(block, element=dict(block["element"], initial_option=option)))
+            elif block.get("block_id") == input_block_id(metric, 'threshold'):
+                # the threshold block is shared, copy it before setting its initial value
+                block = dict(block, element=dict(block["element"], initial_value=str(threshold)))
+                blocks.append(block)
+                blocks.append({
+                    "type": "context",
+                    "block_id": f"{metric}-threshold-suggestion",
+                    "elements": [
+                        {
+                            "type": "mrkdwn",
+                            "text": text
+                        }
+                    ]
+                })
+            else:
+                blocks.append(block)
+    return blocks
+
+
+# The blocks of a submitted third page (blocks of the view payload) with a warning under each input of errors,
+# errors is the error message of each invalid input keyed by its block id
+def field_error_blocks(blocks, errors):
+    shown = []
+    for block in blocks:
+        # the warnings of the previous check are replaced
+        if block.get("block_id", "").endswith("-error"):
+            continue
+        shown.append(block)
+        if block.get("block_id") in errors:
+            shown.append({
+                "type": "context",
+                "block_id": f"{block['block_id']}-error",
+                "elements": [
+                    {
+                        "type": "mrkdwn",
+                        "text": f":warning: {errors[block['block_id']]}"
+                    }
+                ]
+            })
+    return shown
@@ -0,0 +1,41 @@
+import json
+import time
+
+from sqlite_store import SQLiteConnections
+
+
+# The metric statistics of the suggested thresholds of each resource, in a SQLite (WAL) file shared by all the bot
+# processes on the host: the process that pulled them isn't always the one that builds the third page.
+# The statistics older than ttl seconds are forgotten
+class ThresholdStatisticsStore:
+    # expired statistics are deleted once every purge_every writes
+    purge_every = 100
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.connections = SQLiteConnections(path)
+        self.writes = 0
+        self.connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS threshold_statistics "
+            "(resource_type TEXT NOT NULL, resource TEXT NOT NULL, statistics TEXT NOT NULL, pulled_at REAL NOT NULL, "
+            "PRIMARY KEY (resource_type, resource))"
+        )
+
+    # The statistics of a resource (its option value) by metric, None if they weren't pulled or expired
+    def get(self, resource_type, resource):
+        row = self.connections.get().execute(
+            "SELECT statistics FROM threshold_statistics WHERE resource_type = ? AND resource = ? AND pulled_at > ?",
+            (resource_type, resource, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, resource_type, resource, statistics):
+        connection = self.connections.get()
+        connection.execute(
+            "INSERT OR REPLACE INTO threshold_statistics (resource_type, resource, statistics, pulled_at) "
+            "VALUES (?, ?, ?, ?)",
+            (resource_type, resource, json.dumps(statistics), time.time())
+        )
+        self.writes += 1
+        if self.writes % self.purge_every == 0:
+            connection.execute("DELETE FROM threshold_statistics WHERE pulled_at <= ?", (time.time() - self.ttl,))
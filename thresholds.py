@@ -0,0 +1,70 @@
+import datetime
+import math
+
+import numpy as np
+
+from backtest import metric_data
+
+# The period and statistic of the metric data the thresholds are suggested from
+PERIOD = 300
+STATISTIC = 'Average'
+# The metrics that are a problem when they are low, their alarms get a lower bound threshold
+LOWER_BOUND_METRICS = {'FreeStorageSpace', 'FreeableMemory', 'HealthyHostCount'}
+# The statistics of a lower bound, combined with their lowest value
+LOWER_STATISTICS = {'p1', 'p5', 'mean_minus_sigma', 'quietest_hour'}
+
+
+# The statistics of one metric the threshold is suggested from: the 95th and 99th percentiles, the mean plus
+# sigmas standard deviations, and the same for the busiest hour of the day (the hour with the highest mean plus
+# sigmas standard deviations), so a metric that is high every day at the same hour isn't taken for noise.
+# The 1st and 5th percentiles, the mean minus sigmas standard deviations and the quietest hour are their
+# counterparts for a lower bound. timestamps are epoch seconds. Returns None without datapoints
+def threshold_statistics(timestamps, values, sigmas):
+    if not len(values):
+        return None
+    p1, p5, p95, p99 = np.percentile(values, [1, 5, 95, 99])
+    hours = ((timestamps // 3600) % 24).astype(np.int64)
+    counts = np.bincount(hours, minlength=24)
+    sums = np.bincount(hours, weights=values, minlength=24)
+    squares = np.bincount(hours, weights=values * values, minlength=24)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hourly_mean = sums / counts
+        hourly_std = np.sqrt(np.maximum(squares / counts - hourly_mean * hourly_mean, 0))
+    return {
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean_sigma": float(values.mean() + sigmas * values.std()),
+        "busiest_hour": float(np.nanmax(hourly_mean + sigmas * hourly_std)),
+        "p1": float(p1),
+        "p5": float(p5),
+        "mean_minus_sigma": float(values.mean() - sigmas * values.std()),
+        "quietest_hour": float(np.nanmin(hourly_mean - sigmas * hourly_std)),
+        "datapoints": int(len(values))
+    }
+
+
+# The suggested threshold of an alarm, rounded to an integer for the number input of the third page.
+# An upper bound is above the 99th percentile and above the busiest hour, a lower bound is below the 1st percentile
+# and below the quietest hour
+def suggested_threshold(statistics, lower=False):
+    if lower:
+        return max(0, math.floor(min(statistics["p1"], statistics["quietest_hour"])))
+    return max(0, math.ceil(max(statistics["p99"], statistics["busiest_hour"])))
+
+
+# The statistics of several resources of a bulk request combined, the highest of each upper bound statistic and
+# the lowest of each lower bound one
+def combined_statistics(statistics):
+    return {name: (min if name in LOWER_STATISTICS else max)(item[name] for item in statistics)
+            for name in statistics[0]}
+
+
+# The threshold statistics of each metric of a resource (metrics is {metric: dimensions}) over the last days,
+# all the metrics are pulled in one batch. Returns {metric: statistics or None}
+def metric_statistics(cloudwatch, namespace, metrics, days, sigmas):
+    end = datetime.datetime.now(datetime.timezone.utc)
+    queries = [{"Namespace": namespace, "MetricName": metric, "Dimensions": dimensions, "Period": PERIOD,
+                "Statistic": STATISTIC} for metric, dimensions in metrics.items()]
+    data = metric_data(cloudwatch, queries, end - datetime.timedelta(days=days), end)
+    return {metric: threshold_statistics(timestamps, values, sigmas)
+            for metric, (timestamps, values) in zip(metrics, data)}
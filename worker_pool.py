@@ -0,0 +1,42 @@
+import queue
+import threading
+import traceback
+
+
+# A fixed number of worker threads that take handler calls from a bounded queue.
+# The Socket Mode listeners ack first and hand the slow work (AWS and Slack calls) to the pool,
+# so the ack latency doesn't depend on how long the work takes
+class WorkerPool:
+    def __init__(self, size, queue_depth):
+        self.size = size
+        self.tasks = queue.Queue(maxsize=queue_depth)
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self._work, name=f"worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    # Queue a call to func(*args), returns False if the queue is full
+    def submit(self, func, *args):
+        try:
+            self.tasks.put_nowait((func, args))
+        except queue.Full:
+            return False
+        return True
+
+    # The number of calls waiting for a free worker
+    def depth(self):
+        return self.tasks.qsize()
+
+    def _work(self):
+        while True:
+            func, args = self.tasks.get()
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.tasks.task_done()